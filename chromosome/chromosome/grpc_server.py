@@ -30,6 +30,25 @@ class Chromosome(chromosome_pb2_grpc.ChromosomeServicer):
 
         return exceptionCallback
 
+    # makes a track message, dictionary encoding its families if requested
+    def _trackMessage(self, track, dictionary_encode_families):
+        if not dictionary_encode_families:
+            return track_pb2.Track(
+                genus=track["genus"],
+                species=track["species"],
+                genes=track["genes"],
+                families=track["families"],
+            )
+        dictionary = {}
+        indexes = [dictionary.setdefault(f, len(dictionary)) for f in track["families"]]
+        return track_pb2.Track(
+            genus=track["genus"],
+            species=track["species"],
+            genes=track["genes"],
+            familyDictionary=list(dictionary),
+            familyIndexes=indexes,
+        )
+
     # the method that actually handles requests
     async def _get(self, request, context):
         chromosome = await self.handler.process(request.name)
@@ -39,12 +58,7 @@ class Chromosome(chromosome_pb2_grpc.ChromosomeServicer):
         return chromosome_pb2.ChromosomeGetReply(
             chromosome=track_pb2.Chromosome(
                 length=chromosome["length"],
-                track=track_pb2.Track(
-                    genus=chromosome["genus"],
-                    species=chromosome["species"],
-                    genes=chromosome["genes"],
-                    families=chromosome["families"],
-                ),
+                track=self._trackMessage(chromosome, request.dictionaryEncodeFamilies),
             )
         )
 
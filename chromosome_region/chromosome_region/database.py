@@ -1,3 +1,7 @@
+# Python
+import sys
+from array import array
+
 # dependencies
 import redis.asyncio as redis
 
@@ -33,3 +37,14 @@ async def connectToRedis(host="localhost", port=6379, db=0, password=None):
         )
         raise SchemaVersionError(message)
     return connection
+
+
+# decodes a binary string of packed little-endian integers, e.g. a chromosome's
+# gene locations; the string is cast without copying on little-endian hosts
+def unpackArray(typecode, data):
+    if sys.byteorder == "little":
+        return memoryview(data).cast(typecode)
+    values = array(typecode)
+    values.frombytes(data)
+    values.byteswap()
+    return values
@@ -5,14 +5,20 @@ import bisect
 # dependencies
 from redis.commands.search import AsyncSearch
 
+# module
+from chromosome_region.database import unpackArray
+
 
 class RequestHandler:
     def __init__(self, redis_connection):
         self.redis_connection = redis_connection
 
-    async def _getRedisIntList(self, key):
-        key_list = await self.redis_connection.lrange(key, 0, -1)
-        return list(map(int, key_list))
+    # gets a packed binary string of 64-bit integers and decodes it as an array
+    async def _getRedisPackedIntArray(self, key):
+        data = await self.redis_connection.execute_command(
+            "GET", key, NEVER_DECODE=True
+        )
+        return unpackArray("q", data or b"")
 
     async def process(self, chromosome, start, stop):
         # connect to the index
@@ -26,8 +32,8 @@ class RequestHandler:
             return None
         # get the chromosome gene locations
         fmins, fmaxs = await asyncio.gather(
-            self._getRedisIntList(f"{chromosome_doc_id}:fmins"),
-            self._getRedisIntList(f"{chromosome_doc_id}:fmaxs"),
+            self._getRedisPackedIntArray(f"{chromosome_doc_id}:packedfmins"),
+            self._getRedisPackedIntArray(f"{chromosome_doc_id}:packedfmaxs"),
         )
         # find the index bounds using binary search
         i = bisect.bisect_left(fmins, start)
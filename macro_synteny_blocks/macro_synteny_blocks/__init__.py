@@ -8,5 +8,5 @@ def int_or_str(value):
 __version__ = "1.4.0"
 VERSION = tuple(map(int_or_str, __version__.split(".")))
 
-__schema_version__ = "1.1.0"
+__schema_version__ = "1.5.0"
 SCHEMA_VERSION = tuple(map(int_or_str, __schema_version__.split(".")))
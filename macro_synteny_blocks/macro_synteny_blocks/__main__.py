@@ -12,11 +12,18 @@ import uvloop
 
 # module
 import macro_synteny_blocks
+from macro_synteny_blocks.channel_pool import ChannelPool
 from macro_synteny_blocks.database import connectToRedis
+from macro_synteny_blocks.embedded_pairwise import (
+    createPairwiseHandler,
+    getPairwiseOptions,
+)
 from macro_synteny_blocks.grpc_server import run_grpc_server
 from macro_synteny_blocks.http_server import run_http_server
 from macro_synteny_blocks.request_handler import RequestHandler
 
+PAIRWISE_MODES = ["remote", "embedded"]
+
 LOG_LEVELS = {
     "DEBUG": logging.DEBUG,
     "INFO": logging.INFO,
@@ -203,16 +210,265 @@ def parseArgs():
     )
 
     # Inter-microservice communication args
+    pairwisemode_envvar = "PAIRWISE_MODE"
+    parser.add_argument(
+        "--pairwise-mode",
+        dest="pairwise_mode",
+        action=EnvArg,
+        envvar=pairwisemode_envvar,
+        type=str,
+        choices=PAIRWISE_MODES,
+        default="remote",
+        help=f"""
+        Whether blocks are computed by the pairwise macro-synteny microservice
+        (remote) or by the pairwise macro-synteny algorithm in this process
+        (embedded); the embedded mode requires the pairwise_macro_synteny_blocks
+        package (can also be specified using the {pairwisemode_envvar} environment
+        variable).
+        """,
+    )
     pairwiseaddr_envvar = "PAIRWISE_ADDR"
     parser.add_argument(
         "--pairwiseaddr",
         action=EnvArg,
         envvar=pairwiseaddr_envvar,
         type=str,
-        required=True,
         help=f"""
-        The address of the pairwise macro-synteny microservice (can also be specified
-        using the {pairwiseaddr_envvar} environment variable).
+        The address of the pairwise macro-synteny microservice; a comma separated list
+        of addresses distributes requests across several instances; required in the
+        remote mode (can also be specified using the {pairwiseaddr_envvar} environment
+        variable).
+        """,
+    )
+    pairwisehealthinterval_envvar = "PAIRWISE_HEALTH_CHECK_INTERVAL"
+    parser.add_argument(
+        "--pairwise-health-check-interval",
+        dest="pairwise_health_check_interval",
+        action=EnvArg,
+        envvar=pairwisehealthinterval_envvar,
+        type=float,
+        default=10.0,
+        help=f"""
+        The number of seconds between health checks of the pairwise macro-synteny
+        microservice addresses; 0 disables the checks (can also be specified using the
+        {pairwisehealthinterval_envvar} environment variable).
+        """,
+    )
+    pairwisemaxbackoff_envvar = "PAIRWISE_MAX_BACKOFF"
+    parser.add_argument(
+        "--pairwise-max-backoff",
+        dest="pairwise_max_backoff",
+        action=EnvArg,
+        envvar=pairwisemaxbackoff_envvar,
+        type=float,
+        default=60.0,
+        help=f"""
+        The maximum number of seconds an unavailable pairwise macro-synteny
+        microservice address is skipped before it's retried (can also be specified
+        using the {pairwisemaxbackoff_envvar} environment variable).
+        """,
+    )
+
+    # Cache args
+    metadatacachesize_envvar = "METADATA_CACHE_SIZE"
+    parser.add_argument(
+        "--metadata-cache-size",
+        dest="metadata_cache_size",
+        action=EnvArg,
+        envvar=metadatacachesize_envvar,
+        type=int,
+        default=10000,
+        help=f"""
+        The maximum number of chromosomes whose genus and species are cached; 0
+        disables the cache (can also be specified using the {metadatacachesize_envvar}
+        environment variable).
+        """,
+    )
+    querycachesize_envvar = "QUERY_CACHE_SIZE"
+    parser.add_argument(
+        "--query-cache-size",
+        dest="query_cache_size",
+        action=EnvArg,
+        envvar=querycachesize_envvar,
+        type=int,
+        default=32,
+        help=f"""
+        The maximum number of functional annotation lists of queries given as a
+        chromosome name to cache; 0 disables the cache (can also be specified using
+        the {querycachesize_envvar} environment variable).
+        """,
+    )
+    resultcachesize_envvar = "RESULT_CACHE_SIZE"
+    parser.add_argument(
+        "--result-cache-size",
+        dest="result_cache_size",
+        action=EnvArg,
+        envvar=resultcachesize_envvar,
+        type=int,
+        default=0,
+        help=f"""
+        The maximum number of results to cache in Redis; 0 disables the cache (can
+        also be specified using the {resultcachesize_envvar} environment variable).
+        """,
+    )
+    resultcachettl_envvar = "RESULT_CACHE_TTL"
+    parser.add_argument(
+        "--result-cache-ttl",
+        dest="result_cache_ttl",
+        action=EnvArg,
+        envvar=resultcachettl_envvar,
+        type=int,
+        default=3600,
+        help=f"""
+        The number of seconds a cached result is kept after it was last used; 0 keeps
+        results until they're evicted (can also be specified using the
+        {resultcachettl_envvar} environment variable).
+        """,
+    )
+    parser.add_argument(
+        "--precomputed",
+        dest="precomputed",
+        action="store_true",
+        help="""
+        Answer queries that refer to a whole chromosome by name with the blocks
+        precomputed by the pairwise microservice's precompute command when they've
+        been precomputed for every target.
+        """,
+    )
+    parser.set_defaults(precomputed=False)
+
+    # Pairwise algorithm args; these configure the pairwise algorithm in the embedded
+    # mode and key cached results in both modes
+    pairwiseengine_envvar = "PAIRWISE_CHAINING_ENGINE"
+    parser.add_argument(
+        "--pairwise-chaining-engine",
+        dest="pairwise_chaining_engine",
+        action=EnvArg,
+        envvar=pairwiseengine_envvar,
+        type=str,
+        default="python",
+        help=f"""
+        The engine used to chain gene index pairs into blocks in the embedded mode;
+        one of the pairwise microservice's engines. In the remote mode it should be
+        the pairwise microservice's engine since it keys cached results (can also be
+        specified using the {pairwiseengine_envvar} environment variable).
+        """,
+    )
+    pairwisequerycachesize_envvar = "PAIRWISE_QUERY_CACHE_SIZE"
+    parser.add_argument(
+        "--pairwise-query-cache-size",
+        dest="pairwise_query_cache_size",
+        action=EnvArg,
+        envvar=pairwisequerycachesize_envvar,
+        type=int,
+        default=128,
+        help=f"""
+        The maximum number of query chromosome family indexes to cache in the
+        embedded mode; 0 disables the cache (can also be specified using the
+        {pairwisequerycachesize_envvar} environment variable).
+        """,
+    )
+    pairwisecachesize_envvar = "PAIRWISE_TARGET_CACHE_SIZE"
+    parser.add_argument(
+        "--pairwise-target-cache-size",
+        dest="pairwise_target_cache_size",
+        action=EnvArg,
+        envvar=pairwisecachesize_envvar,
+        type=int,
+        default=64 * 1024 * 1024,
+        help=f"""
+        The maximum number of bytes of target chromosome data to cache in the embedded
+        mode; 0 disables the cache (can also be specified using the
+        {pairwisecachesize_envvar} environment variable).
+        """,
+    )
+    pairwiseworkers_envvar = "PAIRWISE_WORKERS"
+    parser.add_argument(
+        "--pairwise-workers",
+        dest="pairwise_workers",
+        action=EnvArg,
+        envvar=pairwiseworkers_envvar,
+        type=int,
+        default=0,
+        help=f"""
+        The number of worker processes that compute blocks in the embedded mode; 0
+        computes blocks in the event loop's process (can also be specified using the
+        {pairwiseworkers_envvar} environment variable).
+        """,
+    )
+    pairwisepairbudget_envvar = "PAIRWISE_PAIR_BUDGET"
+    parser.add_argument(
+        "--pairwise-pair-budget",
+        dest="pairwise_pair_budget",
+        action=EnvArg,
+        envvar=pairwisepairbudget_envvar,
+        type=int,
+        default=0,
+        help=f"""
+        The maximum number of matching gene pairs computed for a target chromosome
+        in the embedded mode; 0 means there's no budget. In the remote mode it should
+        be the pairwise microservice's budget since it keys cached results (can also
+        be specified using the {pairwisepairbudget_envvar} environment variable).
+        """,
+    )
+    pairwisepairbudgetstrategy_envvar = "PAIRWISE_PAIR_BUDGET_STRATEGY"
+    parser.add_argument(
+        "--pairwise-pair-budget-strategy",
+        dest="pairwise_pair_budget_strategy",
+        action=EnvArg,
+        envvar=pairwisepairbudgetstrategy_envvar,
+        type=str,
+        default="mask",
+        help=f"""
+        What to do in the embedded mode when a target exceeds the pair budget; one of
+        the pairwise microservice's strategies. In the remote mode it should be the
+        pairwise microservice's strategy since it keys cached results (can also be
+        specified using the {pairwisepairbudgetstrategy_envvar} environment
+        variable).
+        """,
+    )
+
+    # Concurrency args
+    batchsize_envvar = "PAIRWISE_BATCH_SIZE"
+    parser.add_argument(
+        "--pairwise-batch-size",
+        dest="pairwise_batch_size",
+        action=EnvArg,
+        envvar=batchsize_envvar,
+        type=int,
+        default=100,
+        help=f"""
+        The number of target chromosomes sent to the pairwise macro-synteny
+        microservice in each call (can also be specified using the {batchsize_envvar}
+        environment variable).
+        """,
+    )
+    maxconcurrency_envvar = "MAX_CONCURRENCY"
+    parser.add_argument(
+        "--max-concurrency",
+        dest="max_concurrency",
+        action=EnvArg,
+        envvar=maxconcurrency_envvar,
+        type=int,
+        default=16,
+        help=f"""
+        The maximum number of target chromosome batches computed at once across all
+        requests (can also be specified using the {maxconcurrency_envvar} environment
+        variable).
+        """,
+    )
+    maxrequestconcurrency_envvar = "MAX_REQUEST_CONCURRENCY"
+    parser.add_argument(
+        "--max-request-concurrency",
+        dest="max_request_concurrency",
+        action=EnvArg,
+        envvar=maxrequestconcurrency_envvar,
+        type=int,
+        default=4,
+        help=f"""
+        The maximum number of target chromosome batches computed at once for a single
+        request (can also be specified using the {maxrequestconcurrency_envvar}
+        environment variable).
         """,
     )
 
@@ -246,6 +502,39 @@ def main():
     args = parseArgs()
     if args.nohttp and args.nogrpc:
         exit("--no-http and --no-grpc can't both be given")
+    if args.pairwise_mode == "remote" and not args.pairwiseaddr:
+        exit("--pairwiseaddr is required in the remote pairwise mode")
+    if (
+        args.pairwise_batch_size <= 0
+        or args.max_concurrency <= 0
+        or args.max_request_concurrency <= 0
+    ):
+        exit(
+            "--pairwise-batch-size, --max-concurrency, and --max-request-concurrency "
+            "must be positive"
+        )
+    if args.result_cache_size < 0 or args.result_cache_ttl < 0:
+        exit("--result-cache-size and --result-cache-ttl can't be negative")
+    if args.pairwise_mode == "embedded":
+        # the choices come from the pairwise microservice, which is only required by
+        # the embedded mode
+        try:
+            chaining_engines, pair_budget_strategies = getPairwiseOptions()
+        except ImportError:
+            exit(
+                "The embedded pairwise mode requires the pairwise_macro_synteny_blocks "
+                "package to be installed"
+            )
+        if args.pairwise_chaining_engine not in chaining_engines:
+            exit(
+                "--pairwise-chaining-engine must be one of: "
+                + ", ".join(chaining_engines)
+            )
+        if args.pairwise_pair_budget_strategy not in pair_budget_strategies:
+            exit(
+                "--pairwise-pair-budget-strategy must be one of: "
+                + ", ".join(pair_budget_strategies)
+            )
 
     # setup logging
     log_config = {
@@ -270,13 +559,54 @@ def main():
     loop.set_exception_handler(handleException)
 
     # run the program
+    channel_pool = None
+    pairwise_handler = None
     try:
         # create the database connection
         redis_connection = loop.run_until_complete(
             connectToRedis(args.rhost, args.rport, args.rdb, args.rpassword)
         )
+        if args.pairwise_mode == "embedded":
+            # create the pairwise request handler that runs in this process
+            pairwise_handler = createPairwiseHandler(
+                redis_connection,
+                args.pairwise_chaining_engine,
+                args.pairwise_query_cache_size,
+                args.pairwise_target_cache_size,
+                args.pairwise_workers,
+                args.pairwise_pair_budget,
+                args.pairwise_pair_budget_strategy,
+            )
+        else:
+            # create the pool of channels to the pairwise microservice
+            pairwise_addresses = [a.strip() for a in args.pairwiseaddr.split(",")]
+            channel_pool = ChannelPool(
+                [a for a in pairwise_addresses if a],
+                max_backoff=args.pairwise_max_backoff,
+            )
+            if args.pairwise_health_check_interval > 0:
+                loop.create_task(
+                    channel_pool.runHealthChecks(args.pairwise_health_check_interval)
+                )
         # create the request handler
-        handler = RequestHandler(redis_connection, args.pairwiseaddr)
+        handler = RequestHandler(
+            redis_connection,
+            channel_pool,
+            args.pairwise_batch_size,
+            args.max_concurrency,
+            args.max_request_concurrency,
+            pairwise_handler,
+            args.metadata_cache_size,
+            args.result_cache_size,
+            args.result_cache_ttl,
+            args.query_cache_size,
+            args.precomputed,
+            {
+                "chainingEngine": args.pairwise_chaining_engine,
+                "pairBudget": args.pairwise_pair_budget,
+                "pairBudgetStrategy": args.pairwise_pair_budget_strategy,
+            },
+        )
         # start the HTTP server
         if not args.nohttp:
             loop.create_task(run_http_server(args.hhost, args.hport, handler))
@@ -291,6 +621,10 @@ def main():
         loop.call_exception_handler(context)
     # finalize the shutdown
     finally:
+        if channel_pool is not None:
+            loop.run_until_complete(channel_pool.close())
+        if pairwise_handler is not None:
+            pairwise_handler.close()
         loop.close()
         logging.info("Successfully shutdown.")
 
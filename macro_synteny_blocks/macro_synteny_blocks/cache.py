@@ -0,0 +1,107 @@
+# Python
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A least recently used cache that holds at most a given total size of entries
+    and counts its hits and misses.
+    """
+
+    def __init__(self, maxsize, getsizeof=None):
+        """
+        Parameters:
+          maxsize (int): The maximum total size of the entries in the cache. A size
+            of 0 disables the cache.
+          getsizeof (function): A function that computes the size of a value. By
+            default every value has size 1, i.e. maxsize is the number of entries.
+        """
+
+        self.maxsize = maxsize
+        self.getsizeof = getsizeof
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.currsize = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        """
+        Gets a value from the cache and marks it as the most recently used.
+
+        Parameters:
+          key (hashable): The key of the value to get.
+          default (object): The value to return if the key isn't in the cache.
+
+        Returns:
+          object: The cached value or the default value.
+        """
+
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        """
+        Adds a value to the cache, evicting the least recently used entries if the
+        cache is full. Values larger than the cache are not added and replace any
+        existing value for the key.
+
+        Parameters:
+          key (hashable): The key of the value.
+          value (object): The value to cache.
+        """
+
+        size = 1 if self.getsizeof is None else self.getsizeof(value)
+        self.pop(key)
+        if size > self.maxsize:
+            return
+        self.entries[key] = value
+        self.sizes[key] = size
+        self.currsize += size
+        while self.currsize > self.maxsize:
+            evicted, _ = self.entries.popitem(last=False)
+            self.currsize -= self.sizes.pop(evicted)
+
+    def pop(self, key):
+        """
+        Removes a value from the cache, if present.
+
+        Parameters:
+          key (hashable): The key of the value to remove.
+        """
+
+        if key in self.entries:
+            del self.entries[key]
+            self.currsize -= self.sizes.pop(key)
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        self.entries.clear()
+        self.sizes.clear()
+        self.currsize = 0
+
+    def stats(self):
+        """
+        Reports the size and performance of the cache.
+
+        Returns:
+          dict: The cache's number of entries, size, maximum size, hits, misses, and
+            hit rate.
+        """
+
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "size": self.currsize,
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+        }
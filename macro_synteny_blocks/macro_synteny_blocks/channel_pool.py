@@ -0,0 +1,281 @@
+# Python
+import asyncio
+import contextlib
+import logging
+import random
+import time
+
+# dependencies
+import grpc
+from grpc.experimental import aio
+
+# the options every channel is created with; gRPC reconnects broken channels in the
+# background with exponential backoff, and the round robin load balancing policy
+# spreads calls across every address a host name resolves to
+CHANNEL_OPTIONS = [
+    ("grpc.lb_policy_name", "round_robin"),
+    ("grpc.initial_reconnect_backoff_ms", 1000),
+    ("grpc.max_reconnect_backoff_ms", 30000),
+    ("grpc.keepalive_time_ms", 60000),
+    ("grpc.keepalive_permit_without_calls", 1),
+]
+
+# the connectivity states of a channel that can't make calls
+UNHEALTHY_STATES = {
+    grpc.ChannelConnectivity.TRANSIENT_FAILURE,
+    grpc.ChannelConnectivity.SHUTDOWN,
+}
+
+
+class ChannelPool:
+    """
+    A pool of long-lived gRPC channels to one or more addresses of the same service
+    that is shared by every request. Calls are distributed round robin across the
+    addresses that are healthy. An address whose calls fail because it's unavailable
+    is skipped until an exponentially increasing backoff expires or a health check
+    finds that it's ready again.
+    """
+
+    def __init__(self, addresses, initial_backoff=1.0, max_backoff=60.0):
+        """
+        Parameters:
+          addresses (list[str]): The addresses of the service.
+          initial_backoff (float): The number of seconds an address is skipped after
+            its first failure; the backoff doubles with each consecutive failure.
+          max_backoff (float): The maximum number of seconds an address is skipped.
+        """
+
+        if not addresses:
+            raise ValueError("at least one address must be given")
+        self.addresses = list(addresses)
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.channels = {}
+        self.next_address = 0
+        self.failures = {address: 0 for address in self.addresses}
+        self.retry_times = {address: 0.0 for address in self.addresses}
+        self.address_calls = {address: 0 for address in self.addresses}
+        self.address_in_flight = {address: 0 for address in self.addresses}
+        self.channels_created = 0
+        self.channel_reuses = 0
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.failed_calls = 0
+
+    def _getChannel(self, address):
+        channel = self.channels.get(address)
+        if channel is None or (
+            channel.get_state() == grpc.ChannelConnectivity.SHUTDOWN
+        ):
+            channel = aio.insecure_channel(address, options=CHANNEL_OPTIONS)
+            self.channels[address] = channel
+            self.channels_created += 1
+        else:
+            self.channel_reuses += 1
+        return channel
+
+    # checks whether an address can be called; idle channels are asked to connect
+    # unless the check is read-only, e.g. for statistics, so checks that don't lead
+    # to calls don't open connections
+    def _isHealthy(self, address, now, try_to_connect=True):
+        if now < self.retry_times[address]:
+            return False
+        channel = self.channels.get(address)
+        # channels that haven't been created yet are assumed to be healthy
+        if channel is None:
+            return True
+        state = channel.get_state(try_to_connect=try_to_connect)
+        return state not in UNHEALTHY_STATES
+
+    # gets the next healthy address in round robin order; if no address is healthy
+    # then the address that will be retried soonest is used so calls still fail fast
+    def _nextAddress(self, exclude=()):
+        now = time.monotonic()
+        n = len(self.addresses)
+        candidates = []
+        for k in range(n):
+            address = self.addresses[(self.next_address + k) % n]
+            if address not in exclude:
+                candidates.append(address)
+        if not candidates:
+            return None
+        address = next(
+            (a for a in candidates if self._isHealthy(a, now)),
+            min(candidates, key=self.retry_times.get),
+        )
+        self.next_address = (self.addresses.index(address) + 1) % n
+        return address
+
+    def _markFailure(self, address):
+        self.failures[address] += 1
+        backoff = min(
+            self.max_backoff,
+            self.initial_backoff * 2 ** (self.failures[address] - 1),
+        )
+        # jitter the backoff so addresses that failed together aren't retried together
+        backoff *= random.uniform(0.8, 1.2)
+        self.retry_times[address] = time.monotonic() + backoff
+
+    def _markSuccess(self, address):
+        self.failures[address] = 0
+        self.retry_times[address] = 0.0
+
+    @contextlib.asynccontextmanager
+    async def _channel(self, address):
+        channel = self._getChannel(address)
+        self.calls += 1
+        self.address_calls[address] += 1
+        self.in_flight += 1
+        self.address_in_flight[address] += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            yield channel
+        finally:
+            self.in_flight -= 1
+            self.address_in_flight[address] -= 1
+
+    async def call(self, function):
+        """
+        Calls a function with a channel. If the call fails because the channel's
+        address is unavailable then the address is backed off and the call is
+        retried with each of the other addresses.
+
+        Parameters:
+          function (function): An async function that takes a channel and makes a
+            call with it.
+
+        Returns:
+          object: The value returned by the function.
+        """
+
+        tried = set()
+        while True:
+            address = self._nextAddress(exclude=tried)
+            tried.add(address)
+            try:
+                async with self._channel(address) as channel:
+                    result = await function(channel)
+            except aio.AioRpcError as e:
+                self.failed_calls += 1
+                if e.code() != grpc.StatusCode.UNAVAILABLE:
+                    raise e
+                self._markFailure(address)
+                if len(tried) == len(self.addresses):
+                    raise e
+                logging.warning(f"{address} is unavailable; retrying another address")
+                continue
+            self._markSuccess(address)
+            return result
+
+    async def stream(self, function):
+        """
+        Streams the responses of a server streaming call made with a channel. If the
+        call fails because the channel's address is unavailable before any responses
+        are received then the address is backed off and the call is retried with
+        each of the other addresses.
+
+        Parameters:
+          function (function): A function that takes a channel and makes a server
+            streaming call with it.
+
+        Returns:
+          object: An async iterator over the call's responses.
+        """
+
+        tried = set()
+        while True:
+            address = self._nextAddress(exclude=tried)
+            tried.add(address)
+            received = False
+            try:
+                async with self._channel(address) as channel:
+                    async for response in function(channel):
+                        received = True
+                        yield response
+            except aio.AioRpcError as e:
+                self.failed_calls += 1
+                if e.code() != grpc.StatusCode.UNAVAILABLE:
+                    raise e
+                self._markFailure(address)
+                # responses can't be retried without being repeated
+                if received or len(tried) == len(self.addresses):
+                    raise e
+                logging.warning(f"{address} is unavailable; retrying another address")
+                continue
+            self._markSuccess(address)
+            return
+
+    async def checkHealth(self, timeout):
+        """
+        Checks whether each address can be connected to and updates its backoff.
+
+        Parameters:
+          timeout (float): The number of seconds to wait for each address to become
+            ready.
+        """
+
+        async def check(address):
+            channel = self.channels.get(address)
+            if channel is None:
+                return
+            try:
+                await asyncio.wait_for(channel.channel_ready(), timeout)
+            except asyncio.TimeoutError:
+                if self.retry_times[address] <= time.monotonic():
+                    self._markFailure(address)
+            else:
+                self._markSuccess(address)
+
+        await asyncio.gather(*map(check, self.addresses))
+
+    async def runHealthChecks(self, interval):
+        """
+        Checks the health of the addresses forever.
+
+        Parameters:
+          interval (float): The number of seconds between health checks; also the
+            number of seconds each check waits for an address to become ready.
+        """
+
+        while True:
+            await self.checkHealth(interval)
+            await asyncio.sleep(interval)
+
+    async def close(self):
+        """
+        Closes every channel in the pool.
+        """
+
+        channels = list(self.channels.values())
+        self.channels.clear()
+        await asyncio.gather(*[channel.close() for channel in channels])
+
+    def stats(self):
+        """
+        Gets the pool's channel reuse and call metrics.
+
+        Returns:
+          dict: The metrics of the pool and of each of its addresses.
+        """
+
+        now = time.monotonic()
+        addresses = {}
+        for address in self.addresses:
+            channel = self.channels.get(address)
+            addresses[address] = {
+                "state": None if channel is None else channel.get_state().name,
+                "healthy": self._isHealthy(address, now, try_to_connect=False),
+                "consecutiveFailures": self.failures[address],
+                "calls": self.address_calls[address],
+                "inFlight": self.address_in_flight[address],
+            }
+        return {
+            "channelsCreated": self.channels_created,
+            "channelReuses": self.channel_reuses,
+            "calls": self.calls,
+            "inFlight": self.in_flight,
+            "maxInFlight": self.max_in_flight,
+            "failedCalls": self.failed_calls,
+            "addresses": addresses,
+        }
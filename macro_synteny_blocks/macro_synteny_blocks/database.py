@@ -1,3 +1,10 @@
+# Python
+import hashlib
+import json
+import sys
+from array import array
+from collections import defaultdict, namedtuple
+
 # dependencies
 import redis.asyncio as redis
 
@@ -5,6 +12,23 @@ import redis.asyncio as redis
 import macro_synteny_blocks
 
 COMPATIBLE_KEY = "GCV_COMPATIBLE_SCHEMA_VERSIONS"
+LOAD_EPOCH_KEY = "GCV_LOAD_EPOCH"
+FAMILY_NAMES_KEY = "family:names"
+ORPHAN_FAMILY_ID = -1
+CHROMOSOME_IDS_KEY = "chromosomes:ids"
+CHROMOSOME_NAMES_KEY = "chromosomes:names"
+CHROMOSOME_LENGTHS_KEY = "chromosomes:lengths"
+CHROMOSOME_GENE_COUNTS_KEY = "chromosomes:genecounts"
+
+# the prefix of the keys blocks precomputed by the pairwise macro-synteny blocks
+# microservice's precompute command are stored in; see its database module for the
+# layout of the keys
+PRECOMPUTED_KEY_PREFIX = "macro-synteny-blocks:precomputed"
+
+# a query given as a range of genes on a chromosome in the database instead of as a
+# list of functional annotations; start and stop are inclusive gene indexes and
+# None means the range is unbounded on that side
+ChromosomeReference = namedtuple("ChromosomeReference", ["name", "start", "stop"])
 
 
 class SchemaVersionError(Exception):
@@ -33,3 +57,242 @@ async def connectToRedis(host="localhost", port=6379, db=0, password=None):
         )
         raise SchemaVersionError(message)
     return connection
+
+
+# decodes a binary string of packed little-endian integers into an array
+def unpackArray(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+async def getFamilyOccurrences(connection, families, chromosomes=None):
+    """
+    Gets the genes in the given families from the families' inverted indexes in a
+    single pipelined read.
+
+    Parameters:
+      connection (redis.asyncio.Redis): The Redis connection to use.
+      families (iterable[str]): The names of the families.
+      chromosomes (list[str]): The names of the chromosomes to limit the genes to;
+        all chromosomes if None or empty.
+
+    Returns:
+      dict[int, list[int]]: A dictionary mapping the ID of each chromosome that has
+        genes in the families to the indexes of the genes.
+    """
+
+    pipeline = connection.pipeline(transaction=False)
+    if chromosomes:
+        pipeline.hmget(CHROMOSOME_IDS_KEY, chromosomes)
+    for family in families:
+        key = f"family:{family}:occurrences"
+        pipeline.execute_command("GET", key, NEVER_DECODE=True)
+    results = await pipeline.execute()
+    chromosome_ids = None
+    if chromosomes:
+        chromosome_ids = {int(i) for i in results.pop(0) if i is not None}
+    # bin the genes by chromosome
+    chromosome_indexes = defaultdict(list)
+    for data in results:
+        if data is None:
+            continue
+        occurrences = unpackArray("i", data)
+        for chromosome_id, index in zip(occurrences[::2], occurrences[1::2]):
+            if chromosome_ids is None or chromosome_id in chromosome_ids:
+                chromosome_indexes[chromosome_id].append(index)
+    return chromosome_indexes
+
+
+async def getChromosomeNames(connection, chromosome_ids):
+    """
+    Gets the names of the chromosomes with the given IDs.
+
+    Parameters:
+      connection (redis.asyncio.Redis): The Redis connection to use.
+      chromosome_ids (iterable[int]): The IDs of the chromosomes.
+
+    Returns:
+      list[str]: The names of the chromosomes.
+    """
+
+    pipeline = connection.pipeline(transaction=False)
+    for chromosome_id in chromosome_ids:
+        pipeline.lindex(CHROMOSOME_NAMES_KEY, chromosome_id)
+    return await pipeline.execute()
+
+
+async def getChromosomeSizes(connection):
+    """
+    Gets the length and number of genes of every chromosome.
+
+    Parameters:
+      connection (redis.asyncio.Redis): The Redis connection to use.
+
+    Returns:
+      array[int]: The length of each chromosome, indexed by chromosome ID.
+      array[int]: The number of genes on each chromosome, indexed by chromosome ID.
+    """
+
+    pipeline = connection.pipeline(transaction=False)
+    pipeline.execute_command("GET", CHROMOSOME_LENGTHS_KEY, NEVER_DECODE=True)
+    pipeline.execute_command("GET", CHROMOSOME_GENE_COUNTS_KEY, NEVER_DECODE=True)
+    lengths, gene_counts = await pipeline.execute()
+    return unpackArray("q", lengths or b""), unpackArray("i", gene_counts or b"")
+
+
+async def getChromosomeFamilies(connection, reference):
+    """
+    Gets the functional annotations of the genes in a range of a chromosome. The
+    chromosome's annotation IDs are read in one call and the names of the distinct
+    annotations are looked up with a single pipelined read.
+
+    Parameters:
+      connection (redis.asyncio.Redis): The Redis connection to use.
+      reference (ChromosomeReference): The chromosome and range of its genes.
+
+    Returns:
+      list[str]: The annotation of each gene in the range, where genes without an
+        annotation have an empty string, or None if the chromosome doesn't exist.
+    """
+
+    key = f"chromosome:{reference.name}:familyids"
+    data = await connection.execute_command("GET", key, NEVER_DECODE=True)
+    if data is None:
+        return None
+    start = reference.start or 0
+    stop = None if reference.stop is None else reference.stop + 1
+    family_ids = unpackArray("i", data)[start:stop]
+    distinct_ids = list(set(family_ids) - {ORPHAN_FAMILY_ID})
+    pipeline = connection.pipeline(transaction=False)
+    for family_id in distinct_ids:
+        pipeline.lindex(FAMILY_NAMES_KEY, family_id)
+    family_names = dict(zip(distinct_ids, await pipeline.execute()))
+    family_names[ORPHAN_FAMILY_ID] = ""
+    return [family_names[family_id] for family_id in family_ids]
+
+
+def filterTargets(
+    chromosome_match_indices,
+    lengths,
+    gene_counts,
+    query_length,
+    matched,
+    intermediate,
+    chromosome_genes,
+    chromosome_length,
+):
+    """
+    Selects the target chromosomes whose matches with a query could form a block.
+    The pairwise macro-synteny blocks microservice's precompute command selects its
+    targets with a copy of this function, so the two must be kept in sync.
+
+    Parameters:
+      chromosome_match_indices (dict[int, list[int]]): The indexes of the genes in
+        the query's families on each chromosome, keyed by chromosome ID.
+      lengths (array[int]): The length of each chromosome, indexed by ID.
+      gene_counts (array[int]): The number of genes on each chromosome, indexed by
+        ID.
+      query_length (int): The number of genes in the query.
+      matched, intermediate, chromosome_genes, and chromosome_length are the parsed
+        arguments of the request.
+
+    Returns:
+      list[int]: The IDs of the selected chromosomes.
+    """
+
+    # sort index lists and filter by size, match, and intermediate parameters
+    min_genes = max(matched, chromosome_genes)
+    filtered_ids = []
+    for chromosome_id in chromosome_match_indices:
+        # the chromosome is too short or doesn't have enough genes, so the
+        # pairwise microservice would reject it
+        if (
+            chromosome_id >= len(lengths)
+            or chromosome_id >= len(gene_counts)
+            or lengths[chromosome_id] < chromosome_length
+            or gene_counts[chromosome_id] < min_genes
+        ):
+            continue
+        num_genes = len(chromosome_match_indices[chromosome_id])
+        # there's not enough matches on the entire chromosome
+        if num_genes < matched:
+            continue
+        # check blocks of genes that are closes
+        indices = sorted(chromosome_match_indices[chromosome_id])
+        block = [indices[0]]
+        for j, i in enumerate(indices[1:]):
+            # match is close enough to previous match to add to block
+            if (
+                intermediate < 1 and (i - block[-1]) / query_length <= intermediate
+            ) or (intermediate >= 1 and i - block[-1] <= intermediate - 1):
+                block.append(i)
+            # match is too far away from previous match
+            else:
+                # save block if it's big enough
+                if (matched < 1 and len(block) / query_length >= matched) or (
+                    matched >= 1 and len(block) >= matched
+                ):
+                    filtered_ids.append(chromosome_id)
+                    break
+                # start a new block with the current match
+                block = [i]
+                # no need to compute more blocks if none will be large enough
+                if num_genes - j < matched:
+                    break
+        # save last block if it's big enough
+        if (
+            (matched < 1 and len(block) / query_length >= matched)
+            or (matched >= 1 and len(block) >= matched)
+            and (not filtered_ids or filtered_ids[-1] != chromosome_id)
+        ):
+            filtered_ids.append(chromosome_id)
+    return filtered_ids
+
+
+def precomputedKey(
+    matched,
+    intermediate,
+    mask,
+    metrics,
+    chromosome_genes,
+    chromosome_length,
+    pair_budget,
+    pair_budget_strategy,
+):
+    """
+    Gets the key of the blocks precomputed with the given parameters. The pairwise
+    macro-synteny blocks microservice's precompute command computes the same key,
+    so it must be kept in sync with the command's copy.
+
+    Parameters:
+      matched (int): The minimum number of matching annotations in a block.
+      intermediate (int): The maximum number of intermediate genes between matches.
+      mask (int): The maximum number of members a family may have, or None.
+      metrics (list[str]): The optional metrics computed for each block.
+      chromosome_genes (int): The minimum number of genes a target must have.
+      chromosome_length (int): The minimum length a target must have.
+      pair_budget (int): The pairwise algorithm's pair budget; 0 means no budget.
+      pair_budget_strategy (str): What the pairwise algorithm does when a target
+        exceeds the pair budget, which is ignored when there's no budget.
+
+    Returns:
+      str: The key of the precomputed blocks' metadata hash, which is the prefix of
+        their other keys.
+    """
+
+    parameters = [
+        matched,
+        intermediate,
+        mask,
+        list(metrics),
+        chromosome_genes,
+        chromosome_length,
+        pair_budget,
+        pair_budget_strategy if pair_budget > 0 else None,
+    ]
+    canonical = json.dumps(parameters, separators=(",", ":"))
+    digest = hashlib.sha256(canonical.encode()).hexdigest()
+    return f"{PRECOMPUTED_KEY_PREFIX}:{digest}"
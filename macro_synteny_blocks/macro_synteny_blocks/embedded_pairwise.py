@@ -0,0 +1,148 @@
+# Python
+import logging
+
+# isort: split
+
+# module
+from macro_synteny_blocks.database import ChromosomeReference
+
+# isort: off
+# from macro_synteny_blocks.proto.block.v1 import block_pb2
+# NOTE: the following imports are a temporary workaround for a known protobuf
+# bug; the commented imports above should be used when the bug is fixed:
+# https://github.com/protocolbuffers/protobuf/issues/10075
+from macro_synteny_blocks import proto  # noqa: F401
+from block.v1 import block_pb2
+
+# isort: on
+
+
+# gets the chaining engines and pair budget strategies the pairwise macro-synteny
+# blocks microservice supports; raises an ImportError if it isn't installed
+def getPairwiseOptions():
+    from pairwise_macro_synteny_blocks.chaining import CHAINING_ENGINES
+    from pairwise_macro_synteny_blocks.request_handler import PAIR_BUDGET_STRATEGIES
+
+    return ["python"] + list(CHAINING_ENGINES.keys()), PAIR_BUDGET_STRATEGIES
+
+
+# creates a request handler of the pairwise macro-synteny blocks microservice that
+# runs in this process; the pairwise microservice is an optional dependency so it's
+# only imported when the embedded mode is used
+def createPairwiseHandler(
+    redis_connection,
+    chaining_engine,
+    query_cache_size,
+    target_cache_size,
+    workers,
+    pair_budget,
+    pair_budget_strategy,
+):
+    from pairwise_macro_synteny_blocks.request_handler import RequestHandler
+
+    return RequestHandler(
+        redis_connection,
+        chaining_engine=chaining_engine,
+        query_cache_size=query_cache_size,
+        target_cache_size=target_cache_size,
+        workers=workers,
+        pair_budget=pair_budget,
+        pair_budget_strategy=pair_budget_strategy,
+    )
+
+
+# gets the arguments of a query in the order the handler's parsers take them, i.e.
+# as the annotations followed by the optional reference to a chromosome
+def _queryArguments(chromosome):
+    if isinstance(chromosome, ChromosomeReference):
+        return None, tuple(chromosome)
+    return chromosome, (None, None, None)
+
+
+def _blockToMessage(block):
+    return block_pb2.Block(
+        i=block["i"],
+        j=block["j"],
+        fmin=block["fmin"],
+        fmax=block["fmax"],
+        orientation=block["orientation"],
+        optionalMetrics=block.get("optionalMetrics", []),
+    )
+
+
+# the embedded equivalent of grpc_client.computeManyPairwiseMacroSyntenyBlocks; the
+# arguments are given to the handler as the pairwise microservice's gRPC server
+# would receive them and the blocks are returned as the same messages, so the
+# output is identical, including the float32 precision of the metrics
+async def computeManyPairwiseMacroSyntenyBlocks(
+    chromosome,
+    targets,
+    matched,
+    intermediate,
+    mask,
+    metrics,
+    chromosome_genes,
+    chromosome_length,
+    pairwise_handler,
+    deadline=None,
+):
+    try:
+        query, reference = _queryArguments(chromosome)
+        arguments = pairwise_handler.parseManyArguments(
+            query,
+            targets,
+            matched,
+            intermediate,
+            mask or None,
+            metrics or None,
+            chromosome_genes or None,
+            chromosome_length or None,
+            *reference,
+        )
+        target_blocks, _ = await pairwise_handler.processMany(
+            *arguments, deadline=deadline
+        )
+    except Exception as e:
+        logging.error(e)
+        return None
+    return [
+        block_pb2.Blocks(chromosome=target, blocks=list(map(_blockToMessage, blocks)))
+        for target, blocks in zip(targets, target_blocks)
+        if blocks  # false for None or []
+    ]
+
+
+# the embedded equivalent of grpc_client.streamPairwiseMacroSyntenyBlocks
+async def streamPairwiseMacroSyntenyBlocks(
+    chromosome,
+    targets,
+    matched,
+    intermediate,
+    mask,
+    metrics,
+    chromosome_genes,
+    chromosome_length,
+    pairwise_handler,
+    deadline=None,
+):
+    try:
+        query, reference = _queryArguments(chromosome)
+        arguments = pairwise_handler.parseManyArguments(
+            query,
+            targets,
+            matched,
+            intermediate,
+            mask or None,
+            metrics or None,
+            chromosome_genes or None,
+            chromosome_length or None,
+            *reference,
+        )
+        stream = await pairwise_handler.processStream(*arguments, deadline=deadline)
+        async for target, blocks, _ in stream:
+            yield block_pb2.Blocks(
+                chromosome=target, blocks=list(map(_blockToMessage, blocks))
+            )
+    except Exception as e:
+        logging.error(e)
+        raise e
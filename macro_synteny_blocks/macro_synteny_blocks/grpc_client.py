@@ -1,14 +1,12 @@
 # Python
 import logging
-
-# isort: split
-
-# dependencies
-from grpc.experimental import aio
+import time
 
 # isort: split
 
 # module
+from macro_synteny_blocks.database import ChromosomeReference
+
 # isort: off
 # from macro_synteny_blocks.proto.pairwisemacrosyntenyblocks_service.v1
 #   import pairwisemacrosyntenyblocks_pb2
@@ -26,6 +24,48 @@ from pairwisemacrosyntenyblocks_service.v1 import (
 # isort: on
 
 
+# gets the request fields of a query; queries that refer to a chromosome in the
+# database are sent as the reference and lists of annotations are dictionary encoded
+# so each distinct annotation is only sent once
+def _queryFields(chromosome):
+    if isinstance(chromosome, ChromosomeReference):
+        return {
+            "chromosomeName": chromosome.name,
+            "chromosomeStart": chromosome.start,
+            "chromosomeStop": chromosome.stop,
+        }
+    dictionary = {}
+    indexes = [dictionary.setdefault(f, len(dictionary)) for f in chromosome]
+    return {
+        "chromosomeFamilyDictionary": list(dictionary),
+        "chromosomeFamilyIndexes": indexes,
+    }
+
+
+# gets the timeout of a call from the deadline, in seconds since the epoch, of the
+# request it's made for; None means there's no deadline
+def _timeout(deadline):
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.time())
+
+
+# makes a call with a channel from the pool, logging errors instead of raising them;
+# the call's timeout is computed when it's made so retries only get the time left
+async def _call(channel_pool, method, request, deadline):
+    async def call(channel):
+        stub = pairwisemacrosyntenyblocks_pb2_grpc.PairwiseMacroSyntenyBlocksStub(
+            channel
+        )
+        return await getattr(stub, method)(request, timeout=_timeout(deadline))
+
+    try:
+        return await channel_pool.call(call)
+    except Exception as e:
+        logging.error(e)
+        return None
+
+
 async def computePairwiseMacroSyntenyBlocks(
     chromosome,
     target,
@@ -35,26 +75,93 @@ async def computePairwiseMacroSyntenyBlocks(
     metrics,
     chromosome_genes,
     chromosome_length,
-    address,
+    channel_pool,
+    deadline=None,
 ):
-    # fetch channel every time to support dynamic services
-    channel = aio.insecure_channel(address)
-    await channel.channel_ready()
-    stub = pairwisemacrosyntenyblocks_pb2_grpc.PairwiseMacroSyntenyBlocksStub(channel)
-    try:
-        result = await stub.Compute(
-            pairwisemacrosyntenyblocks_pb2.PairwiseMacroSyntenyBlocksComputeRequest(
-                chromosome=chromosome,
-                target=target,
-                matched=matched,
-                intermediate=intermediate,
-                mask=mask,
-                optionalMetrics=metrics,
-                chromosomeGenes=chromosome_genes,
-                chromosomeLength=chromosome_length,
-            )
+    request = pairwisemacrosyntenyblocks_pb2.PairwiseMacroSyntenyBlocksComputeRequest(
+        **_queryFields(chromosome),
+        target=target,
+        matched=matched,
+        intermediate=intermediate,
+        mask=mask,
+        optionalMetrics=metrics,
+        chromosomeGenes=chromosome_genes,
+        chromosomeLength=chromosome_length,
+    )
+    result = await _call(channel_pool, "Compute", request, deadline)
+    if result is None:
+        return None
+    return result.blocks
+
+
+async def computeManyPairwiseMacroSyntenyBlocks(
+    chromosome,
+    targets,
+    matched,
+    intermediate,
+    mask,
+    metrics,
+    chromosome_genes,
+    chromosome_length,
+    channel_pool,
+    deadline=None,
+):
+    ManyRequest = (
+        pairwisemacrosyntenyblocks_pb2.PairwiseMacroSyntenyBlocksComputeManyRequest
+    )
+    request = ManyRequest(
+        **_queryFields(chromosome),
+        targets=targets,
+        matched=matched,
+        intermediate=intermediate,
+        mask=mask,
+        optionalMetrics=metrics,
+        chromosomeGenes=chromosome_genes,
+        chromosomeLength=chromosome_length,
+    )
+    result = await _call(channel_pool, "ComputeMany", request, deadline)
+    if result is None:
+        return None
+    return result.blocks
+
+
+async def streamPairwiseMacroSyntenyBlocks(
+    chromosome,
+    targets,
+    matched,
+    intermediate,
+    mask,
+    metrics,
+    chromosome_genes,
+    chromosome_length,
+    channel_pool,
+    deadline=None,
+):
+    ManyRequest = (
+        pairwisemacrosyntenyblocks_pb2.PairwiseMacroSyntenyBlocksComputeManyRequest
+    )
+    request = ManyRequest(
+        **_queryFields(chromosome),
+        targets=targets,
+        matched=matched,
+        intermediate=intermediate,
+        mask=mask,
+        optionalMetrics=metrics,
+        chromosomeGenes=chromosome_genes,
+        chromosomeLength=chromosome_length,
+    )
+
+    def call(channel):
+        stub = pairwisemacrosyntenyblocks_pb2_grpc.PairwiseMacroSyntenyBlocksStub(
+            channel
         )
-        return result.blocks
+        return stub.ComputeStream(request, timeout=_timeout(deadline))
+
+    # yield each chunk of a target's blocks as soon as it's received; errors are
+    # logged and raised so the stream isn't mistaken for a complete one
+    try:
+        async for reply in channel_pool.stream(call):
+            yield reply.blocks
     except Exception as e:
         logging.error(e)
-        return None
+        raise e
@@ -1,3 +1,6 @@
+# Python
+import time
+
 # dependencies
 import grpc
 from grpc.experimental import aio
@@ -5,7 +8,10 @@ from grpc.experimental import aio
 # isort: split
 
 # module
+from macro_synteny_blocks.request_handler import QueryNotFoundError
+
 # isort: off
+# from macro_synteny_blocks.proto.block.v1 import block_pb2
 # from macro_synteny_blocks.proto.macrosyntenyblocks_service.v1
 #   import macrosyntenyblocks_pb2
 # from macro_synteny_blocks.proto.macrosyntenyblocks_service.v1
@@ -14,6 +20,7 @@ from grpc.experimental import aio
 # bug; the commented imports above should be used when the bug is fixed:
 # https://github.com/protocolbuffers/protobuf/issues/10075
 from macro_synteny_blocks import proto  # noqa: F401
+from block.v1 import block_pb2
 from macrosyntenyblocks_service.v1 import (
     macrosyntenyblocks_pb2,
     macrosyntenyblocks_pb2_grpc,
@@ -33,10 +40,25 @@ class MacroSyntenyBlocks(macrosyntenyblocks_pb2_grpc.MacroSyntenyBlocksServicer)
 
         return exceptionCallback
 
-    # the method that actually handles requests
-    async def _compute(self, request, context):
+    # gets the deadline of a request's client in seconds since the epoch, if it has
+    # one, so it can be propagated to the pairwise computations
+    def _deadline(self, context):
+        time_remaining = context.time_remaining()
+        if time_remaining is None:
+            return None
+        return time.time() + time_remaining
+
+    # gets a request's query annotations, which may be dictionary encoded; raises
+    # an IndexError if an index isn't in the dictionary
+    def _requestChromosome(self, request):
+        if request.chromosomeFamilyIndexes:
+            dictionary = list(request.chromosomeFamilyDictionary)
+            return list(map(dictionary.__getitem__, request.chromosomeFamilyIndexes))
+        return request.chromosome
+
+    # parses the arguments of a request, aborting if they're invalid
+    async def _parseRequest(self, request, context):
         # required parameters
-        chromosome = request.chromosome
         matched = request.matched
         intermediate = request.intermediate
         # optional parameters
@@ -45,7 +67,15 @@ class MacroSyntenyBlocks(macrosyntenyblocks_pb2_grpc.MacroSyntenyBlocksServicer)
         metrics = request.optionalMetrics or None
         chromosome_genes = request.chromosomeGenes or None
         chromosome_length = request.chromosomeLength or None
+        chromosome_name = request.chromosomeName or None
+        chromosome_start = None
+        if request.HasField("chromosomeStart"):
+            chromosome_start = request.chromosomeStart
+        chromosome_stop = None
+        if request.HasField("chromosomeStop"):
+            chromosome_stop = request.chromosomeStop
         try:
+            chromosome = self._requestChromosome(request)
             (
                 chromosome,
                 matched,
@@ -64,6 +94,9 @@ class MacroSyntenyBlocks(macrosyntenyblocks_pb2_grpc.MacroSyntenyBlocksServicer)
                 metrics,
                 chromosome_genes,
                 chromosome_length,
+                chromosome_name,
+                chromosome_start,
+                chromosome_stop,
             )
         except Exception:
             # raise a gRPC INVALID ARGUMENT error
@@ -71,7 +104,7 @@ class MacroSyntenyBlocks(macrosyntenyblocks_pb2_grpc.MacroSyntenyBlocksServicer)
                 grpc.StatusCode.INVALID_ARGUMENT,
                 "Required arguments are missing or given arguments have invalid values",
             )
-        blocks = await self.handler.process(
+        return (
             chromosome,
             matched,
             intermediate,
@@ -81,8 +114,33 @@ class MacroSyntenyBlocks(macrosyntenyblocks_pb2_grpc.MacroSyntenyBlocksServicer)
             chromosome_genes,
             chromosome_length,
         )
+
+    # the method that actually handles requests
+    async def _compute(self, request, context):
+        arguments = await self._parseRequest(request, context)
+        try:
+            blocks = await self.handler.process(
+                *arguments, deadline=self._deadline(context)
+            )
+        except QueryNotFoundError as e:
+            # raise a gRPC NOT FOUND error
+            await context.abort(grpc.StatusCode.NOT_FOUND, str(e))
         return macrosyntenyblocks_pb2.MacroSyntenyBlocksComputeReply(blocks=blocks)
 
+    # the method that actually handles streaming requests
+    async def _computeStream(self, request, context):
+        arguments = await self._parseRequest(request, context)
+        StreamReply = macrosyntenyblocks_pb2.MacroSyntenyBlocksComputeStreamReply
+        try:
+            stream = await self.handler.processStream(
+                *arguments, deadline=self._deadline(context)
+            )
+        except QueryNotFoundError as e:
+            # raise a gRPC NOT FOUND error
+            await context.abort(grpc.StatusCode.NOT_FOUND, str(e))
+        async for blocks_object in stream:
+            yield StreamReply(blocks=block_pb2.Blocks(**blocks_object))
+
     # implements the service's API
     async def Compute(self, request, context):
         # subvert the gRPC exception handler via a try/except block
@@ -99,6 +157,22 @@ class MacroSyntenyBlocks(macrosyntenyblocks_pb2_grpc.MacroSyntenyBlocksServicer)
             # return a gRPC INTERNAL error
             await context.abort(grpc.StatusCode.INTERNAL, "Internal server error")
 
+    async def ComputeStream(self, request, context):
+        # subvert the gRPC exception handler via a try/except block
+        try:
+            async for reply in self._computeStream(request, context):
+                yield reply
+        # let errors we raised go by
+        except aio.AbortError as e:
+            raise e
+        # raise an internal error to prevent non-gRPC info from being sent to users
+        except Exception as e:
+            # raise the exception after aborting so it gets logged
+            # NOTE: gRPC docs says abort should raise an error but it doesn't...
+            context.add_done_callback(self._exceptionCallbackFactory(e))
+            # return a gRPC INTERNAL error
+            await context.abort(grpc.StatusCode.INTERNAL, "Internal server error")
+
 
 async def run_grpc_server(host, port, handler):
     server = aio.server()
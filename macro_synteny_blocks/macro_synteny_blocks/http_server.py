@@ -1,11 +1,18 @@
+# Python
+import json
+import logging
+
 # dependencies
 import aiohttp_cors
 from aiohttp import web
 
+# module
+from macro_synteny_blocks.request_handler import QueryNotFoundError
 
-async def http_post_handler(request):
-    # parse the chromosome and parameters from the POST data
-    data = await request.json()
+
+# parses the chromosome and parameters from POST data; raises an error if they're
+# missing or invalid
+def parseData(data, handler):
     # required parameters
     chromosome = data.get("chromosome")
     matched = data.get("matched")
@@ -16,32 +23,10 @@ async def http_post_handler(request):
     metrics = data.get("optionalMetrics", None)
     chromosome_genes = data.get("chromosome_genes", None)
     chromosome_length = data.get("chromosome_length", None)
-    handler = request.app["handler"]
-    try:
-        (
-            chromosome,
-            matched,
-            intermediate,
-            mask,
-            targets,
-            metrics,
-            chromosome_genes,
-            chromosome_length,
-        ) = handler.parseArguments(
-            chromosome,
-            matched,
-            intermediate,
-            mask,
-            targets,
-            metrics,
-            chromosome_genes,
-            chromosome_length,
-        )
-    except Exception:
-        return web.HTTPBadRequest(
-            text="Required arguments are missing or have invalid values"
-        )
-    blocks = await handler.process(
+    chromosome_name = data.get("chromosome_name", None)
+    chromosome_start = data.get("chromosome_start", None)
+    chromosome_stop = data.get("chromosome_stop", None)
+    return handler.parseArguments(
         chromosome,
         matched,
         intermediate,
@@ -50,12 +35,65 @@ async def http_post_handler(request):
         metrics,
         chromosome_genes,
         chromosome_length,
-        grpc_decode=True,
+        chromosome_name,
+        chromosome_start,
+        chromosome_stop,
     )
+
+
+async def http_post_handler(request):
+    data = await request.json()
+    handler = request.app["handler"]
+    try:
+        arguments = parseData(data, handler)
+    except Exception:
+        return web.HTTPBadRequest(
+            text="Required arguments are missing or have invalid values"
+        )
+    try:
+        blocks = await handler.process(*arguments, grpc_decode=True)
+    except QueryNotFoundError as e:
+        return web.HTTPNotFound(text=str(e))
     json = web.json_response({"blocks": blocks})
     return json
 
 
+# streams blocks objects as newline delimited JSON as soon as they're computed; if
+# the computation fails after the stream has started, the last line is an error
+async def http_post_stream_handler(request):
+    data = await request.json()
+    handler = request.app["handler"]
+    try:
+        arguments = parseData(data, handler)
+    except Exception:
+        return web.HTTPBadRequest(
+            text="Required arguments are missing or have invalid values"
+        )
+    try:
+        stream = await handler.processStream(*arguments, grpc_decode=True)
+    except QueryNotFoundError as e:
+        return web.HTTPNotFound(text=str(e))
+    response = web.StreamResponse()
+    response.content_type = "application/x-ndjson"
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+    try:
+        async for blocks in stream:
+            await response.write(json.dumps(blocks).encode() + b"\n")
+    # the status has already been sent, so errors are reported in the stream
+    except Exception as e:
+        logging.error(e)
+        error = {"error": "Internal server error"}
+        await response.write(json.dumps(error).encode() + b"\n")
+    await response.write_eof()
+    return response
+
+
+async def http_get_stats_handler(request):
+    handler = request.app["handler"]
+    return web.json_response(handler.stats())
+
+
 async def run_http_server(host, port, handler):
     # make the app
     app = web.Application()
@@ -73,8 +111,13 @@ async def run_http_server(host, port, handler):
     )
     route = app.router.add_post("/", http_post_handler)
     cors.add(route)
-    # run the app
-    runner = web.AppRunner(app)
+    route = app.router.add_post("/stream", http_post_stream_handler)
+    cors.add(route)
+    route = app.router.add_get("/stats", http_get_stats_handler)
+    cors.add(route)
+    # run the app; handlers are cancelled when their client disconnects so requests
+    # no one is waiting for stop computing
+    runner = web.AppRunner(app, handler_cancellation=True)
     await runner.setup()
     site = web.TCPSite(runner, host, port)
     await site.start()
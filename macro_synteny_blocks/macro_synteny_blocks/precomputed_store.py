@@ -0,0 +1,128 @@
+# Python
+import zlib
+
+# module
+from macro_synteny_blocks.database import (
+    CHROMOSOME_IDS_KEY,
+    precomputedKey,
+    unpackArray,
+)
+
+# isort: off
+# from macro_synteny_blocks.proto.pairwisemacrosyntenyblocks_service.v1
+#   import pairwisemacrosyntenyblocks_pb2
+# NOTE: the following imports are a temporary workaround for a known protobuf
+# bug; the commented imports above should be used when the bug is fixed:
+# https://github.com/protocolbuffers/protobuf/issues/10075
+from macro_synteny_blocks import proto  # noqa: F401
+from pairwisemacrosyntenyblocks_service.v1 import pairwisemacrosyntenyblocks_pb2
+
+# isort: on
+
+
+class PrecomputedStore:
+    """
+    The blocks precomputed by the pairwise macro-synteny blocks microservice's
+    precompute command, which are used to answer queries that refer to a whole
+    chromosome in the database by name instead of computing their blocks. A query's
+    blocks are only used if they were computed with the same parameters since the
+    database was last loaded and every target the query needs was compared to it.
+    """
+
+    def __init__(self, redis_connection):
+        """
+        Parameters:
+          redis_connection (redis.asyncio.Redis): The Redis connection to use.
+        """
+
+        self.redis_connection = redis_connection
+        self.hits = 0
+        self.misses = 0
+
+    async def get(
+        self,
+        name,
+        matched,
+        intermediate,
+        mask,
+        targets,
+        metrics,
+        chromosome_genes,
+        chromosome_length,
+        pair_budget,
+        pair_budget_strategy,
+        load_epoch,
+        num_chromosomes,
+    ):
+        """
+        Gets the precomputed blocks of a query with a single pipelined read.
+
+        Parameters:
+          name (str): The name of the query chromosome.
+          matched, intermediate, mask, targets, metrics, chromosome_genes, and
+            chromosome_length are the parsed arguments of the request.
+          pair_budget (int): The pairwise algorithm's pair budget.
+          pair_budget_strategy (str): The pairwise algorithm's pair budget strategy.
+          load_epoch (str): The current load epoch of the database.
+          num_chromosomes (int): The number of chromosomes in the database, i.e. the
+            number of targets when none are given.
+
+        Returns:
+          list[block_pb2.Blocks]: The blocks of each target that has blocks, or None
+            if the query's blocks haven't been precomputed for all its targets.
+        """
+
+        key = precomputedKey(
+            matched,
+            intermediate,
+            mask,
+            metrics,
+            chromosome_genes,
+            chromosome_length,
+            pair_budget,
+            pair_budget_strategy,
+        )
+        pipeline = self.redis_connection.pipeline(transaction=False)
+        pipeline.hget(key, "epoch")
+        pipeline.execute_command("HGET", f"{key}:blocks", name, NEVER_DECODE=True)
+        pipeline.execute_command("HGET", f"{key}:targets", name, NEVER_DECODE=True)
+        if targets:
+            pipeline.hmget(CHROMOSOME_IDS_KEY, targets)
+        epoch, blocks_data, targets_data, *target_ids = await pipeline.execute()
+        if epoch != load_epoch or blocks_data is None or targets_data is None:
+            self.misses += 1
+            return None
+        # check that every target was compared to the query; targets that aren't in
+        # the database don't have blocks so they don't need to have been compared
+        precomputed_ids = set(unpackArray("i", zlib.decompress(targets_data)))
+        if targets:
+            required_ids = {int(i) for i in target_ids[0] if i is not None}
+        else:
+            required_ids = range(num_chromosomes)
+        if not precomputed_ids.issuperset(required_ids):
+            self.misses += 1
+            return None
+        self.hits += 1
+        ManyReply = (
+            pairwisemacrosyntenyblocks_pb2.PairwiseMacroSyntenyBlocksComputeManyReply
+        )
+        reply = ManyReply.FromString(zlib.decompress(blocks_data))
+        if targets:
+            targets = set(targets)
+            return [blocks for blocks in reply.blocks if blocks.chromosome in targets]
+        return list(reply.blocks)
+
+    def stats(self):
+        """
+        Reports how often queries were answered with precomputed blocks.
+
+        Returns:
+          dict: The store's hits, misses, and hit rate.
+        """
+
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+        }
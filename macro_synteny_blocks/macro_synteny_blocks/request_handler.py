@@ -1,25 +1,119 @@
 # Python
 import asyncio
-from collections import defaultdict
 
-# dependencies
-from redis.commands.search.query import Query
+# isort: split
 
 # module
-from macro_synteny_blocks.aioredisearch import CustomAsyncSearch
-from macro_synteny_blocks.grpc_client import computePairwiseMacroSyntenyBlocks
+from macro_synteny_blocks import embedded_pairwise, grpc_client
+from macro_synteny_blocks.cache import LRUCache
+from macro_synteny_blocks.database import (
+    LOAD_EPOCH_KEY,
+    ChromosomeReference,
+    filterTargets,
+    getChromosomeFamilies,
+    getChromosomeNames,
+    getChromosomeSizes,
+    getFamilyOccurrences,
+)
+from macro_synteny_blocks.precomputed_store import PrecomputedStore
+from macro_synteny_blocks.result_cache import ResultCache
+from macro_synteny_blocks.scheduler import FairScheduler
+
+# isort: off
+# from macro_synteny_blocks.proto.block.v1 import block_pb2
+# NOTE: the following imports are a temporary workaround for a known protobuf
+# bug; the commented imports above should be used when the bug is fixed:
+# https://github.com/protocolbuffers/protobuf/issues/10075
+from macro_synteny_blocks import proto  # noqa: F401
+from block.v1 import block_pb2
+
+# isort: on
+
+
+class QueryNotFoundError(Exception):
+    """
+    The exception to raise when the chromosome a query refers to isn't in the
+    database.
+    """
+
+    pass
 
 
 class RequestHandler:
     def __init__(
         self,
         redis_connection,
-        pairwise_address,
-        breakpoint_characters=",.<>{}[]\"':;!@#$%^&*()-+=~",
+        pairwise_channel_pool,
+        batch_size=100,
+        max_concurrency=16,
+        max_request_concurrency=4,
+        pairwise_handler=None,
+        metadata_cache_size=0,
+        result_cache_size=0,
+        result_cache_ttl=0,
+        query_cache_size=0,
+        use_precomputed=False,
+        pairwise_config=None,
     ):
         self.redis_connection = redis_connection
-        self.pairwise_address = pairwise_address
-        self.breakpoint_characters = set(breakpoint_characters)
+        # blocks are computed by the given pairwise request handler in this process
+        # instead of via the pairwise microservice if a handler is given
+        self.pairwise_channel_pool = pairwise_channel_pool
+        self.pairwise_handler = pairwise_handler
+        self.batch_size = batch_size
+        self.scheduler = FairScheduler(max_concurrency, max_request_concurrency)
+        # the chromosome lengths and gene counts, which are cached until the database
+        # is reloaded, as are the chromosome metadata and referenced query caches
+        self.load_epoch = None
+        self.chromosome_sizes = None
+        self.metadata_cache = LRUCache(metadata_cache_size)
+        self.query_cache = LRUCache(query_cache_size)
+        # whole results are cached in Redis, keyed by the request, the load epoch, and
+        # the settings of the pairwise algorithm, i.e. its chaining engine and pair
+        # budget, and of this handler that affect results
+        self.result_cache = None
+        if result_cache_size > 0:
+            config = {
+                "pairwise": pairwise_config or {},
+                "precomputed": use_precomputed,
+            }
+            self.result_cache = ResultCache(
+                redis_connection, result_cache_size, result_cache_ttl, config
+            )
+        # queries that refer to a whole chromosome by name are optionally answered
+        # with blocks precomputed by the pairwise microservice's precompute command
+        # with the same pairwise settings
+        self.precomputed_store = None
+        self.pairwise_config = pairwise_config or {}
+        if use_precomputed:
+            self.precomputed_store = PrecomputedStore(redis_connection)
+
+    def stats(self):
+        stats = {
+            "scheduler": self.scheduler.stats(),
+            "metadataCache": self.metadata_cache.stats(),
+            "queryCache": self.query_cache.stats(),
+        }
+        if self.result_cache is not None:
+            stats["resultCache"] = self.result_cache.stats()
+        if self.precomputed_store is not None:
+            stats["precomputed"] = self.precomputed_store.stats()
+        if self.pairwise_handler is not None:
+            stats["pairwise"] = self.pairwise_handler.stats()
+        else:
+            stats["pairwiseChannels"] = self.pairwise_channel_pool.stats()
+        return stats
+
+    # parses a query given as a reference to a chromosome in the database
+    def _parseReference(self, chromosome_name, chromosome_start, chromosome_stop):
+        name = str(chromosome_name)
+        start = None if chromosome_start is None else int(chromosome_start)
+        stop = None if chromosome_stop is None else int(chromosome_stop)
+        if (start is not None and start < 0) or (stop is not None and stop < 0):
+            raise ValueError("chromosome start and stop can't be negative")
+        if start is not None and stop is not None and start > stop:
+            raise ValueError("chromosome start can't be greater than stop")
+        return ChromosomeReference(name, start, stop)
 
     def parseArguments(
         self,
@@ -31,8 +125,18 @@ class RequestHandler:
         metrics,
         chromosome_genes,
         chromosome_length,
+        chromosome_name=None,
+        chromosome_start=None,
+        chromosome_stop=None,
     ):
-        iter(chromosome)  # TypeError if not iterable
+        # the query is either a list of functional annotations or a reference to a
+        # chromosome in the database
+        if chromosome_name:
+            chromosome = self._parseReference(
+                chromosome_name, chromosome_start, chromosome_stop
+            )
+        else:
+            iter(chromosome)  # TypeError if not iterable
         if targets is None:
             targets = []
         iter(targets)  # TypeError if not iterable
@@ -76,14 +180,6 @@ class RequestHandler:
             chromosome_length,
         )
 
-    def _cleanTag(self, tag):
-        cleaned_tag = ""
-        for c in tag:
-            if c in self.breakpoint_characters:
-                cleaned_tag += "\\"
-            cleaned_tag += c
-        return cleaned_tag
-
     def _grpcBlockToDictBlock(self, grpc_block):
         dict_block = {
             "i": grpc_block.i,
@@ -96,139 +192,252 @@ class RequestHandler:
             dict_block["optionalMetrics"] = list(grpc_block.optionalMetrics)
         return dict_block
 
-    async def _getTargets(self, targets, chromosome, matched, intermediate):
-        # use a pipeline to reduce the number of calls to database
-        pipeline = self.redis_connection.pipeline()
-        gene_index = CustomAsyncSearch(pipeline, index_name="geneIdx")
+    # gets the chromosome lengths and gene counts, refetching them if the database
+    # has been reloaded since they were cached
+    async def _getChromosomeSizes(self):
+        load_epoch = await self.redis_connection.get(LOAD_EPOCH_KEY)
+        if self.chromosome_sizes is None or load_epoch != self.load_epoch:
+            self.chromosome_sizes = await getChromosomeSizes(self.redis_connection)
+            self.metadata_cache.clear()
+            self.query_cache.clear()
+            self.load_epoch = load_epoch
+        return self.chromosome_sizes
 
-        # get genes for each family and bin them by chromosome
+    async def _getTargets(
+        self,
+        targets,
+        chromosome,
+        matched,
+        intermediate,
+        chromosome_genes,
+        chromosome_length,
+    ):
+        # get the genes in each family from the families' inverted indexes, binned
+        # by chromosome ID, and the sizes of the chromosomes
         families = set(chromosome)
         families.discard("")
-        chromosome_match_indices = defaultdict(list)
-
-        # count how many genes are in each family
-        query_strings = []
-        count_queries = []
-        for family in families:
-            cleaned_family = self._cleanTag(family)
-            query_string = "(@family:{" + cleaned_family + "})"
-            # limit the genes to the target chromosomes
-            if targets:
-                cleaned_targets = map(self._cleanTag, targets)
-                query_string += "(@chromosome:{" + "|".join(cleaned_targets) + "})"
-            query_strings.append(query_string)
-            # count how many genes are in the family
-            query = Query(query_string).verbatim().paging(0, 0)
-            count_queries.append(query)
-            await gene_index.search(query)  # returns the pipeline, not a Result!
-        count_results = await pipeline.execute()
-
-        # get the genes for each family
-        gene_queries = []
-        for family, query_string, query, res in zip(
-            families, query_strings, count_queries, count_results
-        ):
-            result = gene_index.search_result(query, res)
-            num_genes = result.total
-            # get the genes
-            query = (
-                Query(query_string)
-                .verbatim()
-                .return_fields("chromosome", "index")
-                .paging(0, num_genes)
+        chromosome_match_indices, (lengths, gene_counts) = await asyncio.gather(
+            getFamilyOccurrences(self.redis_connection, families, targets),
+            self._getChromosomeSizes(),
+        )
+
+        filtered_ids = filterTargets(
+            chromosome_match_indices,
+            lengths,
+            gene_counts,
+            len(chromosome),
+            matched,
+            intermediate,
+            chromosome_genes,
+            chromosome_length,
+        )
+
+        # get the names of the chromosomes that passed the filter
+        return await getChromosomeNames(self.redis_connection, filtered_ids)
+
+    # gets the genus and species of each of the given chromosomes from the cache or,
+    # for chromosomes that aren't cached, with a single pipelined read
+    async def _getChromosomeMetadata(self, names):
+        metadata = {}
+        uncached = []
+        for name in names:
+            entry = self.metadata_cache.get(name)
+            if entry is None:
+                uncached.append(name)
+            else:
+                metadata[name] = entry
+        if uncached:
+            pipeline = self.redis_connection.pipeline(transaction=False)
+            for name in uncached:
+                pipeline.hmget(f"chromosome:{name}", "genus", "species")
+            results = await pipeline.execute()
+            for name, (genus, species) in zip(uncached, results):
+                metadata[name] = {"genus": genus, "species": species}
+                self.metadata_cache.put(name, metadata[name])
+        return metadata
+
+    def _targetBlocksToBlocksObject(self, target_blocks, metadata, grpc_decode):
+        target = target_blocks.chromosome
+        blocks_object = {
+            "chromosome": target,
+            "genus": metadata[target]["genus"],
+            "species": metadata[target]["species"],
+        }
+        # decode the blocks if not outputting gRPC
+        if grpc_decode:
+            blocks_object["blocks"] = list(
+                map(self._grpcBlockToDictBlock, target_blocks.blocks)
             )
-            gene_queries.append(query)
-            await gene_index.search(query)  # returns the pipeline, not a Result!
-        gene_results = await pipeline.execute()
-
-        # bin the genes by chromosome
-        for query, res in zip(gene_queries, gene_results):
-            result = gene_index.search_result(query, res)
-            for d in result.docs:
-                chromosome_match_indices[d.chromosome].append(int(d.index))
-
-        # sort index lists and filter by match and intermediate parameters
-        filtered_targets = []
-        for name in chromosome_match_indices:
-            num_genes = len(chromosome_match_indices[name])
-            # there's not enough matches on the entire chromosome
-            if num_genes < matched:
-                continue
-            # check blocks of genes that are closes
-            indices = sorted(chromosome_match_indices[name])
-            block = [indices[0]]
-            for j, i in enumerate(indices[1:]):
-                # match is close enough to previous match to add to block
-                if (
-                    intermediate < 1
-                    and (i - block[-1]) / len(chromosome) <= intermediate
-                ) or (intermediate >= 1 and i - block[-1] <= intermediate - 1):
-                    block.append(i)
-                # match is too far away from previous match
-                else:
-                    # save block if it's big enough
-                    if (matched < 1 and len(block) / len(chromosome) >= matched) or (
-                        matched >= 1 and len(block) >= matched
-                    ):
-                        filtered_targets.append(name)
-                        break
-                    # start a new block with the current match
-                    block = [i]
-                    # no need to compute more blocks if none will be large enough
-                    if num_genes - j < matched:
-                        break
-            # save last block if it's big enough
-            if (
-                (matched < 1 and len(block) / len(chromosome) >= matched)
-                or (matched >= 1 and len(block) >= matched)
-                and (not filtered_targets or filtered_targets[-1] != name)
-            ):
-                filtered_targets.append(name)
-
-        return filtered_targets
-
-    async def _computePairwiseBlocks(
+        else:
+            blocks_object["blocks"] = target_blocks.blocks
+        return blocks_object
+
+    # gets the functional annotations of a query that refers to a chromosome in the
+    # database from the cache or the database
+    async def _getReferenceChromosome(self, reference):
+        # clear the cache if the database has been reloaded
+        await self._getChromosomeSizes()
+        chromosome = self.query_cache.get(reference)
+        if chromosome is None:
+            chromosome = await getChromosomeFamilies(self.redis_connection, reference)
+            if chromosome is None:
+                raise QueryNotFoundError(f'Chromosome "{reference.name}" not found')
+            self.query_cache.put(reference, chromosome)
+        return chromosome
+
+    # gets the key of a request's result in the result cache
+    async def _getResultKey(self, *arguments):
+        load_epoch = await self.redis_connection.get(LOAD_EPOCH_KEY)
+        return self.result_cache.key(load_epoch, *arguments)
+
+    # converts cached blocks, which include their genus and species, to blocks
+    # objects
+    def _cachedBlocksToBlocksObjects(self, target_blocks, grpc_decode):
+        metadata = {
+            blocks.chromosome: {"genus": blocks.genus, "species": blocks.species}
+            for blocks in target_blocks
+        }
+        return [
+            self._targetBlocksToBlocksObject(blocks, metadata, grpc_decode)
+            for blocks in target_blocks
+        ]
+
+    # adds the genus and species of each target to its blocks and caches them
+    async def _cacheResult(self, key, target_blocks, metadata):
+        cached_blocks = [
+            block_pb2.Blocks(
+                chromosome=blocks.chromosome,
+                genus=metadata[blocks.chromosome]["genus"],
+                species=metadata[blocks.chromosome]["species"],
+                blocks=blocks.blocks,
+            )
+            for blocks in target_blocks
+        ]
+        await self.result_cache.put(key, cached_blocks)
+
+    # gets the blocks objects of a query that refers to a whole chromosome in the
+    # database from the precomputed blocks, if every target's blocks have been
+    # precomputed with the request's parameters
+    async def _getPrecomputedBlocksObjects(
         self,
-        chromosome,
-        target,
+        reference,
         matched,
         intermediate,
         mask,
+        targets,
         metrics,
         chromosome_genes,
         chromosome_length,
-        chromosome_index,
         grpc_decode,
     ):
-        # compute the blocks for the target chromosome
-        blocks = await computePairwiseMacroSyntenyBlocks(
-            chromosome,
-            target,
+        if (
+            self.precomputed_store is None
+            or reference.start is not None
+            or reference.stop is not None
+        ):
+            return None
+        # refresh the load epoch if the database has been reloaded
+        lengths, _ = await self._getChromosomeSizes()
+        target_blocks = await self.precomputed_store.get(
+            reference.name,
             matched,
             intermediate,
             mask,
+            targets,
             metrics,
             chromosome_genes,
             chromosome_length,
-            self.pairwise_address,
+            self.pairwise_config.get("pairBudget", 0),
+            self.pairwise_config.get("pairBudgetStrategy", "mask"),
+            self.load_epoch,
+            len(lengths),
         )
-        if not blocks:  # true for None or []
+        if target_blocks is None:
             return None
-        # fetch the chromosome object
-        doc = await chromosome_index.load_document(f"chromosome:{target}")
-        blocks_object = {
-            "chromosome": target,
-            "genus": doc.genus,
-            "species": doc.species,
-        }
-        # decode the blocks if not outputting gRPC
-        if grpc_decode:
-            blocks_object["blocks"] = list(map(self._grpcBlockToDictBlock, blocks))
-        else:
-            blocks_object["blocks"] = blocks
-        return blocks_object
+        metadata = await self._getChromosomeMetadata(
+            [blocks.chromosome for blocks in target_blocks]
+        )
+        return [
+            self._targetBlocksToBlocksObject(blocks, metadata, grpc_decode)
+            for blocks in target_blocks
+        ]
 
-    async def process(
+    # gets the module that computes blocks and the handler or channel pool it computes
+    # them with, depending on whether the pairwise microservice is embedded
+    def _pairwiseClient(self):
+        if self.pairwise_handler is not None:
+            return embedded_pairwise, self.pairwise_handler
+        return grpc_client, self.pairwise_channel_pool
+
+    # computes the blocks of a batch of targets once the scheduler grants the
+    # request a slot, so the pairwise microservice isn't flooded
+    async def _computeBatch(
+        self,
+        request,
+        chromosome,
+        targets,
+        matched,
+        intermediate,
+        mask,
+        metrics,
+        chromosome_genes,
+        chromosome_length,
+        deadline,
+    ):
+        client, pairwise = self._pairwiseClient()
+        async with self.scheduler.slot(request):
+            target_blocks = await client.computeManyPairwiseMacroSyntenyBlocks(
+                chromosome,
+                targets,
+                matched,
+                intermediate,
+                mask,
+                metrics,
+                chromosome_genes,
+                chromosome_length,
+                pairwise,
+                deadline=deadline,
+            )
+        return target_blocks  # None if the computation failed
+
+    # streams the blocks of a batch of targets into a queue as they're computed once
+    # the scheduler grants the request a slot
+    async def _streamBatch(
+        self,
+        request,
+        queue,
+        chromosome,
+        targets,
+        matched,
+        intermediate,
+        mask,
+        metrics,
+        chromosome_genes,
+        chromosome_length,
+        deadline,
+    ):
+        client, pairwise = self._pairwiseClient()
+        async with self.scheduler.slot(request):
+            stream = client.streamPairwiseMacroSyntenyBlocks(
+                chromosome,
+                targets,
+                matched,
+                intermediate,
+                mask,
+                metrics,
+                chromosome_genes,
+                chromosome_length,
+                pairwise,
+                deadline=deadline,
+            )
+            async for blocks in stream:
+                await queue.put(blocks)
+
+    # returns an async iterator that yields blocks objects as soon as the pairwise
+    # computations of their targets finish; a target's blocks may be split across
+    # several objects. If a batch fails, the iterator raises its error after the
+    # other batches' blocks have been yielded. The deadline is the same as process's
+    async def processStream(
         self,
         chromosome,
         matched,
@@ -239,34 +448,214 @@ class RequestHandler:
         chromosome_genes,
         chromosome_length,
         grpc_decode=False,
+        deadline=None,
     ):
-        # connect to the index
-        chromosome_index = CustomAsyncSearch(
-            self.redis_connection, index_name="chromosomeIdx"
+        # referenced queries are resolved to their annotations for choosing targets
+        # but are given to the pairwise microservice as is
+        query = chromosome
+        if isinstance(chromosome, ChromosomeReference):
+            blocks_objects = await self._getPrecomputedBlocksObjects(
+                chromosome,
+                matched,
+                intermediate,
+                mask,
+                targets,
+                metrics,
+                chromosome_genes,
+                chromosome_length,
+                grpc_decode,
+            )
+            if blocks_objects is not None:
+
+                async def streamPrecomputedBlocks():
+                    for blocks_object in blocks_objects:
+                        yield blocks_object
+
+                return streamPrecomputedBlocks()
+            chromosome = await self._getReferenceChromosome(chromosome)
+        # stream a cached result all at once; results are only cached by process
+        if self.result_cache is not None:
+            result_key = await self._getResultKey(
+                chromosome,
+                matched,
+                intermediate,
+                mask,
+                targets,
+                metrics,
+                chromosome_genes,
+                chromosome_length,
+            )
+            target_blocks = await self.result_cache.get(result_key)
+            if target_blocks is not None:
+
+                async def streamCachedBlocks():
+                    for blocks_object in self._cachedBlocksToBlocksObjects(
+                        target_blocks, grpc_decode
+                    ):
+                        yield blocks_object
+
+                return streamCachedBlocks()
+
+        # get the targets before streaming so errors are raised before any output
+        filtered_targets = await self._getTargets(
+            targets,
+            chromosome,
+            matched,
+            intermediate,
+            chromosome_genes,
+            chromosome_length,
         )
+
+        async def streamBlocks():
+            if not filtered_targets:
+                return
+            batches = [
+                filtered_targets[i : i + self.batch_size]
+                for i in range(0, len(filtered_targets), self.batch_size)
+            ]
+            queue = asyncio.Queue()
+            with self.scheduler.request() as request:
+                tasks = [
+                    asyncio.create_task(
+                        self._streamBatch(
+                            request,
+                            queue,
+                            query,
+                            batch,
+                            matched,
+                            intermediate,
+                            mask,
+                            metrics,
+                            chromosome_genes,
+                            chromosome_length,
+                            deadline,
+                        )
+                    )
+                    for batch in batches
+                ]
+                # signal the end of the stream once every batch is done
+                done = asyncio.gather(*tasks, return_exceptions=True)
+                done.add_done_callback(lambda _: queue.put_nowait(None))
+                try:
+                    while True:
+                        blocks = await queue.get()
+                        if blocks is None:
+                            break
+                        metadata = await self._getChromosomeMetadata(
+                            [blocks.chromosome]
+                        )
+                        yield self._targetBlocksToBlocksObject(
+                            blocks, metadata, grpc_decode
+                        )
+                    # end the stream with the first failed batch's error so it isn't
+                    # mistaken for a complete result
+                    for result in await done:
+                        if isinstance(result, Exception):
+                            raise result
+                # stop computing if the stream is closed early, e.g. the client
+                # disconnected
+                finally:
+                    for task in tasks:
+                        task.cancel()
+
+        return streamBlocks()
+
+    # computes the blocks of every target; the optional deadline, in seconds since
+    # the epoch, is propagated to the pairwise computations so they stop when the
+    # client stops waiting for them
+    async def process(
+        self,
+        chromosome,
+        matched,
+        intermediate,
+        mask,
+        targets,
+        metrics,
+        chromosome_genes,
+        chromosome_length,
+        grpc_decode=False,
+        deadline=None,
+    ):
+        # referenced queries are resolved to their annotations for choosing targets
+        # but are given to the pairwise microservice as is
+        query = chromosome
+        if isinstance(chromosome, ChromosomeReference):
+            blocks_objects = await self._getPrecomputedBlocksObjects(
+                chromosome,
+                matched,
+                intermediate,
+                mask,
+                targets,
+                metrics,
+                chromosome_genes,
+                chromosome_length,
+                grpc_decode,
+            )
+            if blocks_objects is not None:
+                return blocks_objects
+            chromosome = await self._getReferenceChromosome(chromosome)
+        # skip target selection and the pairwise computations if the result is cached
+        result_key = None
+        if self.result_cache is not None:
+            result_key = await self._getResultKey(
+                chromosome,
+                matched,
+                intermediate,
+                mask,
+                targets,
+                metrics,
+                chromosome_genes,
+                chromosome_length,
+            )
+            target_blocks = await self.result_cache.get(result_key)
+            if target_blocks is not None:
+                return self._cachedBlocksToBlocksObjects(target_blocks, grpc_decode)
         # get all chromosome names if no targets are specified
         filtered_targets = await self._getTargets(
-            targets, chromosome, matched, intermediate
+            targets,
+            chromosome,
+            matched,
+            intermediate,
+            chromosome_genes,
+            chromosome_length,
         )
-        # compute blocks for each chromosome that is large enough
-        target_blocks = await asyncio.gather(
-            *[
-                self._computePairwiseBlocks(
-                    chromosome,
-                    name,
-                    matched,
-                    intermediate,
-                    mask,
-                    metrics,
-                    chromosome_genes,
-                    chromosome_length,
-                    chromosome_index,
-                    grpc_decode,
-                )
-                for name in filtered_targets
-            ]
+        if not filtered_targets:
+            return []
+        # compute blocks for the chromosomes in batches; targets that are too small or
+        # that don't have any blocks are omitted from the result
+        batches = [
+            filtered_targets[i : i + self.batch_size]
+            for i in range(0, len(filtered_targets), self.batch_size)
+        ]
+        with self.scheduler.request() as request:
+            batches_blocks = await asyncio.gather(
+                *[
+                    self._computeBatch(
+                        request,
+                        query,
+                        batch,
+                        matched,
+                        intermediate,
+                        mask,
+                        metrics,
+                        chromosome_genes,
+                        chromosome_length,
+                        deadline,
+                    )
+                    for batch in batches
+                ]
+            )
+        target_blocks = [blocks for batch in batches_blocks for blocks in batch or []]
+        # get the metadata of all the chromosomes with blocks at once
+        metadata = await self._getChromosomeMetadata(
+            [blocks.chromosome for blocks in target_blocks]
         )
-        # remove the targets that didn't return any blocks
-        filtered_target_blocks = list(filter(lambda b: b is not None, target_blocks))
+        # don't cache the result if a batch failed since it's incomplete
+        if result_key is not None and None not in batches_blocks:
+            await self._cacheResult(result_key, target_blocks, metadata)
+        blocks_objects = [
+            self._targetBlocksToBlocksObject(blocks, metadata, grpc_decode)
+            for blocks in target_blocks
+        ]
 
-        return filtered_target_blocks
+        return blocks_objects
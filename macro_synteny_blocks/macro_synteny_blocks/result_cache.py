@@ -0,0 +1,171 @@
+# Python
+import hashlib
+import json
+import time
+import zlib
+
+# module
+# isort: off
+# from macro_synteny_blocks.proto.macrosyntenyblocks_service.v1
+#   import macrosyntenyblocks_pb2
+# NOTE: the following imports are a temporary workaround for a known protobuf
+# bug; the commented imports above should be used when the bug is fixed:
+# https://github.com/protocolbuffers/protobuf/issues/10075
+from macro_synteny_blocks import proto  # noqa: F401
+from macrosyntenyblocks_service.v1 import macrosyntenyblocks_pb2
+
+# isort: on
+
+RESULT_KEY_PREFIX = "macro-synteny-blocks:results"
+RESULT_INDEX_KEY = f"{RESULT_KEY_PREFIX}:index"
+
+
+class ResultCache:
+    """
+    A cache of macro-synteny blocks results that's stored in Redis so it's shared by
+    every instance of the microservice. Results are keyed by a hash of their
+    canonical request, the database's load epoch, and the settings of the server that
+    affect results, so reloading the database or changing the settings invalidates
+    them, and are stored as compressed serialized gRPC messages. Entries
+    expire when they haven't been used for a given number of seconds and the least
+    recently used entries are evicted when the cache holds too many.
+    """
+
+    def __init__(self, redis_connection, maxsize, ttl, config=None):
+        """
+        Parameters:
+          redis_connection (redis.asyncio.Redis): The Redis connection to use.
+          maxsize (int): The maximum number of results in the cache.
+          ttl (int): The number of seconds an unused result is kept; 0 keeps results
+            until they're evicted.
+          config (dict): The JSON serializable settings of the server that affect
+            results; results computed with other settings aren't used.
+        """
+
+        self.redis_connection = redis_connection
+        self.config = config or {}
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def key(
+        self,
+        load_epoch,
+        chromosome,
+        matched,
+        intermediate,
+        mask,
+        targets,
+        metrics,
+        chromosome_genes,
+        chromosome_length,
+    ):
+        """
+        Computes the key of a request's result from the request, the load epoch, and
+        the cache's config. The order of the targets doesn't affect the result so it
+        doesn't affect the key.
+
+        Parameters:
+          load_epoch (str): The load epoch of the database.
+          The remaining parameters are the parsed arguments of the request.
+
+        Returns:
+          str: The key of the result.
+        """
+
+        request = [
+            self.config,
+            load_epoch,
+            list(chromosome),
+            matched,
+            intermediate,
+            mask,
+            sorted(set(targets)),
+            list(metrics),
+            chromosome_genes,
+            chromosome_length,
+        ]
+        canonical = json.dumps(request, separators=(",", ":"))
+        digest = hashlib.sha256(canonical.encode()).hexdigest()
+        return f"{RESULT_KEY_PREFIX}:{digest}"
+
+    async def get(self, key):
+        """
+        Gets a result from the cache and marks it as the most recently used.
+
+        Parameters:
+          key (str): The key of the result.
+
+        Returns:
+          list[block_pb2.Blocks]: The blocks of each target in the result, including
+            each target's genus and species, or None if the result isn't cached.
+        """
+
+        pipeline = self.redis_connection.pipeline(transaction=False)
+        pipeline.execute_command("GET", key, NEVER_DECODE=True)
+        if self.ttl:
+            pipeline.expire(key, self.ttl)
+        data, *_ = await pipeline.execute()
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        await self.redis_connection.zadd(RESULT_INDEX_KEY, {key: time.time()})
+        reply = macrosyntenyblocks_pb2.MacroSyntenyBlocksComputeReply.FromString(
+            zlib.decompress(data)
+        )
+        return list(reply.blocks)
+
+    async def put(self, key, blocks):
+        """
+        Adds a result to the cache, evicting the least recently used results if the
+        cache is full.
+
+        Parameters:
+          key (str): The key of the result.
+          blocks (list[block_pb2.Blocks]): The blocks of each target in the result,
+            including each target's genus and species.
+        """
+
+        reply = macrosyntenyblocks_pb2.MacroSyntenyBlocksComputeReply(blocks=blocks)
+        data = zlib.compress(reply.SerializeToString())
+        now = time.time()
+        pipeline = self.redis_connection.pipeline(transaction=False)
+        pipeline.set(key, data, ex=self.ttl or None)
+        pipeline.zadd(RESULT_INDEX_KEY, {key: now})
+        # forget results that have expired
+        if self.ttl:
+            pipeline.zremrangebyscore(RESULT_INDEX_KEY, "-inf", now - self.ttl)
+        pipeline.zcard(RESULT_INDEX_KEY)
+        *_, size = await pipeline.execute()
+        self.stores += 1
+        if size > self.maxsize:
+            evicted = await self.redis_connection.zpopmin(
+                RESULT_INDEX_KEY, size - self.maxsize
+            )
+            if evicted:
+                await self.redis_connection.delete(*[key for key, _ in evicted])
+                self.evictions += len(evicted)
+
+    def stats(self):
+        """
+        Reports the performance of the cache in this process.
+
+        Returns:
+          dict: The cache's maximum size, TTL, hits, misses, hit rate, stores, and
+            evictions.
+        """
+
+        lookups = self.hits + self.misses
+        return {
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,155 @@
+# Python
+import asyncio
+import contextlib
+from collections import deque
+
+
+class _Request:
+    """
+    The scheduling state of a single request.
+    """
+
+    def __init__(self):
+        self.active = 0
+        self.waiters = deque()
+
+
+class FairScheduler:
+    """
+    Bounds how many tasks may run concurrently, both in total and per request. When
+    tasks are waiting, freed slots are granted to the waiting requests in round robin
+    order, so a request with many tasks can't starve requests with few tasks.
+    """
+
+    def __init__(self, max_concurrency, max_request_concurrency):
+        """
+        Parameters:
+          max_concurrency (int): The maximum number of tasks that may run at once
+            across all requests.
+          max_request_concurrency (int): The maximum number of tasks a single request
+            may run at once.
+        """
+
+        if max_concurrency <= 0 or max_request_concurrency <= 0:
+            raise ValueError("concurrency limits must be positive")
+        self.max_concurrency = max_concurrency
+        self.max_request_concurrency = max_request_concurrency
+        self.active = 0
+        # the requests with waiting tasks, in the order they'll be granted slots
+        self.waiting = deque()
+        self.requests = 0
+        self.granted = 0
+        self.queued = 0
+        self.max_queued = 0
+
+    @contextlib.contextmanager
+    def request(self):
+        """
+        Registers a request with the scheduler for the duration of the context.
+
+        Returns:
+          object: The request's handle, to be passed to slot.
+        """
+
+        self.requests += 1
+        try:
+            yield _Request()
+        finally:
+            self.requests -= 1
+
+    def _grant(self, request):
+        self.active += 1
+        request.active += 1
+        self.granted += 1
+
+    def _hasCapacity(self, request):
+        return (
+            self.active < self.max_concurrency
+            and request.active < self.max_request_concurrency
+        )
+
+    # grants free slots to waiting tasks, one request at a time in round robin order
+    def _dispatch(self):
+        skipped = 0
+        while self.waiting and self.active < self.max_concurrency:
+            # every waiting request is at its own limit
+            if skipped == len(self.waiting):
+                break
+            request = self.waiting.popleft()
+            # drop waiters that were cancelled while queued
+            while request.waiters and request.waiters[0].cancelled():
+                request.waiters.popleft()
+                self.queued -= 1
+            if not request.waiters:
+                skipped = 0
+                continue
+            if request.active >= self.max_request_concurrency:
+                self.waiting.append(request)
+                skipped += 1
+                continue
+            skipped = 0
+            waiter = request.waiters.popleft()
+            self.queued -= 1
+            self._grant(request)
+            waiter.set_result(None)
+            if request.waiters:
+                self.waiting.append(request)
+
+    def _release(self, request):
+        self.active -= 1
+        request.active -= 1
+        self._dispatch()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, request):
+        """
+        Waits until the request may run another task and holds the slot for the
+        duration of the context.
+
+        Parameters:
+          request (object): The handle of the request the task belongs to.
+        """
+
+        # tasks only skip the queue if no other task is waiting for a slot
+        if not self.waiting and self._hasCapacity(request):
+            self._grant(request)
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            if not request.waiters:
+                self.waiting.append(request)
+            request.waiters.append(waiter)
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+            # the waiting requests may all be at their own limits
+            self._dispatch()
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # the slot was granted just before the task was cancelled
+                if waiter.done() and not waiter.cancelled():
+                    self._release(request)
+                else:
+                    self._dispatch()
+                raise
+        try:
+            yield
+        finally:
+            self._release(request)
+
+    def stats(self):
+        """
+        Gets the scheduler's concurrency metrics.
+
+        Returns:
+          dict: The scheduler's metrics.
+        """
+
+        return {
+            "maxConcurrency": self.max_concurrency,
+            "maxRequestConcurrency": self.max_request_concurrency,
+            "requests": self.requests,
+            "active": self.active,
+            "queued": self.queued,
+            "maxQueued": self.max_queued,
+            "granted": self.granted,
+        }
@@ -1,3 +1,8 @@
+# Python
+import sys
+from array import array
+from collections import defaultdict
+
 # dependencies
 import redis.asyncio as redis
 
@@ -5,6 +10,8 @@ import redis.asyncio as redis
 import micro_synteny_search
 
 COMPATIBLE_KEY = "GCV_COMPATIBLE_SCHEMA_VERSIONS"
+CHROMOSOME_IDS_KEY = "chromosomes:ids"
+CHROMOSOME_NAMES_KEY = "chromosomes:names"
 
 
 class SchemaVersionError(Exception):
@@ -33,3 +40,69 @@ async def connectToRedis(host="localhost", port=6379, db=0, password=None):
         )
         raise SchemaVersionError(message)
     return connection
+
+
+# decodes a binary string of packed little-endian integers into an array
+def unpackArray(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+async def getFamilyOccurrences(connection, families, chromosomes=None):
+    """
+    Gets the genes in the given families from the families' inverted indexes in a
+    single pipelined read.
+
+    Parameters:
+      connection (redis.asyncio.Redis): The Redis connection to use.
+      families (iterable[str]): The names of the families.
+      chromosomes (list[str]): The names of the chromosomes to limit the genes to;
+        all chromosomes if None or empty.
+
+    Returns:
+      dict[int, list[int]]: A dictionary mapping the ID of each chromosome that has
+        genes in the families to the indexes of the genes.
+    """
+
+    pipeline = connection.pipeline(transaction=False)
+    if chromosomes:
+        pipeline.hmget(CHROMOSOME_IDS_KEY, chromosomes)
+    for family in families:
+        key = f"family:{family}:occurrences"
+        pipeline.execute_command("GET", key, NEVER_DECODE=True)
+    results = await pipeline.execute()
+    chromosome_ids = None
+    if chromosomes:
+        chromosome_ids = {int(i) for i in results.pop(0) if i is not None}
+    # bin the genes by chromosome
+    chromosome_indexes = defaultdict(list)
+    for data in results:
+        if data is None:
+            continue
+        occurrences = unpackArray("i", data)
+        for chromosome_id, index in zip(occurrences[::2], occurrences[1::2]):
+            if chromosome_ids is None or chromosome_id in chromosome_ids:
+                chromosome_indexes[chromosome_id].append(index)
+    return chromosome_indexes
+
+
+async def getChromosomeNames(connection, chromosome_ids):
+    """
+    Gets the names of the chromosomes with the given IDs.
+
+    Parameters:
+      connection (redis.asyncio.Redis): The Redis connection to use.
+      chromosome_ids (iterable[int]): The IDs of the chromosomes.
+
+    Returns:
+      list[str]: The names of the chromosomes, in the order of their IDs, where
+        IDs that aren't in the database have None.
+    """
+
+    pipeline = connection.pipeline(transaction=False)
+    for chromosome_id in chromosome_ids:
+        pipeline.lindex(CHROMOSOME_NAMES_KEY, chromosome_id)
+    return await pipeline.execute()
@@ -35,6 +35,25 @@ class MicroSyntenySearch(microsyntenysearch_pb2_grpc.MicroSyntenySearchServicer)
 
         return exceptionCallback
 
+    # makes a track message, dictionary encoding its families if requested
+    def _trackMessage(self, track, dictionary_encode_families):
+        if not dictionary_encode_families:
+            return track_pb2.Track(
+                genus=track["genus"],
+                species=track["species"],
+                genes=track["genes"],
+                families=track["families"],
+            )
+        dictionary = {}
+        indexes = [dictionary.setdefault(f, len(dictionary)) for f in track["families"]]
+        return track_pb2.Track(
+            genus=track["genus"],
+            species=track["species"],
+            genes=track["genes"],
+            familyDictionary=list(dictionary),
+            familyIndexes=indexes,
+        )
+
     # the method that actually handles requests
     async def _search(self, request, context):
         query = request.query
@@ -53,12 +72,7 @@ class MicroSyntenySearch(microsyntenysearch_pb2_grpc.MicroSyntenySearchServicer)
             map(
                 lambda t: track_pb2.MicroTrack(
                     name=t["name"],
-                    track=track_pb2.Track(
-                        genus=t["genus"],
-                        species=t["species"],
-                        genes=t["genes"],
-                        families=t["families"],
-                    ),
+                    track=self._trackMessage(t, request.dictionaryEncodeFamilies),
                 ),
                 tracks,
             )
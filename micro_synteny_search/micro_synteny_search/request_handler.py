@@ -3,18 +3,16 @@ import asyncio
 from collections import defaultdict
 from itertools import chain
 
+# dependencies
 from redis.commands.search import AsyncSearch
 
-# dependencies
-from redis.commands.search.query import Query
+# module
+from micro_synteny_search.database import getChromosomeNames, getFamilyOccurrences
 
 
 class RequestHandler:
-    def __init__(
-        self, redis_connection, breakpoint_characters=",.<>{}[]\"':;!@#$%^&*()-+=~"
-    ):
+    def __init__(self, redis_connection):
         self.redis_connection = redis_connection
-        self.breakpoint_characters = set(breakpoint_characters)
 
     def parseArguments(self, query_track, matched, intermediate):
         iter(query_track)  # TypeError if not iterable
@@ -52,30 +50,14 @@ class RequestHandler:
         )
         return tracks
 
-    async def _queryToChromosomeGeneMatchIndexes(self, query_track, gene_index):
+    async def _queryToChromosomeGeneMatchIndexes(self, query_track):
         families = set(query_track)
         families.discard("")
-        chromosome_match_indices = defaultdict(list)
-        for family in families:
-            cleaned_family = ""
-            for c in family:
-                if c in self.breakpoint_characters:
-                    cleaned_family += "\\"
-                cleaned_family += c
-            # count how many genes are in the family
-            query_string = "@family:{" + cleaned_family + "}"
-            query = Query(query_string).paging(0, 0)
-            result = await gene_index.search(query)
-            num_genes = result.total
-            # get the genes
-            query = (
-                Query(query_string)
-                .return_fields("chromosome", "index")
-                .paging(0, num_genes)
-            )
-            result = await gene_index.search(query)
-            for d in result.docs:
-                chromosome_match_indices[d.chromosome].append(int(d.index))
+        # get the genes in each family from the families' inverted indexes, binned
+        # by chromosome ID
+        chromosome_match_indices = await getFamilyOccurrences(
+            self.redis_connection, families
+        )
         return chromosome_match_indices
 
     async def _chromosomeGeneIndexesToBlocks(
@@ -111,19 +93,28 @@ class RequestHandler:
 
     async def process(self, query_track, matched, intermediate):
         # connect to the index
-        gene_index = AsyncSearch(self.redis_connection, index_name="geneIdx")
         chromosome_index = AsyncSearch(
             self.redis_connection, index_name="chromosomeIdx"
         )
-        # search the gene index
-        # TODO: is there a way to query for all genes exactly at once?
+        # get the genes that match the query's families
         chromosome_match_indexes = await self._queryToChromosomeGeneMatchIndexes(
-            query_track, gene_index
+            query_track
         )
         # compute micro-synteny blocks
-        blocks = await self._chromosomeGeneIndexesToBlocks(
+        chromosome_id_blocks = await self._chromosomeGeneIndexesToBlocks(
             query_track, chromosome_match_indexes, matched, intermediate
         )
+        # get the names of the chromosomes with blocks, skipping IDs that don't
+        # resolve to a name, e.g. if the database was reloaded mid-request
+        chromosome_ids = list(chromosome_id_blocks.keys())
+        chromosome_names = await getChromosomeNames(
+            self.redis_connection, chromosome_ids
+        )
+        blocks = {
+            name: chromosome_id_blocks[chromosome_id]
+            for chromosome_id, name in zip(chromosome_ids, chromosome_names)
+            if name is not None
+        }
         # fetch result tracks
         block_tracks = await asyncio.gather(
             *[
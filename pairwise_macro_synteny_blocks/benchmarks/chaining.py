@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+# Benchmarks the pairwise chaining engines against the reference recurrence on
+# pathological inputs, i.e. dense tandem arrays where every copy of a family on
+# the query matches every copy on the target. Run from the microservice's root
+# directory:
+#
+#     $ python -m benchmarks.chaining --copies 50 100 200 --intermediate 5 10
+
+# Python
+import argparse
+import random
+import time
+
+# module
+from pairwise_macro_synteny_blocks.chaining import CHAINING_ENGINES
+from pairwise_macro_synteny_blocks.request_handler import RequestHandler
+
+
+def tandemChromosomes(copies, length, seed):
+    """
+    Generates a query and target chromosome of family IDs that share a random
+    background of single-copy families with a tandem array of one family in the
+    middle.
+
+    Parameters:
+      copies (int): The number of copies in each tandem array.
+      length (int): The number of single-copy genes flanking the tandem arrays.
+      seed (int): The seed for the random number generator.
+
+    Returns:
+      list[int]: The query chromosome.
+      list[int]: The target chromosome.
+    """
+
+    rng = random.Random(seed)
+    background = list(range(length))
+    rng.shuffle(background)
+    half = length // 2
+    tandem = [length] * copies
+    query = background[:half] + tandem + background[half:]
+    target = background[:half] + tandem + background[half:]
+    return query, target
+
+
+def timeEngine(engine, pairs, intermediate, matched):
+    start = time.perf_counter()
+    blocks = list(engine(pairs, intermediate, matched))
+    return time.perf_counter() - start, blocks
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the pairwise chaining engines on tandem arrays.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--copies",
+        type=int,
+        nargs="+",
+        default=[25, 50, 100, 200],
+        help="The tandem array sizes to benchmark.",
+    )
+    parser.add_argument(
+        "--intermediate",
+        type=int,
+        nargs="+",
+        default=[5, 10],
+        help="The intermediate values to benchmark.",
+    )
+    parser.add_argument(
+        "--matched", type=int, default=10, help="The matched value to use."
+    )
+    parser.add_argument(
+        "--length",
+        type=int,
+        default=2000,
+        help="The number of single-copy genes flanking the tandem arrays.",
+    )
+    parser.add_argument(
+        "--max-reference-pairs",
+        type=int,
+        default=100000,
+        help="Skip the reference recurrence on inputs with more pairs than this.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="The random seed.")
+    return parser.parse_args()
+
+
+def main():
+    args = parseArgs()
+    handler = RequestHandler(None)
+    engines = {"python": handler._indexPairsToIndexBlocks, **CHAINING_ENGINES}
+    print("copies\tintermediate\tpairs\tengine\tseconds\tblocks\tidentical")
+    for copies in args.copies:
+        query, target = tandemChromosomes(copies, args.length, args.seed)
+        pairs, _ = handler._chromosomesToIndexPairs(query, target, float("inf"))
+        for intermediate in args.intermediate:
+            reference = None
+            for name, engine in engines.items():
+                if name == "python" and len(pairs) > args.max_reference_pairs:
+                    continue
+                seconds, blocks = timeEngine(engine, pairs, intermediate, args.matched)
+                if reference is None:
+                    reference = blocks
+                identical = blocks == reference
+                print(
+                    f"{copies}\t{intermediate}\t{len(pairs)}\t{name}\t{seconds:.3f}"
+                    f"\t{len(blocks)}\t{identical}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+# Benchmarks the size and the encode and decode times of the query annotations of a
+# ComputeMany request sent as a list of strings versus dictionary encoded as the
+# distinct annotations and packed indexes into them. Track messages use the same
+# encodings so they scale the same way. Run from the microservice's root directory
+# once the protos have been compiled:
+#
+#     $ python -m benchmarks.encoding --length 1000 10000 50000
+
+# Python
+import argparse
+import random
+import statistics
+import time
+
+# module
+# isort: off
+# from pairwise_macro_synteny_blocks.proto.pairwisemacrosyntenyblocks_service.v1
+#   import pairwisemacrosyntenyblocks_pb2
+# NOTE: the following imports are a temporary workaround for a known protobuf
+# bug; the commented imports above should be used when the bug is fixed:
+# https://github.com/protocolbuffers/protobuf/issues/10075
+from pairwise_macro_synteny_blocks import proto  # noqa: F401
+from pairwisemacrosyntenyblocks_service.v1 import pairwisemacrosyntenyblocks_pb2
+
+# isort: on
+
+ManyRequest = (
+    pairwisemacrosyntenyblocks_pb2.PairwiseMacroSyntenyBlocksComputeManyRequest
+)
+
+
+def syntheticChromosome(length, genes_per_family, orphan_rate, seed):
+    """
+    Generates a chromosome as a list of annotations named like the gene families in
+    the database.
+
+    Parameters:
+      length (int): The number of genes on the chromosome.
+      genes_per_family (float): The average number of genes in each family.
+      orphan_rate (float): The fraction of genes that aren't in a family.
+      seed (int): The seed for the random number generator.
+
+    Returns:
+      list[str]: The chromosome.
+    """
+
+    rng = random.Random(seed)
+    num_families = max(1, int(length / genes_per_family))
+    families = [f"legfed_v1_{rng.randrange(10**7):07d}" for _ in range(num_families)]
+    return [
+        "" if rng.random() < orphan_rate else rng.choice(families)
+        for _ in range(length)
+    ]
+
+
+def encodeStrings(chromosome, targets):
+    request = ManyRequest(
+        chromosome=chromosome, targets=targets, matched=10, intermediate=5
+    )
+    return request.SerializeToString()
+
+
+def decodeStrings(data):
+    request = ManyRequest.FromString(data)
+    return list(request.chromosome)
+
+
+def encodeDictionary(chromosome, targets):
+    dictionary = {}
+    indexes = [dictionary.setdefault(f, len(dictionary)) for f in chromosome]
+    request = ManyRequest(
+        chromosomeFamilyDictionary=list(dictionary),
+        chromosomeFamilyIndexes=indexes,
+        targets=targets,
+        matched=10,
+        intermediate=5,
+    )
+    return request.SerializeToString()
+
+
+def decodeDictionary(data):
+    request = ManyRequest.FromString(data)
+    dictionary = list(request.chromosomeFamilyDictionary)
+    return list(map(dictionary.__getitem__, request.chromosomeFamilyIndexes))
+
+
+ENCODINGS = {
+    "strings": (encodeStrings, decodeStrings),
+    "dictionary": (encodeDictionary, decodeDictionary),
+}
+
+
+def timeFunction(function, repeats, *args):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Benchmarks the string and dictionary encodings of query annotations."
+        ),
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--length",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 50000],
+        help="The numbers of genes on the query chromosome to benchmark.",
+    )
+    parser.add_argument(
+        "--genes-per-family",
+        type=float,
+        nargs="+",
+        default=[1.5, 5.0],
+        help="The average numbers of genes in each family to benchmark.",
+    )
+    parser.add_argument(
+        "--orphan-rate",
+        type=float,
+        default=0.1,
+        help="The fraction of genes that aren't in a family.",
+    )
+    parser.add_argument(
+        "--targets",
+        type=int,
+        default=100,
+        help="The number of targets in each request, i.e. the batch size.",
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=20,
+        help="The number of times each encoding is timed; the median is reported.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="The random seed.")
+    return parser.parse_args()
+
+
+def main():
+    args = parseArgs()
+    targets = [f"chromosome{i}" for i in range(args.targets)]
+    print(
+        "length\tgenesPerFamily\tencoding\tbytes\tencodeSeconds\tdecodeSeconds"
+        "\tidentical"
+    )
+    for length in args.length:
+        for genes_per_family in args.genes_per_family:
+            chromosome = syntheticChromosome(
+                length, genes_per_family, args.orphan_rate, args.seed
+            )
+            for name, (encode, decode) in ENCODINGS.items():
+                encode_seconds, data = timeFunction(
+                    encode, args.repeats, chromosome, targets
+                )
+                decode_seconds, decoded = timeFunction(decode, args.repeats, data)
+                identical = decoded == chromosome
+                print(
+                    f"{length}\t{genes_per_family}\t{name}\t{len(data)}"
+                    f"\t{encode_seconds:.5f}\t{decode_seconds:.5f}\t{identical}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+
+# Benchmarks the block metrics against their original dynamic programming and
+# tuple n-gram implementations, which are included here as references, on random
+# pairs of similar blocks. Run from the microservice's root directory:
+#
+#     $ python -m benchmarks.metrics --lengths 10 100 1000 --families 20 1000
+
+# Python
+import argparse
+import random
+import time
+from array import array
+from collections import Counter
+from itertools import chain
+
+# module
+from pairwise_macro_synteny_blocks.metrics import jaccard, levenshtein
+
+
+def referenceJaccard(a, b, n=1, reversals=False, multiset=False):
+    # parse args that may have come from string
+    if isinstance(n, str):
+        n = int(n)
+    if isinstance(reversals, str):
+        reversals = bool(reversals)
+
+    # base case
+    la, lb = len(a), len(b)
+    if n > la or n > lb:
+        return 1
+
+    # convert input to n-gram lists
+    def nGram(s):
+        return [tuple(s[i : i + n]) for i in range(len(s) - n + 1)]
+
+    na, nb = nGram(a), nGram(b)
+
+    # assign n-grams unique IDs
+    ids = {}
+    i = 0
+    for g in chain(na, nb):
+        if g not in ids:
+            r = g[::-1]
+            if reversals and r in ids:
+                ids[g] = ids[r]
+            else:
+                ids[g] = i
+                i += 1
+
+    # convert n-gram lists to id sets
+    def gramID(g):
+        return ids[g]
+
+    aIDs, bIDs = map(gramID, na), map(gramID, nb)
+
+    # generate a count map for each list
+    def makeSet(IDs):
+        if not multiset:
+            return Counter({e: 1 for e in IDs})
+        return Counter(IDs)
+
+    sa, sb = makeSet(aIDs), makeSet(bIDs)
+
+    # compute the Jaccard index
+    intersection = sa & sb
+    union = sa | sb
+    numerator = sum(intersection.values())
+    denominator = sum(union.values())
+    if denominator == 0:
+        denominator = 1
+
+    # return the distance
+    return 1 - numerator / denominator
+
+
+def referenceLevenshtein(a, b):
+    if a == b:
+        return 0
+    la, lb = len(a), len(b)
+    if la == 0:
+        return lb
+    if lb == 0:
+        return la
+    if lb > la:
+        a, b, la, lb = b, a, lb, la
+
+    cost = array("i", range(lb + 1))
+    for i in range(1, la + 1):
+        cost[0] = i
+        ls = i - 1
+        mn = ls
+        for j in range(1, lb + 1):
+            ls, act = cost[j], ls + int(a[i - 1] != b[j - 1])
+            cost[j] = min(ls + 1, cost[j - 1] + 1, act)
+            if ls < mn:
+                mn = ls
+    return cost[lb]
+
+
+def similarBlocks(length, families, mutation, rng):
+    """
+    Generates a pair of blocks of family IDs where the second block is a copy of
+    the first with random substitutions, insertions, and deletions.
+
+    Parameters:
+      length (int): The number of genes in the first block.
+      families (int): The number of distinct families to draw from.
+      mutation (float): The probability that each gene is mutated.
+      rng (random.Random): The random number generator to use.
+
+    Returns:
+      list[int]: The first block.
+      list[int]: The second block.
+    """
+
+    a = [rng.randrange(families) for _ in range(length)]
+    b = []
+    for f in a:
+        r = rng.random()
+        if r < mutation / 3:
+            b.append(rng.randrange(families))
+        elif r < 2 * mutation / 3:
+            b.extend((f, rng.randrange(families)))
+        elif r >= mutation:
+            b.append(f)
+    return a, b
+
+
+def timeMetric(metric, pairs, args):
+    start = time.perf_counter()
+    values = [metric(a, b, *args) for a, b in pairs]
+    return time.perf_counter() - start, values
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the block metrics against reference implementations.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--lengths",
+        type=int,
+        nargs="+",
+        default=[10, 100, 1000],
+        help="The block lengths to benchmark.",
+    )
+    parser.add_argument(
+        "--families",
+        type=int,
+        nargs="+",
+        default=[20, 1000],
+        help="The numbers of distinct families to benchmark.",
+    )
+    parser.add_argument(
+        "--mutation",
+        type=float,
+        default=0.2,
+        help="The probability that each gene in a block's copy is mutated.",
+    )
+    parser.add_argument(
+        "--pairs", type=int, default=20, help="The number of block pairs per input."
+    )
+    parser.add_argument("--seed", type=int, default=0, help="The random seed.")
+    return parser.parse_args()
+
+
+def main():
+    args = parseArgs()
+    rng = random.Random(args.seed)
+    metrics = [
+        ("levenshtein", (), referenceLevenshtein, levenshtein),
+        ("jaccard", (), referenceJaccard, jaccard),
+        ("jaccard:3", (3,), referenceJaccard, jaccard),
+        ("jaccard:3:reversals", (3, True), referenceJaccard, jaccard),
+        ("jaccard:3:reversals:multiset", (3, True, True), referenceJaccard, jaccard),
+    ]
+    print("length\tfamilies\tmetric\treference\tseconds\tspeedup\tidentical")
+    for length in args.lengths:
+        for families in args.families:
+            pairs = [
+                similarBlocks(length, families, args.mutation, rng)
+                for _ in range(args.pairs)
+            ]
+            for name, metric_args, reference, metric in metrics:
+                reference_seconds, reference_values = timeMetric(
+                    reference, pairs, metric_args
+                )
+                seconds, values = timeMetric(metric, pairs, metric_args)
+                identical = values == reference_values
+                print(
+                    f"{length}\t{families}\t{name}\t{reference_seconds:.4f}"
+                    f"\t{seconds:.4f}\t{reference_seconds / seconds:.1f}"
+                    f"\t{identical}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+#!/usr/bin/env python
+
+# Benchmarks the pairwise microservice's heaviest path, i.e. computing index pairs,
+# chaining them into blocks, and computing block metrics, on synthetic query and
+# target chromosomes across sweeps of generation parameters. Every list argument is
+# a sweep and the cartesian product of all sweeps is benchmarked. The results are
+# written as JSON so runs from different commits can be compared, e.g.
+#
+#     $ python -m benchmarks.synthetic --length 1000 5000 --output before.json
+#     $ git checkout ...
+#     $ python -m benchmarks.synthetic --length 1000 5000 --compare before.json
+
+# Python
+import argparse
+import itertools
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+# module
+from pairwise_macro_synteny_blocks.chaining import CHAINING_ENGINES
+from pairwise_macro_synteny_blocks.database import ORPHAN_FAMILY_ID
+from pairwise_macro_synteny_blocks.metrics import METRICS
+from pairwise_macro_synteny_blocks.request_handler import RequestHandler
+
+# the generation parameters that can be swept, in the order results are keyed by
+PARAMETERS = [
+    "length",
+    "copy_number",
+    "tandem_arrays",
+    "tandem_size",
+    "inversions",
+    "inversion_size",
+    "orphan_rate",
+    "divergence",
+]
+
+
+def syntheticChromosomes(
+    length,
+    copy_number,
+    tandem_arrays,
+    tandem_size,
+    inversions,
+    inversion_size,
+    orphan_rate,
+    divergence,
+    seed,
+):
+    """
+    Generates a query and target chromosome of family IDs that descend from a
+    common ancestor.
+
+    Parameters:
+      length (int): The number of genes on the ancestral chromosome.
+      copy_number (float): The mean number of copies of each family on the
+        ancestral chromosome; copy numbers are geometrically distributed.
+      tandem_arrays (int): The number of tandem arrays added to each chromosome.
+      tandem_size (int): The number of copies in each tandem array.
+      inversions (int): The number of inversions applied to the target.
+      inversion_size (int): The maximum number of genes in each inversion.
+      orphan_rate (float): The probability that a gene doesn't have a family.
+      divergence (float): The probability that a gene on the target has a
+        different family than its ancestor.
+      seed (int): The seed for the random number generator.
+
+    Returns:
+      list[int]: The query chromosome.
+      list[int]: The target chromosome.
+    """
+
+    rng = random.Random(seed)
+
+    # draw family copy numbers until there are enough genes
+    ancestor = []
+    family = 0
+    while len(ancestor) < length:
+        copies = 1
+        while rng.random() > 1 / copy_number:
+            copies += 1
+        ancestor.extend([family] * copies)
+        family += 1
+    ancestor = ancestor[:length]
+    rng.shuffle(ancestor)
+
+    def derive(chromosome):
+        chromosome = [
+            ORPHAN_FAMILY_ID if rng.random() < orphan_rate else f for f in chromosome
+        ]
+        for _ in range(tandem_arrays):
+            i = rng.randrange(len(chromosome) + 1)
+            chromosome[i:i] = [rng.randrange(family)] * tandem_size
+        return chromosome
+
+    query = derive(ancestor)
+    target = [
+        rng.randrange(family) if rng.random() < divergence else f for f in ancestor
+    ]
+    for _ in range(inversions):
+        size = rng.randint(1, max(1, inversion_size))
+        i = rng.randrange(max(1, len(target) - size + 1))
+        target[i : i + size] = target[i : i + size][::-1]
+    target = derive(target)
+    return query, target
+
+
+def timeBest(function, repeats):
+    """
+    Times a function.
+
+    Parameters:
+      function (function): The function to time.
+      repeats (int): The number of times to run the function.
+
+    Returns:
+      float: The fastest run time in seconds.
+      object: The function's return value.
+    """
+
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def peakMemory(function):
+    """
+    Measures the peak memory allocated by a function.
+
+    Parameters:
+      function (function): The function to measure.
+
+    Returns:
+      int: The peak number of bytes allocated while the function ran.
+    """
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def blockFamilies(query, target, block):
+    """
+    Gets the families of a block's genes as they're given to the metrics.
+
+    Parameters:
+      query (list[int]): The query chromosome.
+      target (list[int]): The target chromosome.
+      block (tuple[tuple[int, int], tuple[int, int]]): The index pairs at the
+        ends of the block.
+
+    Returns:
+      list[int]: The block's query families.
+      list[int]: The block's target families, in the query's orientation.
+    """
+
+    (t1, q1), (t2, q2) = block
+    query_families = query[min(q1, q2) : max(q1, q2) + 1]
+    target_families = target[t1 : t2 + 1]
+    if q1 > q2:
+        target_families = target_families[::-1]
+    return query_families, target_families
+
+
+def benchmark(parameters, args):
+    query, target = syntheticChromosomes(**parameters, seed=args.seed)
+    handler = RequestHandler(None)
+    engines = {"python": handler._indexPairsToIndexBlocks, **CHAINING_ENGINES}
+    mask = args.mask if args.mask is not None else float("inf")
+
+    def computePairs():
+        return handler._chromosomesToIndexPairs(query, target, mask)[0]
+
+    pairs_seconds, pairs = timeBest(computePairs, args.repeats)
+    pairs_memory = peakMemory(computePairs)
+
+    results = []
+    for name in args.engines:
+        engine = engines[name]
+        if name == "python" and len(pairs) > args.max_reference_pairs:
+            continue
+
+        def chain():
+            return list(engine(pairs, args.intermediate, args.matched))
+
+        chaining_seconds, blocks = timeBest(chain, args.repeats)
+        chaining_memory = peakMemory(chain)
+
+        # time each metric on every block
+        families = [blockFamilies(query, target, block) for block in blocks]
+        metrics = {}
+        for metric in args.metrics:
+            metric_name, *metric_args = metric.split(":")
+            function = METRICS[metric_name]
+
+            def computeMetric():
+                return [function(q, t, *metric_args) for q, t in families]
+
+            metrics[metric], _ = timeBest(computeMetric, args.repeats)
+
+        results.append(
+            {
+                "parameters": parameters,
+                "engine": name,
+                "queryGenes": len(query),
+                "targetGenes": len(target),
+                "pairs": len(pairs),
+                "blocks": len(blocks),
+                "pairsSeconds": pairs_seconds,
+                "pairsPerSecond": len(pairs) / pairs_seconds if pairs_seconds else 0,
+                "pairsPeakMemory": pairs_memory,
+                "chainingSeconds": chaining_seconds,
+                "pairsChainedPerSecond": (
+                    len(pairs) / chaining_seconds if chaining_seconds else 0
+                ),
+                "blocksPerSecond": (
+                    len(blocks) / chaining_seconds if chaining_seconds else 0
+                ),
+                "chainingPeakMemory": chaining_memory,
+                "metricsSeconds": metrics,
+            }
+        )
+    return results
+
+
+def resultKey(result):
+    parameters = result["parameters"]
+    return (*(parameters[p] for p in PARAMETERS), result["engine"])
+
+
+def compare(results, baseline):
+    """
+    Prints the ratio of each result's times to those of the baseline result with
+    the same parameters and engine; ratios less than 1 are speed ups.
+
+    Parameters:
+      results (list[dict]): The results of this run.
+      baseline (list[dict]): The results of a previous run.
+    """
+
+    baseline = {resultKey(r): r for r in baseline}
+    print("\t".join(PARAMETERS + ["engine", "stage", "baseline", "seconds", "ratio"]))
+    for result in results:
+        old = baseline.get(resultKey(result))
+        if old is None:
+            continue
+        stages = [
+            ("pairs", result["pairsSeconds"], old["pairsSeconds"]),
+            ("chaining", result["chainingSeconds"], old["chainingSeconds"]),
+        ]
+        for metric, seconds in result["metricsSeconds"].items():
+            if metric in old["metricsSeconds"]:
+                stages.append((metric, seconds, old["metricsSeconds"][metric]))
+        for stage, seconds, old_seconds in stages:
+            ratio = seconds / old_seconds if old_seconds else float("inf")
+            values = [str(v) for v in resultKey(result)]
+            print(
+                "\t".join(values + [stage, f"{old_seconds:.4f}", f"{seconds:.4f}"])
+                + f"\t{ratio:.2f}"
+            )
+
+
+def gitCommit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the pairwise computation on synthetic chromosomes.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    # generation parameters
+    parser.add_argument(
+        "--length",
+        type=int,
+        nargs="+",
+        default=[2000],
+        help="The numbers of ancestral genes to sweep.",
+    )
+    parser.add_argument(
+        "--copy-number",
+        type=float,
+        nargs="+",
+        default=[1.2],
+        help="The mean family copy numbers to sweep; must be at least 1.",
+    )
+    parser.add_argument(
+        "--tandem-arrays",
+        type=int,
+        nargs="+",
+        default=[0, 5],
+        help="The numbers of tandem arrays per chromosome to sweep.",
+    )
+    parser.add_argument(
+        "--tandem-size",
+        type=int,
+        nargs="+",
+        default=[20],
+        help="The tandem array sizes to sweep.",
+    )
+    parser.add_argument(
+        "--inversions",
+        type=int,
+        nargs="+",
+        default=[10],
+        help="The numbers of target inversions to sweep.",
+    )
+    parser.add_argument(
+        "--inversion-size",
+        type=int,
+        nargs="+",
+        default=[50],
+        help="The maximum inversion sizes to sweep.",
+    )
+    parser.add_argument(
+        "--orphan-rate",
+        type=float,
+        nargs="+",
+        default=[0.1],
+        help="The orphan gene rates to sweep.",
+    )
+    parser.add_argument(
+        "--divergence",
+        type=float,
+        nargs="+",
+        default=[0.1],
+        help="The target family substitution rates to sweep.",
+    )
+    # request parameters
+    parser.add_argument(
+        "--matched", type=int, default=10, help="The matched value to use."
+    )
+    parser.add_argument(
+        "--intermediate", type=int, default=5, help="The intermediate value to use."
+    )
+    parser.add_argument("--mask", type=int, help="The mask value to use.")
+    parser.add_argument(
+        "--engines",
+        nargs="+",
+        default=["python", *CHAINING_ENGINES],
+        choices=["python", *CHAINING_ENGINES],
+        help="The chaining engines to benchmark.",
+    )
+    parser.add_argument(
+        "--metrics",
+        nargs="+",
+        default=["jaccard", "jaccard:3:true", "levenshtein"],
+        help="The metrics to benchmark, with arguments separated by colons.",
+    )
+    # benchmark parameters
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=3,
+        help="The number of times to time each stage; the fastest time is kept.",
+    )
+    parser.add_argument(
+        "--max-reference-pairs",
+        type=int,
+        default=100000,
+        help="Skip the reference recurrence on inputs with more pairs than this.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="The random seed.")
+    parser.add_argument(
+        "--output", help="The file to write the JSON results to instead of stdout."
+    )
+    parser.add_argument(
+        "--compare",
+        help="The JSON results of a previous run to compare this run's times to.",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parseArgs()
+    if any(c < 1 for c in args.copy_number):
+        exit("--copy-number values must be at least 1")
+    for metric in args.metrics:
+        if metric.split(":")[0] not in METRICS:
+            exit(f'"{metric}" is not a valid metric')
+
+    sweeps = [getattr(args, p) for p in PARAMETERS]
+    results = []
+    for values in itertools.product(*sweeps):
+        parameters = dict(zip(PARAMETERS, values))
+        results.extend(benchmark(parameters, args))
+
+    report = {
+        "commit": gitCommit(),
+        "python": sys.version,
+        "platform": platform.platform(),
+        "arguments": vars(args),
+        "results": results,
+    }
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as baseline:
+            compare(results, json.load(baseline)["results"])
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,6 @@
 import argparse
 import asyncio
 import logging
-import os
 import signal
 
 # dependencies
@@ -12,32 +11,15 @@ import uvloop
 
 # module
 import pairwise_macro_synteny_blocks
+from pairwise_macro_synteny_blocks.chaining import CHAINING_ENGINES
+from pairwise_macro_synteny_blocks.cli import LOG_LEVELS, EnvArg
 from pairwise_macro_synteny_blocks.database import connectToRedis
 from pairwise_macro_synteny_blocks.grpc_server import run_grpc_server
 from pairwise_macro_synteny_blocks.http_server import run_http_server
-from pairwise_macro_synteny_blocks.request_handler import RequestHandler
-
-LOG_LEVELS = {
-    "DEBUG": logging.DEBUG,
-    "INFO": logging.INFO,
-    "WARNING": logging.WARNING,
-    "ERROR": logging.ERROR,
-    "CRITICAL": logging.CRITICAL,
-}
-
-
-# a class that loads argument values from command line variables, resulting in a
-# value priority: command line > environment variable > default value
-class EnvArg(argparse.Action):
-    def __init__(self, envvar, required=False, default=None, **kwargs):
-        if envvar in os.environ:
-            default = os.environ[envvar]
-        if required and default is not None:
-            required = False
-        super(EnvArg, self).__init__(default=default, required=required, **kwargs)
-
-    def __call__(self, parser, namespace, values, option_string=None):
-        setattr(namespace, self.dest, values)
+from pairwise_macro_synteny_blocks.request_handler import (
+    PAIR_BUDGET_STRATEGIES,
+    RequestHandler,
+)
 
 
 def parseArgs():
@@ -202,6 +184,97 @@ def parseArgs():
         """,
     )
 
+    # Algorithm args
+    chainingengine_envvar = "CHAINING_ENGINE"
+    parser.add_argument(
+        "--chaining-engine",
+        dest="chaining_engine",
+        action=EnvArg,
+        envvar=chainingengine_envvar,
+        type=str,
+        choices=["python"] + list(CHAINING_ENGINES.keys()),
+        default="python",
+        help=f"""
+        The engine used to chain gene index pairs into blocks (can also be specified
+        using the {chainingengine_envvar} environment variable).
+        """,
+    )
+
+    querycachesize_envvar = "QUERY_CACHE_SIZE"
+    parser.add_argument(
+        "--query-cache-size",
+        dest="query_cache_size",
+        action=EnvArg,
+        envvar=querycachesize_envvar,
+        type=int,
+        default=128,
+        help=f"""
+        The maximum number of query chromosome family indexes to cache; 0 disables
+        the cache (can also be specified using the {querycachesize_envvar} environment
+        variable).
+        """,
+    )
+
+    targetcachesize_envvar = "TARGET_CACHE_SIZE"
+    parser.add_argument(
+        "--target-cache-size",
+        dest="target_cache_size",
+        action=EnvArg,
+        envvar=targetcachesize_envvar,
+        type=int,
+        default=64 * 1024 * 1024,
+        help=f"""
+        The maximum number of bytes of target chromosome data to cache; 0 disables
+        the cache (can also be specified using the {targetcachesize_envvar}
+        environment variable).
+        """,
+    )
+
+    workers_envvar = "WORKERS"
+    parser.add_argument(
+        "--workers",
+        action=EnvArg,
+        envvar=workers_envvar,
+        type=int,
+        default=0,
+        help=f"""
+        The number of worker processes that compute blocks; 0 computes blocks in the
+        event loop's process (can also be specified using the {workers_envvar}
+        environment variable).
+        """,
+    )
+
+    pairbudget_envvar = "PAIR_BUDGET"
+    parser.add_argument(
+        "--pair-budget",
+        dest="pair_budget",
+        action=EnvArg,
+        envvar=pairbudget_envvar,
+        type=int,
+        default=0,
+        help=f"""
+        The maximum number of matching gene pairs computed for a target chromosome;
+        0 means there's no budget (can also be specified using the
+        {pairbudget_envvar} environment variable).
+        """,
+    )
+
+    pairbudgetstrategy_envvar = "PAIR_BUDGET_STRATEGY"
+    parser.add_argument(
+        "--pair-budget-strategy",
+        dest="pair_budget_strategy",
+        action=EnvArg,
+        envvar=pairbudgetstrategy_envvar,
+        type=str,
+        choices=PAIR_BUDGET_STRATEGIES,
+        default="mask",
+        help=f"""
+        What to do when a target exceeds the pair budget: mask the query families
+        with the most pairs until the budget is met or reject the request (can also
+        be specified using the {pairbudgetstrategy_envvar} environment variable).
+        """,
+    )
+
     return parser.parse_args()
 
 
@@ -256,13 +329,22 @@ def main():
     loop.set_exception_handler(handleException)
 
     # run the program
+    handler = None
     try:
         # create the database connection
         redis_connection = loop.run_until_complete(
             connectToRedis(args.rhost, args.rport, args.rdb, args.rpassword)
         )
         # create the request handler
-        handler = RequestHandler(redis_connection)
+        handler = RequestHandler(
+            redis_connection,
+            args.chaining_engine,
+            args.query_cache_size,
+            args.target_cache_size,
+            args.workers,
+            args.pair_budget,
+            args.pair_budget_strategy,
+        )
         # start the HTTP server
         if not args.nohttp:
             loop.create_task(run_http_server(args.hhost, args.hport, handler))
@@ -277,6 +359,8 @@ def main():
         loop.call_exception_handler(context)
     # finalize the shutdown
     finally:
+        if handler is not None:
+            handler.close()
         loop.close()
         logging.info("Successfully shutdown.")
 
@@ -0,0 +1,253 @@
+# Python
+from collections import deque
+from itertools import chain
+
+# dependencies
+import numpy as np
+
+
+# given the path scores and back-pointers of the index pair DAG as flat arrays,
+# the function greedily generates chains (longest paths) in highest score first
+# order; this is the array equivalent of
+# RequestHandler._indexBlocksViaIndexPathTraceback, where a pointer value of -1
+# means the node has no predecessor
+def indexPathTraceback(scores, pointers, matched):
+    # order nodes by score and then by DAG order, both descending
+    order = np.lexsort((np.arange(len(scores)), scores))[::-1]
+    scores = scores.tolist()
+    pointers = pointers.tolist()
+    for end in order.tolist():
+        if pointers[end] >= 0:  # note: singletons don't have pointers
+            if scores[end] < matched:
+                break
+            begin = end
+            while pointers[begin] >= 0:
+                previous = pointers[begin]
+                pointers[begin] = -1
+                begin = previous
+            length = scores[end] - scores[begin] + 1
+            if length >= matched:
+                yield (begin, end)
+
+
+# the maximum number of elements in the node-by-window matrices computed by the
+# NumPy chaining engine; bounds the engine's memory use on dense regions
+MAX_WINDOW_ELEMENTS = 2**20
+
+
+# computes the same forward and reverse DAGchainer-style paths as
+# RequestHandler._indexPairsToIndexBlocks but stores the index pairs as sorted
+# integer arrays and the scores and pointers as flat integer arrays; nodes with the
+# same target index only depend on each other via forward edges, so each group of
+# such nodes (a layer) is scored against its window of preceding layers with
+# vectorized operations and then against itself
+def numpyIndexPairsToIndexBlocks(pairs, intermediate, matched):
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    targets = pairs[:, 0]
+    queries = pairs[:, 1]
+    num_pairs = len(pairs)
+    f_scores = np.ones(num_pairs, dtype=np.int64)
+    f_pointers = np.full(num_pairs, -1, dtype=np.int64)
+    r_scores = np.ones(num_pairs, dtype=np.int64)
+    r_pointers = np.full(num_pairs, -1, dtype=np.int64)
+    diagonal = targets == queries
+    # the first node of each layer and the first node of the layer's window, i.e.
+    # the nodes whose target index is close enough to be in the same path
+    layer_starts = np.flatnonzero(np.diff(targets, prepend=-1))
+    layer_ends = np.append(layer_starts[1:], num_pairs)
+    window_starts = np.searchsorted(
+        targets, targets[layer_starts] - intermediate, side="left"
+    )
+    for a, b, s in zip(
+        layer_starts.tolist(), layer_ends.tolist(), window_starts.tolist()
+    ):
+        # the best forward score, closest pointer, and furthest diagonal pointer
+        # each node in the layer gets from the preceding layers
+        f_window_scores = np.zeros(b - a, dtype=np.int64)
+        f_window_pointers = np.full(b - a, -1, dtype=np.int64)
+        f_window_diagonals = np.full(b - a, -1, dtype=np.int64)
+        # score the layer's nodes in chunks to bound the size of the matrices
+        step = max(1, MAX_WINDOW_ELEMENTS // max(1, a - s))
+        for c in range(a, b if s < a else a, step):
+            d = min(b, c + step)
+            # the query distance between each node and each node in its window
+            d2 = queries[c:d, None] - queries[None, s:a]
+            # forward blocks
+            window_scores = np.where((d2 > 0) & (d2 <= intermediate), f_scores[s:a], 0)
+            scores = window_scores.max(axis=1)
+            ties = (window_scores == scores[:, None]) & (scores[:, None] > 0)
+            diagonal_ties = ties & diagonal[s:a]
+            closest = a - 1 - ties[:, ::-1].argmax(axis=1)
+            furthest_diagonal = np.where(
+                diagonal_ties.any(axis=1), s + diagonal_ties.argmax(axis=1), -1
+            )
+            f_window_scores[c - a : d - a] = scores
+            f_window_pointers[c - a : d - a] = np.where(scores > 0, closest, -1)
+            f_window_diagonals[c - a : d - a] = furthest_diagonal
+            # reverse blocks
+            window_scores = np.where((d2 < 0) & (d2 >= -intermediate), r_scores[s:a], 0)
+            scores = window_scores.max(axis=1)
+            closest = a - 1 - (window_scores[:, ::-1] == scores[:, None]).argmax(axis=1)
+            r_scores[c:d] = scores + 1
+            r_pointers[c:d] = np.where(scores > 0, closest, -1)
+        # replay the recurrence for each node in the layer; preceding nodes in the
+        # layer are closer than any in the window and always have smaller query
+        # indexes so they can only contribute forward edges
+        layer_queries = queries[a:b].tolist()
+        layer_scores = []
+        window_scores = f_window_scores.tolist()
+        window_pointers = f_window_pointers.tolist()
+        window_diagonals = f_window_diagonals.tolist()
+        for k, n2 in enumerate(layer_queries):
+            score, pointer = 1, -1
+            for j in reversed(range(k)):
+                if n2 - layer_queries[j] > intermediate:
+                    break
+                t = layer_scores[j] + 1
+                # second check is in case trivial block ends on gene family with
+                # multiple successive copies
+                if t > score or (t == score and diagonal[a + j]):
+                    score = t
+                    pointer = a + j
+            t = window_scores[k] + 1
+            if t > score:
+                score = t
+                pointer = window_pointers[k]
+            if t >= score and window_diagonals[k] >= 0:
+                pointer = window_diagonals[k]
+            layer_scores.append(score)
+            f_pointers[a + k] = pointer
+        f_scores[a:b] = layer_scores
+
+    # traceback longest paths and convert node indexes back to pairs
+    def indexesToPairs(block):
+        begin, end = block
+        return tuple(pairs[begin].tolist()), tuple(pairs[end].tolist())
+
+    f = indexPathTraceback(f_scores, f_pointers, matched)
+    r = indexPathTraceback(r_scores, r_pointers, matched)
+    return map(indexesToPairs, chain(f, r))
+
+
+# a segment tree over the query indexes whose leaves are the maximum of a sliding
+# window of keys; keys must be inserted in increasing node order and expired in
+# the same order, so each leaf's window is kept as a monotonic deque
+class SlidingRangeMaxIndex:
+    def __init__(self, size):
+        self.size = 1
+        while self.size < size:
+            self.size *= 2
+        self.tree = [-1] * (2 * self.size)
+        self.windows = {}
+
+    def _update(self, position, key):
+        i = position + self.size
+        tree = self.tree
+        tree[i] = key
+        i //= 2
+        while i:
+            left, right = tree[2 * i], tree[2 * i + 1]
+            tree[i] = left if left > right else right
+            i //= 2
+
+    def insert(self, position, key):
+        window = self.windows.get(position)
+        if window is None:
+            window = self.windows[position] = deque()
+        # keys that are smaller than the new key will never be a leaf's maximum
+        while window and window[-1] < key:
+            window.pop()
+        window.append(key)
+        if window[0] == key:
+            self._update(position, key)
+
+    def expire(self, position, key):
+        window = self.windows[position]
+        if window and window[0] == key:
+            window.popleft()
+            self._update(position, window[0] if window else -1)
+
+    # the maximum key in the inclusive range [begin, end]
+    def max(self, begin, end):
+        tree = self.tree
+        result = -1
+        i = max(begin, 0) + self.size
+        j = min(end, self.size - 1) + self.size + 1
+        while i < j:
+            if i & 1:
+                if tree[i] > result:
+                    result = tree[i]
+                i += 1
+            if j & 1:
+                j -= 1
+                if tree[j] > result:
+                    result = tree[j]
+            i //= 2
+            j //= 2
+        return result
+
+
+# computes the same forward and reverse DAGchainer-style paths as
+# RequestHandler._indexPairsToIndexBlocks in O(n log n) time by keeping the best
+# scores of the nodes within the intermediate distance of the current node on the
+# target axis in range-max indexes over the query axis; scores and node indexes are
+# packed into a single integer key so the tie-breaking of the recurrence can be
+# reproduced with max queries: the closest node wins ties in general, and the
+# furthest node on the diagonal wins forward ties when there is one
+def sparseIndexPairsToIndexBlocks(pairs, intermediate, matched):
+    num_pairs = len(pairs)
+    size = max((n2 for _, n2 in pairs), default=0) + 1
+    f_index = SlidingRangeMaxIndex(size)  # keys: (score, node)
+    d_index = SlidingRangeMaxIndex(size)  # keys: (score, -node) of diagonal nodes
+    r_index = SlidingRangeMaxIndex(size)  # keys: (score, node)
+    f_scores = [1] * num_pairs
+    f_pointers = [-1] * num_pairs
+    r_scores = [1] * num_pairs
+    r_pointers = [-1] * num_pairs
+    m = num_pairs
+    last = m - 1
+    expired = 0
+    for i, (n1, n2) in enumerate(pairs):
+        # expire the nodes that are too far away on the target axis
+        while pairs[expired][0] < n1 - intermediate:
+            m1, m2 = pairs[expired]
+            f_index.expire(m2, f_scores[expired] * m + expired)
+            if m1 == m2:
+                d_index.expire(m2, f_scores[expired] * m + last - expired)
+            r_index.expire(m2, r_scores[expired] * m + expired)
+            expired += 1
+        # forward blocks
+        key = f_index.max(n2 - intermediate, n2 - 1)
+        if key >= 0:
+            score, j = divmod(key, m)
+            key = d_index.max(n2 - intermediate, n2 - 1)
+            if key >= 0 and key // m == score:
+                j = last - key % m
+            f_scores[i] = score + 1
+            f_pointers[i] = j
+        # reverse blocks
+        key = r_index.max(n2 + 1, n2 + intermediate)
+        if key >= 0:
+            score, j = divmod(key, m)
+            r_scores[i] = score + 1
+            r_pointers[i] = j
+        # add the node to the indexes
+        f_index.insert(n2, f_scores[i] * m + i)
+        if n1 == n2:
+            d_index.insert(n2, f_scores[i] * m + last - i)
+        r_index.insert(n2, r_scores[i] * m + i)
+
+    # traceback longest paths and convert node indexes back to pairs
+    def indexesToPairs(block):
+        begin, end = block
+        return tuple(pairs[begin]), tuple(pairs[end])
+
+    f = indexPathTraceback(np.array(f_scores), np.array(f_pointers), matched)
+    r = indexPathTraceback(np.array(r_scores), np.array(r_pointers), matched)
+    return map(indexesToPairs, chain(f, r))
+
+
+CHAINING_ENGINES = {
+    "numpy": numpyIndexPairsToIndexBlocks,
+    "sparse": sparseIndexPairsToIndexBlocks,
+}
@@ -0,0 +1,26 @@
+# Python
+import argparse
+import logging
+import os
+
+LOG_LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+    "CRITICAL": logging.CRITICAL,
+}
+
+
+# a class that loads argument values from command line variables, resulting in a
+# value priority: command line > environment variable > default value
+class EnvArg(argparse.Action):
+    def __init__(self, envvar, required=False, default=None, **kwargs):
+        if envvar in os.environ:
+            default = os.environ[envvar]
+        if required and default is not None:
+            required = False
+        super(EnvArg, self).__init__(default=default, required=required, **kwargs)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        setattr(namespace, self.dest, values)
@@ -1,3 +1,10 @@
+# Python
+import hashlib
+import json
+import sys
+from array import array
+from collections import defaultdict, namedtuple
+
 # dependencies
 import redis.asyncio as redis
 
@@ -5,6 +12,30 @@ import redis.asyncio as redis
 import pairwise_macro_synteny_blocks
 
 COMPATIBLE_KEY = "GCV_COMPATIBLE_SCHEMA_VERSIONS"
+LOAD_EPOCH_KEY = "GCV_LOAD_EPOCH"
+FAMILY_IDS_KEY = "family:ids"
+FAMILY_NAMES_KEY = "family:names"
+ORPHAN_FAMILY_ID = -1
+CHROMOSOME_NAMES_KEY = "chromosomes:names"
+CHROMOSOME_LENGTHS_KEY = "chromosomes:lengths"
+CHROMOSOME_GENE_COUNTS_KEY = "chromosomes:genecounts"
+# the number of bytes of each entry in a chromosome's packed gene locations
+PACKED_LOCATION_SIZE = 8
+
+# the prefix of the keys blocks precomputed by the precompute command are stored in;
+# each set of parameters the blocks were computed with has the following keys:
+#   <prefix>:<digest>: a hash containing the load epoch the blocks were computed for
+#     and the parameters as JSON
+#   <prefix>:<digest>:blocks: a hash mapping each query chromosome's name to its
+#     blocks as a compressed serialized PairwiseMacroSyntenyBlocksComputeManyReply
+#   <prefix>:<digest>:targets: a hash mapping each query chromosome's name to the
+#     IDs of the target chromosomes it was compared to as compressed packed integers
+PRECOMPUTED_KEY_PREFIX = "macro-synteny-blocks:precomputed"
+
+# a query given as a range of genes on a chromosome in the database instead of as a
+# list of functional annotations; start and stop are inclusive gene indexes and
+# None means the range is unbounded on that side
+ChromosomeReference = namedtuple("ChromosomeReference", ["name", "start", "stop"])
 
 
 class SchemaVersionError(Exception):
@@ -16,7 +47,13 @@ class SchemaVersionError(Exception):
     pass
 
 
-async def connectToRedis(host="localhost", port=6379, db=0, password=None):
+# schema_version is the GCV schema version the database must support and defaults to
+# the schema version required by the service
+async def connectToRedis(
+    host="localhost", port=6379, db=0, password=None, schema_version=None
+):
+    if schema_version is None:
+        schema_version = pairwise_macro_synteny_blocks.__schema_version__
     # connect to database
     connection = await redis.Redis(
         host=host, port=port, db=db, password=password, decode_responses=True
@@ -24,12 +61,222 @@ async def connectToRedis(host="localhost", port=6379, db=0, password=None):
     # ping to force connection, preventing errors downstream
     await connection.ping()
     # check that the database is loaded with a compatible schema version
-    if not await connection.sismember(
-        COMPATIBLE_KEY, pairwise_macro_synteny_blocks.__schema_version__
-    ):
+    if not await connection.sismember(COMPATIBLE_KEY, schema_version):
         message = (
             "The Redis database does not support the required GCV schema "
-            f"version: {pairwise_macro_synteny_blocks.__schema_version__}"
+            f"version: {schema_version}"
         )
         raise SchemaVersionError(message)
     return connection
+
+
+# decodes a binary string of packed little-endian integers, e.g. a chromosome's
+# family IDs, into an array
+def unpackArray(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+# encodes an iterable of integers as a binary string of packed little-endian
+# integers, i.e. the inverse of unpackArray
+def packArray(typecode, values):
+    values = array(typecode, values)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+# decodes a binary string containing a single packed little-endian integer, e.g. a
+# gene location
+def unpackInt(data):
+    return int.from_bytes(data, "little", signed=True)
+
+
+async def getChromosomeSizes(connection):
+    """
+    Gets the length and number of genes of every chromosome.
+
+    Parameters:
+      connection (redis.asyncio.Redis): The Redis connection to use.
+
+    Returns:
+      array[int]: The length of each chromosome, indexed by chromosome ID.
+      array[int]: The number of genes on each chromosome, indexed by chromosome ID.
+    """
+
+    pipeline = connection.pipeline(transaction=False)
+    pipeline.execute_command("GET", CHROMOSOME_LENGTHS_KEY, NEVER_DECODE=True)
+    pipeline.execute_command("GET", CHROMOSOME_GENE_COUNTS_KEY, NEVER_DECODE=True)
+    lengths, gene_counts = await pipeline.execute()
+    return unpackArray("q", lengths or b""), unpackArray("i", gene_counts or b"")
+
+
+async def getQueryMatchIndices(connection, name, target_ids):
+    """
+    Gets the indexes of the genes in a query chromosome's families on each of the
+    given target chromosomes from the families' inverted indexes, like the macro-
+    synteny blocks microservice does before filtering its targets.
+
+    Parameters:
+      connection (redis.asyncio.Redis): The Redis connection to use.
+      name (str): The name of the query chromosome.
+      target_ids (list[int]): The IDs of the target chromosomes.
+
+    Returns:
+      int: The number of genes on the query chromosome.
+      dict[int, list[int]]: The indexes of the genes in the query's families on each
+        target chromosome that has any, keyed by chromosome ID.
+      Or None if the query chromosome doesn't exist.
+    """
+
+    key = f"chromosome:{name}:familyids"
+    data = await connection.execute_command("GET", key, NEVER_DECODE=True)
+    if data is None:
+        return None
+    family_ids = unpackArray("i", data)
+    pipeline = connection.pipeline(transaction=False)
+    for family_id in set(family_ids) - {ORPHAN_FAMILY_ID}:
+        pipeline.lindex(FAMILY_NAMES_KEY, family_id)
+    families = await pipeline.execute()
+    pipeline = connection.pipeline(transaction=False)
+    for family in families:
+        key = f"family:{family}:occurrences"
+        pipeline.execute_command("GET", key, NEVER_DECODE=True)
+    target_ids = set(target_ids)
+    chromosome_match_indices = defaultdict(list)
+    for data in await pipeline.execute():
+        if data is None:
+            continue
+        occurrences = unpackArray("i", data)
+        for chromosome_id, index in zip(occurrences[::2], occurrences[1::2]):
+            if chromosome_id in target_ids:
+                chromosome_match_indices[chromosome_id].append(index)
+    return len(family_ids), chromosome_match_indices
+
+
+def filterTargets(
+    chromosome_match_indices,
+    lengths,
+    gene_counts,
+    query_length,
+    matched,
+    intermediate,
+    chromosome_genes,
+    chromosome_length,
+):
+    """
+    Selects the target chromosomes whose matches with a query could form a block.
+    This is a copy of the macro-synteny blocks microservice's target filter, which
+    it applies before computing a query's blocks, so the precompute command must
+    apply it too and it must be kept in sync with the microservice's copy.
+
+    Parameters:
+      chromosome_match_indices (dict[int, list[int]]): The indexes of the genes in
+        the query's families on each chromosome, keyed by chromosome ID.
+      lengths (array[int]): The length of each chromosome, indexed by ID.
+      gene_counts (array[int]): The number of genes on each chromosome, indexed by
+        ID.
+      query_length (int): The number of genes in the query.
+      matched, intermediate, chromosome_genes, and chromosome_length are the parsed
+        arguments of the request.
+
+    Returns:
+      list[int]: The IDs of the selected chromosomes.
+    """
+
+    # sort index lists and filter by size, match, and intermediate parameters
+    min_genes = max(matched, chromosome_genes)
+    filtered_ids = []
+    for chromosome_id in chromosome_match_indices:
+        # the chromosome is too short or doesn't have enough genes, so the
+        # pairwise microservice would reject it
+        if (
+            chromosome_id >= len(lengths)
+            or chromosome_id >= len(gene_counts)
+            or lengths[chromosome_id] < chromosome_length
+            or gene_counts[chromosome_id] < min_genes
+        ):
+            continue
+        num_genes = len(chromosome_match_indices[chromosome_id])
+        # there's not enough matches on the entire chromosome
+        if num_genes < matched:
+            continue
+        # check blocks of genes that are closes
+        indices = sorted(chromosome_match_indices[chromosome_id])
+        block = [indices[0]]
+        for j, i in enumerate(indices[1:]):
+            # match is close enough to previous match to add to block
+            if (
+                intermediate < 1 and (i - block[-1]) / query_length <= intermediate
+            ) or (intermediate >= 1 and i - block[-1] <= intermediate - 1):
+                block.append(i)
+            # match is too far away from previous match
+            else:
+                # save block if it's big enough
+                if (matched < 1 and len(block) / query_length >= matched) or (
+                    matched >= 1 and len(block) >= matched
+                ):
+                    filtered_ids.append(chromosome_id)
+                    break
+                # start a new block with the current match
+                block = [i]
+                # no need to compute more blocks if none will be large enough
+                if num_genes - j < matched:
+                    break
+        # save last block if it's big enough
+        if (
+            (matched < 1 and len(block) / query_length >= matched)
+            or (matched >= 1 and len(block) >= matched)
+            and (not filtered_ids or filtered_ids[-1] != chromosome_id)
+        ):
+            filtered_ids.append(chromosome_id)
+    return filtered_ids
+
+
+def precomputedKey(
+    matched,
+    intermediate,
+    mask,
+    metrics,
+    chromosome_genes,
+    chromosome_length,
+    pair_budget,
+    pair_budget_strategy,
+):
+    """
+    Gets the key of the blocks precomputed with the given parameters. The macro-
+    synteny blocks microservice computes the same key from its requests' parameters,
+    so it must be kept in sync with the microservice's copy.
+
+    Parameters:
+      matched (int): The minimum number of matching annotations in a block.
+      intermediate (int): The maximum number of intermediate genes between matches.
+      mask (int): The maximum number of members a family may have, or None.
+      metrics (list[str]): The optional metrics computed for each block.
+      chromosome_genes (int): The minimum number of genes a target must have.
+      chromosome_length (int): The minimum length a target must have.
+      pair_budget (int): The pairwise algorithm's pair budget; 0 means no budget.
+      pair_budget_strategy (str): What the pairwise algorithm does when a target
+        exceeds the pair budget, which is ignored when there's no budget.
+
+    Returns:
+      str: The key of the precomputed blocks' metadata hash, which is the prefix of
+        their other keys.
+    """
+
+    parameters = [
+        matched,
+        intermediate,
+        mask,
+        list(metrics),
+        chromosome_genes,
+        chromosome_length,
+        pair_budget,
+        pair_budget_strategy if pair_budget > 0 else None,
+    ]
+    canonical = json.dumps(parameters, separators=(",", ":"))
+    digest = hashlib.sha256(canonical.encode()).hexdigest()
+    return f"{PRECOMPUTED_KEY_PREFIX}:{digest}"
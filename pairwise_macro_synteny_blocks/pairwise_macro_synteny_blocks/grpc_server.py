@@ -1,3 +1,7 @@
+# Python
+import asyncio
+import time
+
 # dependencies
 import grpc
 from grpc.experimental import aio
@@ -5,6 +9,12 @@ from grpc.experimental import aio
 # isort: split
 
 # module
+from pairwise_macro_synteny_blocks.request_handler import (
+    DeadlineExceededError,
+    PairBudgetError,
+    QueryNotFoundError,
+)
+
 # isort: off
 # from pairwise_macro_synteny_blocks.proto.pairwisemacrosyntenyblocks_service.v1
 #   import pairwisemacrosyntenyblocks_pb2
@@ -24,6 +34,18 @@ from block.v1 import block_pb2
 # isort: on
 
 
+# converts a block computed by the request handler into a Block message
+def blockToMessage(block):
+    return block_pb2.Block(
+        i=block["i"],
+        j=block["j"],
+        fmin=block["fmin"],
+        fmax=block["fmax"],
+        orientation=block["orientation"],
+        optionalMetrics=block.get("optionalMetrics", []),
+    )
+
+
 class PairwiseMacroSyntenyBlocks(pwb_pb2_grpc.PairwiseMacroSyntenyBlocksServicer):
     def __init__(self, handler):
         self.handler = handler
@@ -35,10 +57,36 @@ class PairwiseMacroSyntenyBlocks(pwb_pb2_grpc.PairwiseMacroSyntenyBlocksServicer
 
         return exceptionCallback
 
+    # gets a request's query annotations, which may be dictionary encoded; raises
+    # an IndexError if an index isn't in the dictionary
+    def _requestChromosome(self, request):
+        if request.chromosomeFamilyIndexes:
+            dictionary = list(request.chromosomeFamilyDictionary)
+            return list(map(dictionary.__getitem__, request.chromosomeFamilyIndexes))
+        return request.chromosome
+
+    # gets the deadline of a request's client in seconds since the epoch, if it has
+    # one, so the handler can stop computing blocks no one will receive
+    def _deadline(self, context):
+        time_remaining = context.time_remaining()
+        if time_remaining is None:
+            return None
+        return time.time() + time_remaining
+
+    # gets the chromosome a request's query refers to, if any
+    def _parseReference(self, request):
+        chromosome_name = request.chromosomeName or None
+        chromosome_start = None
+        if request.HasField("chromosomeStart"):
+            chromosome_start = request.chromosomeStart
+        chromosome_stop = None
+        if request.HasField("chromosomeStop"):
+            chromosome_stop = request.chromosomeStop
+        return chromosome_name, chromosome_start, chromosome_stop
+
     # the method that actually handles requests
     async def _compute(self, request, context):
         # required parameters
-        chromosome = request.chromosome
         target = request.target
         matched = request.matched
         intermediate = request.intermediate
@@ -47,7 +95,11 @@ class PairwiseMacroSyntenyBlocks(pwb_pb2_grpc.PairwiseMacroSyntenyBlocksServicer
         metrics = request.optionalMetrics or None
         chromosome_genes = request.chromosomeGenes or None
         chromosome_length = request.chromosomeLength or None
+        chromosome_name, chromosome_start, chromosome_stop = self._parseReference(
+            request
+        )
         try:
+            chromosome = self._requestChromosome(request)
             (
                 chromosome,
                 target,
@@ -66,6 +118,9 @@ class PairwiseMacroSyntenyBlocks(pwb_pb2_grpc.PairwiseMacroSyntenyBlocksServicer
                 metrics,
                 chromosome_genes,
                 chromosome_length,
+                chromosome_name,
+                chromosome_start,
+                chromosome_stop,
             )
         except Exception:
             # raise a gRPC INVALID ARGUMENT error
@@ -73,9 +128,83 @@ class PairwiseMacroSyntenyBlocks(pwb_pb2_grpc.PairwiseMacroSyntenyBlocksServicer
                 grpc.StatusCode.INVALID_ARGUMENT,
                 "Required arguments are missing or given arguments have invalid values",
             )
-        blocks = await self.handler.process(
+        try:
+            blocks, dropped_families = await self.handler.process(
+                chromosome,
+                target,
+                matched,
+                intermediate,
+                mask,
+                metrics,
+                chromosome_genes,
+                chromosome_length,
+                deadline=self._deadline(context),
+            )
+        except PairBudgetError as e:
+            # raise a gRPC RESOURCE EXHAUSTED error
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, str(e))
+        except QueryNotFoundError as e:
+            # raise a gRPC NOT FOUND error
+            await context.abort(grpc.StatusCode.NOT_FOUND, str(e))
+        except DeadlineExceededError:
+            # gRPC has already ended the call with a DEADLINE EXCEEDED error, so the
+            # handler is cancelled as gRPC would have cancelled it
+            raise asyncio.CancelledError()
+        if blocks is None:
+            # raise a gRPC NOT FOUND error
+            await context.abort(grpc.StatusCode.NOT_FOUND, "Chromosome not found")
+        block_messages = list(map(blockToMessage, blocks))
+        return pairwisemacrosyntenyblocks_pb2.PairwiseMacroSyntenyBlocksComputeReply(
+            blocks=block_messages, droppedFamilies=dropped_families
+        )
+
+    # parses the arguments of a batch request, aborting if they're invalid
+    async def _parseManyRequest(self, request, context):
+        # required parameters
+        targets = request.targets
+        matched = request.matched
+        intermediate = request.intermediate
+        # optional parameters
+        mask = request.mask or None
+        metrics = request.optionalMetrics or None
+        chromosome_genes = request.chromosomeGenes or None
+        chromosome_length = request.chromosomeLength or None
+        chromosome_name, chromosome_start, chromosome_stop = self._parseReference(
+            request
+        )
+        try:
+            chromosome = self._requestChromosome(request)
+            (
+                chromosome,
+                targets,
+                matched,
+                intermediate,
+                mask,
+                metrics,
+                chromosome_genes,
+                chromosome_length,
+            ) = self.handler.parseManyArguments(
+                chromosome,
+                targets,
+                matched,
+                intermediate,
+                mask,
+                metrics,
+                chromosome_genes,
+                chromosome_length,
+                chromosome_name,
+                chromosome_start,
+                chromosome_stop,
+            )
+        except Exception:
+            # raise a gRPC INVALID ARGUMENT error
+            await context.abort(
+                grpc.StatusCode.INVALID_ARGUMENT,
+                "Required arguments are missing or given arguments have invalid values",
+            )
+        return (
             chromosome,
-            target,
+            targets,
             matched,
             intermediate,
             mask,
@@ -83,25 +212,64 @@ class PairwiseMacroSyntenyBlocks(pwb_pb2_grpc.PairwiseMacroSyntenyBlocksServicer
             chromosome_genes,
             chromosome_length,
         )
-        if blocks is None:
+
+    # the method that actually handles batch requests
+    async def _computeMany(self, request, context):
+        arguments = await self._parseManyRequest(request, context)
+        targets = arguments[1]
+        try:
+            target_blocks, dropped_families = await self.handler.processMany(
+                *arguments, deadline=self._deadline(context)
+            )
+        except PairBudgetError as e:
+            # raise a gRPC RESOURCE EXHAUSTED error
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, str(e))
+        except QueryNotFoundError as e:
             # raise a gRPC NOT FOUND error
-            await context.abort(grpc.StatusCode.NOT_FOUND, "Chromosome not found")
-        block_messages = list(
-            map(
-                lambda b: block_pb2.Block(
-                    i=b["i"],
-                    j=b["j"],
-                    fmin=b["fmin"],
-                    fmax=b["fmax"],
-                    orientation=b["orientation"],
-                    optionalMetrics=b.get("optionalMetrics", []),
-                ),
-                blocks,
+            await context.abort(grpc.StatusCode.NOT_FOUND, str(e))
+        except DeadlineExceededError:
+            # gRPC has already ended the call with a DEADLINE EXCEEDED error, so the
+            # handler is cancelled as gRPC would have cancelled it
+            raise asyncio.CancelledError()
+        blocks_messages = [
+            block_pb2.Blocks(
+                chromosome=target, blocks=list(map(blockToMessage, blocks))
+            )
+            for target, blocks in zip(targets, target_blocks)
+            if blocks  # false for None or []
+        ]
+        return (
+            pairwisemacrosyntenyblocks_pb2.PairwiseMacroSyntenyBlocksComputeManyReply(
+                blocks=blocks_messages, droppedFamilies=dropped_families
             )
         )
-        return pairwisemacrosyntenyblocks_pb2.PairwiseMacroSyntenyBlocksComputeReply(
-            blocks=block_messages
+
+    # the method that actually handles streaming requests
+    async def _computeStream(self, request, context):
+        arguments = await self._parseManyRequest(request, context)
+        StreamReply = (
+            pairwisemacrosyntenyblocks_pb2.PairwiseMacroSyntenyBlocksComputeStreamReply
         )
+        try:
+            stream = await self.handler.processStream(
+                *arguments, deadline=self._deadline(context)
+            )
+            async for target, blocks, dropped_families in stream:
+                block_messages = list(map(blockToMessage, blocks))
+                yield StreamReply(
+                    blocks=block_pb2.Blocks(chromosome=target, blocks=block_messages),
+                    droppedFamilies=dropped_families,
+                )
+        except PairBudgetError as e:
+            # raise a gRPC RESOURCE EXHAUSTED error
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, str(e))
+        except QueryNotFoundError as e:
+            # raise a gRPC NOT FOUND error
+            await context.abort(grpc.StatusCode.NOT_FOUND, str(e))
+        except DeadlineExceededError:
+            # gRPC has already ended the call with a DEADLINE EXCEEDED error, so the
+            # handler is cancelled as gRPC would have cancelled it
+            raise asyncio.CancelledError()
 
     # implements the service's API
     async def Compute(self, request, context):
@@ -119,6 +287,39 @@ class PairwiseMacroSyntenyBlocks(pwb_pb2_grpc.PairwiseMacroSyntenyBlocksServicer
             # return a gRPC INTERNAL error
             await context.abort(grpc.StatusCode.INTERNAL, "Internal server error")
 
+    # implements the service's API
+    async def ComputeMany(self, request, context):
+        # subvert the gRPC exception handler via a try/except block
+        try:
+            return await self._computeMany(request, context)
+        # let errors we raised go by
+        except aio.AbortError as e:
+            raise e
+        # raise an internal error to prevent non-gRPC info from being sent to users
+        except Exception as e:
+            # raise the exception after aborting so it gets logged
+            # NOTE: gRPC docs says abort should raise an error but it doesn't...
+            context.add_done_callback(self._exceptionCallbackFactory(e))
+            # return a gRPC INTERNAL error
+            await context.abort(grpc.StatusCode.INTERNAL, "Internal server error")
+
+    # implements the service's API
+    async def ComputeStream(self, request, context):
+        # subvert the gRPC exception handler via a try/except block
+        try:
+            async for reply in self._computeStream(request, context):
+                yield reply
+        # let errors we raised go by
+        except aio.AbortError as e:
+            raise e
+        # raise an internal error to prevent non-gRPC info from being sent to users
+        except Exception as e:
+            # raise the exception after aborting so it gets logged
+            # NOTE: gRPC docs says abort should raise an error but it doesn't...
+            context.add_done_callback(self._exceptionCallbackFactory(e))
+            # return a gRPC INTERNAL error
+            await context.abort(grpc.StatusCode.INTERNAL, "Internal server error")
+
 
 async def run_grpc_server(host, port, handler):
     server = aio.server()
@@ -1,7 +1,16 @@
+# Python
+import json
+
 # dependencies
 import aiohttp_cors
 from aiohttp import web
 
+# module
+from pairwise_macro_synteny_blocks.request_handler import (
+    PairBudgetError,
+    QueryNotFoundError,
+)
+
 
 async def http_post_handler(request):
     # parse the chromosome and parameters from the POST data
@@ -16,6 +25,9 @@ async def http_post_handler(request):
     metrics = data.get("optionalMetrics", None)
     chromosome_genes = data.get("chromosomeGenes", None)
     chromosome_length = data.get("chromosomeLength", None)
+    chromosome_name = data.get("chromosomeName", None)
+    chromosome_start = data.get("chromosomeStart", None)
+    chromosome_stop = data.get("chromosomeStop", None)
     handler = request.app["handler"]
     try:
         (
@@ -36,24 +48,131 @@ async def http_post_handler(request):
             metrics,
             chromosome_genes,
             chromosome_length,
+            chromosome_name,
+            chromosome_start,
+            chromosome_stop,
         )
     except Exception:
         return web.HTTPBadRequest(
             text="Required arguments are missing or have invalid values"
         )
-    blocks = await handler.process(
+    try:
+        blocks, dropped_families = await handler.process(
+            chromosome,
+            target,
+            matched,
+            intermediate,
+            mask,
+            metrics,
+            chromosome_genes,
+            chromosome_length,
+        )
+    except PairBudgetError as e:
+        return web.HTTPUnprocessableEntity(text=str(e))
+    except QueryNotFoundError as e:
+        return web.HTTPNotFound(text=str(e))
+    if blocks is None:
+        return web.HTTPNotFound(text="Chromosome not found")
+    return web.json_response({"blocks": blocks, "droppedFamilies": dropped_families})
+
+
+# parses the chromosome and parameters of a batch request from its POST data
+def parseManyData(data, handler):
+    # required parameters
+    chromosome = data.get("chromosome")
+    targets = data.get("targets")
+    matched = data.get("matched")
+    intermediate = data.get("intermediate")
+    # optional parameters
+    mask = data.get("mask", None)
+    metrics = data.get("optionalMetrics", None)
+    chromosome_genes = data.get("chromosomeGenes", None)
+    chromosome_length = data.get("chromosomeLength", None)
+    chromosome_name = data.get("chromosomeName", None)
+    chromosome_start = data.get("chromosomeStart", None)
+    chromosome_stop = data.get("chromosomeStop", None)
+    return handler.parseManyArguments(
         chromosome,
-        target,
+        targets,
         matched,
         intermediate,
         mask,
         metrics,
         chromosome_genes,
         chromosome_length,
+        chromosome_name,
+        chromosome_start,
+        chromosome_stop,
     )
-    if blocks is None:
-        return web.HTTPNotFound(text="Chromosome not found")
-    return web.json_response({"blocks": blocks})
+
+
+async def http_post_many_handler(request):
+    # parse the chromosome and parameters from the POST data
+    data = await request.json()
+    handler = request.app["handler"]
+    try:
+        arguments = parseManyData(data, handler)
+    except Exception:
+        return web.HTTPBadRequest(
+            text="Required arguments are missing or have invalid values"
+        )
+    targets = arguments[1]
+    try:
+        target_blocks, dropped_families = await handler.processMany(*arguments)
+    except PairBudgetError as e:
+        return web.HTTPUnprocessableEntity(text=str(e))
+    except QueryNotFoundError as e:
+        return web.HTTPNotFound(text=str(e))
+    # targets that weren't found or that have no blocks are omitted
+    blocks = [
+        {"chromosome": target, "blocks": blocks}
+        for target, blocks in zip(targets, target_blocks)
+        if blocks  # false for None or []
+    ]
+    return web.json_response({"blocks": blocks, "droppedFamilies": dropped_families})
+
+
+# streams the blocks as newline delimited JSON using chunked transfer encoding; each
+# line contains a chunk of a target's blocks as soon as they've been computed. A
+# target's first line waits for all of its blocks to be chained but only for the
+# optional metrics of the blocks in the line
+async def http_post_stream_handler(request):
+    # parse the chromosome and parameters from the POST data
+    data = await request.json()
+    handler = request.app["handler"]
+    try:
+        arguments = parseManyData(data, handler)
+    except Exception:
+        return web.HTTPBadRequest(
+            text="Required arguments are missing or have invalid values"
+        )
+    try:
+        stream = await handler.processStream(*arguments)
+    except PairBudgetError as e:
+        return web.HTTPUnprocessableEntity(text=str(e))
+    except QueryNotFoundError as e:
+        return web.HTTPNotFound(text=str(e))
+    response = web.StreamResponse(
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+    async for target, blocks, dropped_families in stream:
+        line = json.dumps(
+            {
+                "chromosome": target,
+                "blocks": blocks,
+                "droppedFamilies": dropped_families,
+            }
+        )
+        await response.write(f"{line}\n".encode())
+    await response.write_eof()
+    return response
+
+
+async def http_get_stats_handler(request):
+    handler = request.app["handler"]
+    return web.json_response(handler.stats())
 
 
 async def run_http_server(host, port, handler):
@@ -73,8 +192,15 @@ async def run_http_server(host, port, handler):
     )
     route = app.router.add_post("/", http_post_handler)
     cors.add(route)
-    # run the app
-    runner = web.AppRunner(app)
+    route = app.router.add_post("/many", http_post_many_handler)
+    cors.add(route)
+    route = app.router.add_post("/stream", http_post_stream_handler)
+    cors.add(route)
+    route = app.router.add_get("/stats", http_get_stats_handler)
+    cors.add(route)
+    # run the app; handlers are cancelled when their client disconnects so requests
+    # no one is waiting for stop computing
+    runner = web.AppRunner(app, handler_cancellation=True)
     await runner.setup()
     site = web.TCPSite(runner, host, port)
     await site.start()
@@ -1,6 +1,38 @@
-from array import array
 from collections import Counter
-from itertools import chain
+
+
+# maps each distinct element of the given sequences to a distinct positive integer
+def _encode(*sequences):
+    codes = {}
+    encoded = []
+    for s in sequences:
+        encoded.append([codes.setdefault(e, len(codes) + 1) for e in s])
+    return encoded, len(codes) + 1
+
+
+# computes the key of each n-gram in an integer encoded sequence, i.e. the n-gram's
+# digits in the given base, using a rolling hash; the keys are exact so distinct
+# n-grams never collide
+def _nGramKeys(s, n, base):
+    high = base ** (n - 1)
+    key = 0
+    keys = []
+    for e in s:
+        # drop the element leaving the window and add the element entering it
+        key = (key % high) * base + e
+        keys.append(key)
+    return keys[n - 1 :]
+
+
+# computes the n-gram keys of an integer encoded sequence; if reversals is true
+# then each n-gram and its reverse are given the same key
+def _canonicalNGramKeys(s, n, base, reversals):
+    keys = _nGramKeys(s, n, base)
+    if not reversals or n == 1:
+        return keys
+    # the reverse of each n-gram is an n-gram of the reversed sequence
+    reverse_keys = _nGramKeys(s[::-1], n, base)[::-1]
+    return list(map(min, keys, reverse_keys))
 
 
 def jaccard(a, b, n=1, reversals=False, multiset=False):
@@ -15,43 +47,25 @@ def jaccard(a, b, n=1, reversals=False, multiset=False):
     if n > la or n > lb:
         return 1
 
-    # convert input to n-gram lists
-    def nGram(s):
-        return [tuple(s[i : i + n]) for i in range(len(s) - n + 1)]
-
-    na, nb = nGram(a), nGram(b)
-
-    # assign n-grams unique IDs
-    ids = {}
-    i = 0
-    for g in chain(na, nb):
-        if g not in ids:
-            r = g[::-1]
-            if reversals and r in ids:
-                ids[g] = ids[r]
-            else:
-                ids[g] = i
-                i += 1
-
-    # convert n-gram lists to id sets
-    def gramID(g):
-        return ids[g]
-
-    aIDs, bIDs = map(gramID, na), map(gramID, nb)
-
-    # generate a count map for each list
-    def makeSet(IDs):
-        if not multiset:
-            return Counter({e: 1 for e in IDs})
-        return Counter(IDs)
-
-    sa, sb = makeSet(aIDs), makeSet(bIDs)
+    # convert the input to n-gram keys
+    if n > 0:
+        (ea, eb), base = _encode(a, b)
+        ka = _canonicalNGramKeys(ea, n, base, reversals)
+        kb = _canonicalNGramKeys(eb, n, base, reversals)
+    # degenerate n-grams are compared as tuples
+    else:
+        ka = [tuple(a[i : i + n]) for i in range(la - n + 1)]
+        kb = [tuple(b[i : i + n]) for i in range(lb - n + 1)]
 
     # compute the Jaccard index
-    intersection = sa & sb
-    union = sa | sb
-    numerator = sum(intersection.values())
-    denominator = sum(union.values())
+    if multiset:
+        sa, sb = Counter(ka), Counter(kb)
+        numerator = sum((sa & sb).values())
+        denominator = sum((sa | sb).values())
+    else:
+        sa, sb = set(ka), set(kb)
+        numerator = len(sa & sb)
+        denominator = len(sa | sb)
     if denominator == 0:
         denominator = 1
 
@@ -59,28 +73,56 @@ def jaccard(a, b, n=1, reversals=False, multiset=False):
     return 1 - numerator / denominator
 
 
-def levenshtein(a, b):
+# computes the Levenshtein distance using Myers' bit-parallel algorithm, as
+# formulated by Hyyrö, where each column of the dynamic programming matrix is
+# encoded as vertical deltas in the bits of an integer; if a threshold is given
+# then threshold + 1 is returned as soon as the distance is known to exceed it
+def levenshtein(a, b, threshold=None):
+    # parse args that may have come from string
+    if isinstance(threshold, str):
+        threshold = int(threshold)
+
     if a == b:
         return 0
     la, lb = len(a), len(b)
+    if threshold is not None and abs(la - lb) > threshold:
+        return threshold + 1
     if la == 0:
         return lb
     if lb == 0:
         return la
+    # the shorter sequence is encoded in the bit-vectors
     if lb > la:
         a, b, la, lb = b, a, lb, la
 
-    cost = array("i", range(lb + 1))
-    for i in range(1, la + 1):
-        cost[0] = i
-        ls = i - 1
-        mn = ls
-        for j in range(1, lb + 1):
-            ls, act = cost[j], ls + int(a[i - 1] != b[j - 1])
-            cost[j] = min(ls + 1, cost[j - 1] + 1, act)
-            if ls < mn:
-                mn = ls
-    return cost[lb]
+    # the bits of the elements of b
+    peq = {}
+    for i, e in enumerate(b):
+        peq[e] = peq.get(e, 0) | (1 << i)
+    full = (1 << lb) - 1
+    last = 1 << (lb - 1)
+
+    pv = full  # positive vertical deltas
+    mv = 0  # negative vertical deltas
+    score = lb
+    for j, e in enumerate(a):
+        eq = peq.get(e, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+        # each remaining column can decrease the distance by at most 1
+        if threshold is not None and score - (la - j - 1) > threshold:
+            return threshold + 1
+    return score
 
 
 METRICS = {"jaccard": jaccard, "levenshtein": levenshtein}
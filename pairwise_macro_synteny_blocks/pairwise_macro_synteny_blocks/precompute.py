@@ -0,0 +1,523 @@
+#!/usr/bin/env python
+
+# Precomputes the pairwise macro-synteny blocks of every pair of chromosomes in the
+# database, or of the chromosomes of selected pairs of genomes, and stores them in
+# Redis so the macro-synteny blocks microservice can answer queries that refer to a
+# chromosome by name without recomputing them. Blocks are computed with the same
+# request handler as the microservice, in a pool of worker processes, e.g.
+#
+#     $ python -m pairwise_macro_synteny_blocks.precompute --matched 10 \
+#         --intermediate 5 --workers 8
+#
+# Runs are incremental: targets that have already been compared to a query with the
+# same parameters since the database was last loaded are skipped.
+
+# Python
+import argparse
+import asyncio
+import json
+import logging
+import os
+import zlib
+from collections import defaultdict
+
+# dependencies
+import uvloop
+
+# module
+import pairwise_macro_synteny_blocks
+from pairwise_macro_synteny_blocks.chaining import CHAINING_ENGINES
+from pairwise_macro_synteny_blocks.cli import LOG_LEVELS, EnvArg
+from pairwise_macro_synteny_blocks.database import (
+    CHROMOSOME_NAMES_KEY,
+    LOAD_EPOCH_KEY,
+    connectToRedis,
+    filterTargets,
+    getChromosomeSizes,
+    getQueryMatchIndices,
+    packArray,
+    precomputedKey,
+    unpackArray,
+)
+from pairwise_macro_synteny_blocks.grpc_server import blockToMessage
+from pairwise_macro_synteny_blocks.metrics import METRICS
+from pairwise_macro_synteny_blocks.request_handler import (
+    PAIR_BUDGET_STRATEGIES,
+    PairBudgetError,
+    QueryNotFoundError,
+    RequestHandler,
+)
+
+# isort: off
+# from pairwise_macro_synteny_blocks.proto.pairwisemacrosyntenyblocks_service.v1
+#   import pairwisemacrosyntenyblocks_pb2
+# from pairwise_macro_synteny_blocks.proto.block.v1 import block_pb2
+# NOTE: the following imports are a temporary workaround for a known protobuf
+# bug; the commented imports above should be used when the bug is fixed:
+# https://github.com/protocolbuffers/protobuf/issues/10075
+from pairwise_macro_synteny_blocks import proto  # noqa: F401
+from pairwisemacrosyntenyblocks_service.v1 import pairwisemacrosyntenyblocks_pb2
+from block.v1 import block_pb2
+
+# isort: on
+
+ManyReply = pairwisemacrosyntenyblocks_pb2.PairwiseMacroSyntenyBlocksComputeManyReply
+
+# the GCV schema version the command requires; unlike the microservice, it reads the
+# chromosome lengths and gene counts and the family occurrences added in 1.4.0 and
+# 1.5.0 to filter targets
+PRECOMPUTE_SCHEMA_VERSION = "1.5.0"
+
+
+# parses a genome given as its genus and species separated by whitespace; the
+# species may include a strain, e.g. "Glycine max:Wm82"
+def parseGenome(genome):
+    genus, _, species = genome.strip().partition(" ")
+    if not genus or not species.strip():
+        raise argparse.ArgumentTypeError(f'"{genome}" is not a "genus species" pair')
+    return genus, species.strip()
+
+
+def parseArgs():
+    # create the parser
+    parser = argparse.ArgumentParser(
+        prog=f"{pairwise_macro_synteny_blocks.__name__}.precompute",
+        description="""
+        Precomputes the pairwise macro-synteny blocks of every pair of chromosomes
+        in the database, or of the chromosomes of the given pairs of genomes, and
+        stores them in the database for the macro-synteny blocks microservice.
+        """,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--version",
+        action="version",
+        version=f"""
+        %(prog)s {pairwise_macro_synteny_blocks.__version__} schema
+        {pairwise_macro_synteny_blocks.__schema_version__}
+        """,
+    )
+
+    # logging args
+    loglevel_envvar = "LOG_LEVEL"
+    parser.add_argument(
+        "--log-level",
+        dest="log_level",
+        action=EnvArg,
+        envvar=loglevel_envvar,
+        type=str,
+        choices=list(LOG_LEVELS.keys()),
+        default="INFO",
+        help=f"""
+        What level of events should be logged (can also be specified using the
+        {loglevel_envvar} environment variable).
+        """,
+    )
+
+    # Redis args
+    rdb_envvar = "REDIS_DB"
+    parser.add_argument(
+        "--rdb",
+        action=EnvArg,
+        envvar=rdb_envvar,
+        type=int,
+        default=0,
+        help=f"""
+        The Redis database (can also be specified using the {rdb_envvar} environment
+        variable).
+        """,
+    )
+    rpassword_envvar = "REDIS_PASSWORD"
+    parser.add_argument(
+        "--rpassword",
+        action=EnvArg,
+        envvar=rpassword_envvar,
+        type=str,
+        help=f"""
+        The Redis password (can also be specified using the {rpassword_envvar}
+        environment variable).
+        """,
+    )
+    rhost_envvar = "REDIS_HOST"
+    parser.add_argument(
+        "--rhost",
+        action=EnvArg,
+        envvar=rhost_envvar,
+        type=str,
+        default="localhost",
+        help=f"""
+        The Redis host (can also be specified using the {rhost_envvar} environment
+        variable).
+        """,
+    )
+    rport_envvar = "REDIS_PORT"
+    parser.add_argument(
+        "--rport",
+        action=EnvArg,
+        envvar=rport_envvar,
+        type=int,
+        default=6379,
+        help=f"""
+        The Redis port (can also be specified using the {rport_envvar} environment
+        variable).
+        """,
+    )
+
+    # Block args; these are the parameters of the macro-synteny blocks requests
+    # that will be answered with the precomputed blocks
+    parser.add_argument(
+        "--matched",
+        type=int,
+        required=True,
+        help="The minimum number of matching annotations in a block.",
+    )
+    parser.add_argument(
+        "--intermediate",
+        type=int,
+        required=True,
+        help="The maximum number of intermediate genes between any two matches.",
+    )
+    parser.add_argument(
+        "--mask",
+        type=int,
+        default=None,
+        help="The maximum number of members a family may have to be matched.",
+    )
+    parser.add_argument(
+        "--optional-metrics",
+        dest="optional_metrics",
+        nargs="*",
+        default=[],
+        help="The metrics to compute for each block, e.g. jaccard:3 levenshtein.",
+    )
+    parser.add_argument(
+        "--chromosome-genes",
+        dest="chromosome_genes",
+        type=int,
+        default=None,
+        help="""
+        The minimum number of genes a target chromosome must have; defaults to
+        --matched.
+        """,
+    )
+    parser.add_argument(
+        "--chromosome-length",
+        dest="chromosome_length",
+        type=int,
+        default=1,
+        help="The minimum length a target chromosome must have.",
+    )
+    parser.add_argument(
+        "--genome-pair",
+        dest="genome_pairs",
+        nargs=2,
+        type=parseGenome,
+        action="append",
+        metavar=("GENOME", "GENOME"),
+        help="""
+        A pair of genomes, each given as its genus and species, e.g. "Glycine max"
+        "Phaseolus vulgaris", whose chromosomes should be compared in both
+        directions; may be given multiple times. Every pair of chromosomes in the
+        database is compared if no pairs are given.
+        """,
+    )
+
+    # Algorithm args
+    chainingengine_envvar = "CHAINING_ENGINE"
+    parser.add_argument(
+        "--chaining-engine",
+        dest="chaining_engine",
+        action=EnvArg,
+        envvar=chainingengine_envvar,
+        type=str,
+        choices=["python"] + list(CHAINING_ENGINES.keys()),
+        default="python",
+        help=f"""
+        The engine used to chain gene index pairs into blocks (can also be specified
+        using the {chainingengine_envvar} environment variable).
+        """,
+    )
+
+    targetcachesize_envvar = "TARGET_CACHE_SIZE"
+    parser.add_argument(
+        "--target-cache-size",
+        dest="target_cache_size",
+        action=EnvArg,
+        envvar=targetcachesize_envvar,
+        type=int,
+        default=1024 * 1024 * 1024,
+        help=f"""
+        The maximum number of bytes of target chromosome data to cache; targets are
+        reused by every query, so the cache should fit all of them (can also be
+        specified using the {targetcachesize_envvar} environment variable).
+        """,
+    )
+
+    workers_envvar = "WORKERS"
+    parser.add_argument(
+        "--workers",
+        action=EnvArg,
+        envvar=workers_envvar,
+        type=int,
+        default=os.cpu_count(),
+        help=f"""
+        The number of worker processes that compute blocks; 0 computes blocks in the
+        main process (can also be specified using the {workers_envvar} environment
+        variable).
+        """,
+    )
+
+    pairbudget_envvar = "PAIR_BUDGET"
+    parser.add_argument(
+        "--pair-budget",
+        dest="pair_budget",
+        action=EnvArg,
+        envvar=pairbudget_envvar,
+        type=int,
+        default=0,
+        help=f"""
+        The maximum number of matching gene pairs computed for a target chromosome,
+        which should be the same as the pairwise microservice's; 0 means there's no
+        budget (can also be specified using the {pairbudget_envvar} environment
+        variable).
+        """,
+    )
+    pairbudgetstrategy_envvar = "PAIR_BUDGET_STRATEGY"
+    parser.add_argument(
+        "--pair-budget-strategy",
+        dest="pair_budget_strategy",
+        action=EnvArg,
+        envvar=pairbudgetstrategy_envvar,
+        type=str,
+        choices=PAIR_BUDGET_STRATEGIES,
+        default="mask",
+        help=f"""
+        What to do when a target exceeds the pair budget, which should be the same
+        as the pairwise microservice's: mask the query families with the most pairs
+        until the budget is met or skip the query, since the microservice would
+        reject its requests (can also be specified using the
+        {pairbudgetstrategy_envvar} environment variable).
+        """,
+    )
+
+    return parser.parse_args()
+
+
+# gets the name and genome of every chromosome, indexed by chromosome ID
+async def getChromosomeGenomes(connection):
+    names = await connection.lrange(CHROMOSOME_NAMES_KEY, 0, -1)
+    pipeline = connection.pipeline(transaction=False)
+    for name in names:
+        pipeline.hmget(f"chromosome:{name}", "genus", "species")
+    genomes = [tuple(genome) for genome in await pipeline.execute()]
+    return names, genomes
+
+
+# determines which target chromosome IDs each query chromosome ID should be compared
+# to; every chromosome is compared to every chromosome, including itself, if no
+# genome pairs are given, which is what the microservice does for a query without
+# targets
+def getComparisons(genomes, genome_pairs):
+    chromosome_ids = range(len(genomes))
+    if not genome_pairs:
+        return {i: list(chromosome_ids) for i in chromosome_ids}
+    genome_chromosomes = defaultdict(list)
+    for chromosome_id, genome in enumerate(genomes):
+        genome_chromosomes[genome].append(chromosome_id)
+    comparisons = defaultdict(set)
+    for genome1, genome2 in genome_pairs:
+        for query_genome, target_genome in ((genome1, genome2), (genome2, genome1)):
+            for query_id in genome_chromosomes[query_genome]:
+                comparisons[query_id].update(genome_chromosomes[target_genome])
+    return {i: sorted(comparisons[i]) for i in sorted(comparisons)}
+
+
+# gets the blocks and target IDs that have already been precomputed for a query
+async def getPrecomputed(connection, key, name):
+    pipeline = connection.pipeline(transaction=False)
+    pipeline.execute_command("HGET", f"{key}:blocks", name, NEVER_DECODE=True)
+    pipeline.execute_command("HGET", f"{key}:targets", name, NEVER_DECODE=True)
+    blocks_data, targets_data = await pipeline.execute()
+    if blocks_data is None or targets_data is None:
+        return [], []
+    reply = ManyReply.FromString(zlib.decompress(blocks_data))
+    target_ids = unpackArray("i", zlib.decompress(targets_data))
+    return list(reply.blocks), list(target_ids)
+
+
+# computes the blocks of each query chromosome and the targets it hasn't been
+# compared to yet and stores them; the blocks and targets are stored together
+# so a query's stored blocks are always complete for its stored targets
+async def precompute(connection, handler, args):
+    chromosome_genes = args.chromosome_genes or args.matched
+    key = precomputedKey(
+        args.matched,
+        args.intermediate,
+        args.mask,
+        args.optional_metrics,
+        chromosome_genes,
+        args.chromosome_length,
+        args.pair_budget,
+        args.pair_budget_strategy,
+    )
+    # forget blocks computed before the database was last loaded
+    load_epoch = await connection.get(LOAD_EPOCH_KEY)
+    if load_epoch is None:
+        logging.warning(
+            "The database has no load epoch so the microservice won't use the "
+            "precomputed blocks"
+        )
+    if await connection.hget(key, "epoch") != (load_epoch or ""):
+        parameters = {
+            "matched": args.matched,
+            "intermediate": args.intermediate,
+            "mask": args.mask,
+            "optionalMetrics": args.optional_metrics,
+            "chromosomeGenes": chromosome_genes,
+            "chromosomeLength": args.chromosome_length,
+            "pairBudget": args.pair_budget,
+            "pairBudgetStrategy": args.pair_budget_strategy,
+        }
+        pipeline = connection.pipeline(transaction=True)
+        pipeline.delete(key, f"{key}:blocks", f"{key}:targets")
+        pipeline.hset(
+            key,
+            mapping={"epoch": load_epoch or "", "parameters": json.dumps(parameters)},
+        )
+        await pipeline.execute()
+
+    names, genomes = await getChromosomeGenomes(connection)
+    lengths, gene_counts = await getChromosomeSizes(connection)
+    comparisons = getComparisons(genomes, args.genome_pairs)
+    logging.info(f"Precomputing blocks for {len(comparisons)} query chromosomes")
+    for n, (query_id, target_ids) in enumerate(comparisons.items(), 1):
+        name = names[query_id]
+        stored_blocks, stored_target_ids = await getPrecomputed(connection, key, name)
+        stored = set(stored_target_ids)
+        target_ids = [i for i in target_ids if i not in stored]
+        if not target_ids:
+            logging.info(f"{n}/{len(comparisons)}: {name} is already precomputed")
+            continue
+        # only compute the blocks of the targets the microservice would compute them
+        # for; the rest are still stored as compared since they have no blocks
+        match_indices = await getQueryMatchIndices(connection, name, target_ids)
+        if match_indices is None:
+            logging.warning(f'Chromosome "{name}" not found')
+            continue
+        query_length, chromosome_match_indices = match_indices
+        filtered_ids = set(
+            filterTargets(
+                chromosome_match_indices,
+                lengths,
+                gene_counts,
+                query_length,
+                args.matched,
+                args.intermediate,
+                chromosome_genes,
+                args.chromosome_length,
+            )
+        )
+        targets = [names[i] for i in target_ids if i in filtered_ids]
+        target_blocks = []
+        if targets:
+            arguments = handler.parseManyArguments(
+                None,
+                targets,
+                args.matched,
+                args.intermediate,
+                args.mask,
+                args.optional_metrics,
+                chromosome_genes,
+                args.chromosome_length,
+                name,
+            )
+            try:
+                target_blocks, _ = await handler.processMany(*arguments)
+            except QueryNotFoundError as e:
+                logging.warning(e)
+                continue
+            except PairBudgetError as e:
+                logging.warning(f"{name} is not precomputed: {e}")
+                continue
+        blocks = stored_blocks + [
+            block_pb2.Blocks(chromosome=target, blocks=list(map(blockToMessage, b)))
+            for target, b in zip(targets, target_blocks)
+            if b  # false for None or []
+        ]
+        reply = ManyReply(blocks=blocks)
+        pipeline = connection.pipeline(transaction=True)
+        pipeline.hset(f"{key}:blocks", name, zlib.compress(reply.SerializeToString()))
+        pipeline.hset(
+            f"{key}:targets",
+            name,
+            zlib.compress(packArray("i", sorted(stored.union(target_ids)))),
+        )
+        await pipeline.execute()
+        logging.info(
+            f"{n}/{len(comparisons)}: {name} has blocks with {len(blocks)} of "
+            f"{len(stored) + len(target_ids)} targets"
+        )
+
+
+def main():
+    # parse the command line arguments / environment variables
+    args = parseArgs()
+    if args.workers < 0:
+        exit("--workers can't be negative")
+    if (
+        args.matched <= 0
+        or args.intermediate <= 0
+        or args.chromosome_length <= 0
+        or (args.chromosome_genes is not None and args.chromosome_genes <= 0)
+        or (args.mask is not None and args.mask <= 0)
+    ):
+        exit(
+            "--matched, --intermediate, --mask, --chromosome-genes, and "
+            "--chromosome-length must be positive"
+        )
+    for metric in args.optional_metrics:
+        if metric.split(":")[0] not in METRICS:
+            exit(f'"{metric}" is not a valid metric')
+
+    # setup logging
+    logging.basicConfig(
+        format="%(asctime)s,%(msecs)d %(levelname)s: %(message)s",
+        datefmt="%H:%M:%S",
+        level=LOG_LEVELS[args.log_level],
+    )
+
+    # initialize asyncio
+    loop = uvloop.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    # run the program
+    handler = None
+    try:
+        # create the database connection
+        redis_connection = loop.run_until_complete(
+            connectToRedis(
+                args.rhost,
+                args.rport,
+                args.rdb,
+                args.rpassword,
+                schema_version=PRECOMPUTE_SCHEMA_VERSION,
+            )
+        )
+        # create the request handler whose process pool computes the blocks
+        handler = RequestHandler(
+            redis_connection,
+            args.chaining_engine,
+            target_cache_size=args.target_cache_size,
+            workers=args.workers,
+            pair_budget=args.pair_budget,
+            pair_budget_strategy=args.pair_budget_strategy,
+        )
+        loop.run_until_complete(precompute(redis_connection, handler, args))
+    finally:
+        if handler is not None:
+            handler.close()
+        loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,212 @@
 # Python
+import asyncio
+import hashlib
+import multiprocessing
+import sys
+import time
+from array import array
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from itertools import chain
 
-# dependencies
-from redis.commands.search import AsyncSearch
-
 # module
+from pairwise_macro_synteny_blocks.cache import LRUCache
+from pairwise_macro_synteny_blocks.chaining import CHAINING_ENGINES
+from pairwise_macro_synteny_blocks.database import (
+    FAMILY_IDS_KEY,
+    FAMILY_NAMES_KEY,
+    LOAD_EPOCH_KEY,
+    ORPHAN_FAMILY_ID,
+    PACKED_LOCATION_SIZE,
+    ChromosomeReference,
+    unpackArray,
+    unpackInt,
+)
 from pairwise_macro_synteny_blocks.metrics import METRICS
 
+# the maximum number of blocks generated at a time by RequestHandler.processStream
+STREAM_CHUNK_SIZE = 64
+
+# what to do when a target exceeds the pair budget:
+#   mask: mask the query families with the most pairs until the budget is met
+#   fail: reject the request
+PAIR_BUDGET_STRATEGIES = ["mask", "fail"]
+
+
+class PairBudgetError(Exception):
+    """
+    The exception to raise when a target exceeds the pair budget and the pair
+    budget strategy is to fail.
+    """
+
+    pass
+
+
+class QueryNotFoundError(Exception):
+    """
+    The exception to raise when the chromosome a query refers to isn't in the
+    database.
+    """
+
+    pass
+
+
+class DeadlineExceededError(Exception):
+    """
+    The exception to raise when a request's deadline passes before its blocks have
+    been computed.
+    """
+
+    pass
+
+
+# the stages at which targets are rejected, in order, followed by the number of
+# targets that have blocks:
+#   notFound: the target chromosome isn't in the database
+#   size: the target chromosome is too short or has too few genes
+#   pairs: the target has fewer matching gene pairs than the matched parameter
+#   window: no intermediate-bounded cluster of pairs is big enough for a block
+#   chaining: chaining found no blocks
+TARGET_STAGES = ["notFound", "size", "pairs", "window", "chaining", "blocks"]
+
+# the request handler each process pool worker uses to compute blocks
+_worker_handler = None
+
+
+def _initializeWorker(chaining_engine, pair_budget, pair_budget_strategy):
+    global _worker_handler
+    _worker_handler = RequestHandler(
+        None,
+        chaining_engine,
+        pair_budget=pair_budget,
+        pair_budget_strategy=pair_budget_strategy,
+    )
+
+
+def _targetsToBlocks(*args):
+    return _worker_handler._targetsToBlocks(*args)
+
+
+def _blocksMetrics(*args):
+    return _worker_handler._blocksMetrics(*args)
+
 
 class RequestHandler:
-    def __init__(self, redis_connection):
+    def __init__(
+        self,
+        redis_connection,
+        chaining_engine="python",
+        query_cache_size=0,
+        target_cache_size=0,
+        workers=0,
+        pair_budget=0,
+        pair_budget_strategy="mask",
+    ):
         self.redis_connection = redis_connection
+        # query family index maps are cached since many concurrent requests, e.g.
+        # from a macro-synteny blocks fan-out, will have the same query
+        self.query_cache = LRUCache(query_cache_size)
+        # target chromosomes are cached until the database's load epoch changes
+        self.target_cache = LRUCache(target_cache_size, self._targetCacheEntrySize)
+        self.load_epoch = None
+        # the default engine is the recurrence implemented by the handler itself
+        if chaining_engine == "python":
+            self.indexPairsToIndexBlocks = self._indexPairsToIndexBlocks
+        elif chaining_engine in CHAINING_ENGINES:
+            self.indexPairsToIndexBlocks = CHAINING_ENGINES[chaining_engine]
+        else:
+            raise ValueError(f'"{chaining_engine}" is not a valid chaining engine')
+        # the maximum number of gene pairs computed for a target, which bounds the
+        # time and memory used by the chaining when large families aren't masked;
+        # 0 means there's no budget
+        if pair_budget_strategy not in PAIR_BUDGET_STRATEGIES:
+            raise ValueError(
+                f'"{pair_budget_strategy}" is not a valid pair budget strategy'
+            )
+        self.pair_budget = pair_budget
+        self.pair_budget_strategy = pair_budget_strategy
+        self.pair_budget_stats = {"exceeded": 0, "droppedFamilies": 0}
+        # the chaining and metrics are CPU-bound so they're optionally run in a
+        # process pool to keep them from blocking the event loop; worker processes
+        # are spawned rather than forked since the gRPC server runs threads
+        self.workers = workers
+        self.process_pool = None
+        if workers > 0:
+            self.process_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_initializeWorker,
+                initargs=(chaining_engine, pair_budget, pair_budget_strategy),
+            )
+        self.pool_stats = {
+            "submitted": 0,
+            "completed": 0,
+            "pending": 0,
+            "maxQueued": 0,
+        }
+        # how many targets were rejected at each stage of the computation and how
+        # many had blocks
+        self.target_stats = dict.fromkeys(TARGET_STAGES, 0)
+
+    def close(self):
+        if self.process_pool is not None:
+            self.process_pool.shutdown(cancel_futures=True)
+
+    def stats(self):
+        pending = self.pool_stats["pending"]
+        return {
+            "queryCache": self.query_cache.stats(),
+            "targetCache": self.target_cache.stats(),
+            "loadEpoch": self.load_epoch,
+            "targets": dict(self.target_stats),
+            "pairBudget": {
+                "budget": self.pair_budget,
+                "strategy": self.pair_budget_strategy,
+                **self.pair_budget_stats,
+            },
+            "processPool": {
+                "workers": self.workers,
+                "queued": max(0, pending - self.workers),
+                **self.pool_stats,
+            },
+        }
 
     def _parseMetric(self, metric):
         name, *args = metric.split(":")
         return name, args
 
-    def parseArguments(
+    # parses a query given as a reference to a chromosome in the database
+    def _parseReference(self, chromosome_name, chromosome_start, chromosome_stop):
+        name = str(chromosome_name)
+        start = None if chromosome_start is None else int(chromosome_start)
+        stop = None if chromosome_stop is None else int(chromosome_stop)
+        if (start is not None and start < 0) or (stop is not None and stop < 0):
+            raise ValueError("chromosome start and stop can't be negative")
+        if start is not None and stop is not None and start > stop:
+            raise ValueError("chromosome start can't be greater than stop")
+        return ChromosomeReference(name, start, stop)
+
+    def _parseArguments(
         self,
         chromosome,
-        target,
         matched,
         intermediate,
         mask,
         metrics,
         chromosome_genes,
         chromosome_length,
+        chromosome_name=None,
+        chromosome_start=None,
+        chromosome_stop=None,
     ):
-        iter(chromosome)  # TypeError if not iterable
-        if target is None:
-            raise ValueError("target is required")
+        # the query is either a list of functional annotations or a reference to a
+        # chromosome in the database
+        if chromosome_name:
+            chromosome = self._parseReference(
+                chromosome_name, chromosome_start, chromosome_stop
+            )
+        else:
+            iter(chromosome)  # TypeError if not iterable
         matched = int(matched)  # ValueError
         intermediate = int(intermediate)  # ValueError
         if chromosome_genes is None:
@@ -68,7 +244,6 @@ class RequestHandler:
                 raise ValueError(f'"{metric}" is not a valid metric')
         return (
             chromosome,
-            target,
             matched,
             intermediate,
             mask,
@@ -77,14 +252,107 @@ class RequestHandler:
             chromosome_length,
         )
 
-    # given a query chromosome and a target chromosome as ordered lists of
-    # functional annotations, the function computes a gene index pair for each
-    # pair of query-target indexes that have the same annotation
-    def _chromosomesToIndexPairs(self, query_chromosome, target_chromosome, mask):
+    def parseArguments(
+        self,
+        chromosome,
+        target,
+        matched,
+        intermediate,
+        mask,
+        metrics,
+        chromosome_genes,
+        chromosome_length,
+        chromosome_name=None,
+        chromosome_start=None,
+        chromosome_stop=None,
+    ):
+        if target is None:
+            raise ValueError("target is required")
+        chromosome, *arguments = self._parseArguments(
+            chromosome,
+            matched,
+            intermediate,
+            mask,
+            metrics,
+            chromosome_genes,
+            chromosome_length,
+            chromosome_name,
+            chromosome_start,
+            chromosome_stop,
+        )
+        return (chromosome, target, *arguments)
+
+    def parseManyArguments(
+        self,
+        chromosome,
+        targets,
+        matched,
+        intermediate,
+        mask,
+        metrics,
+        chromosome_genes,
+        chromosome_length,
+        chromosome_name=None,
+        chromosome_start=None,
+        chromosome_stop=None,
+    ):
+        if targets is None:
+            raise ValueError("targets are required")
+        targets = list(targets)  # TypeError if not iterable
+        chromosome, *arguments = self._parseArguments(
+            chromosome,
+            matched,
+            intermediate,
+            mask,
+            metrics,
+            chromosome_genes,
+            chromosome_length,
+            chromosome_name,
+            chromosome_start,
+            chromosome_stop,
+        )
+        return (chromosome, targets, *arguments)
+
+    # given a query chromosome as an ordered list of functional annotations, the
+    # function looks up the annotations' integer IDs in the database; annotations
+    # that aren't in the database are given distinct negative IDs so they don't
+    # match any target annotations or each other
+    async def _queryToFamilyIds(self, query_chromosome):
+        orphan = ""
+        families = list(set(query_chromosome) - {orphan})
+        family_ids = {orphan: ORPHAN_FAMILY_ID}
+        if families:
+            ids = await self.redis_connection.hmget(FAMILY_IDS_KEY, families)
+            unknown_id = ORPHAN_FAMILY_ID
+            for f, family_id in zip(families, ids):
+                if family_id is None:
+                    unknown_id -= 1
+                    family_ids[f] = unknown_id
+                else:
+                    family_ids[f] = int(family_id)
+        return array("i", map(family_ids.__getitem__, query_chromosome))
+
+    # given a query that refers to a chromosome in the database, the function gets
+    # the functional annotation IDs of the genes in the referenced range directly
+    async def _referenceToFamilyIds(self, reference):
+        key = f"chromosome:{reference.name}:familyids"
+        families = await self.redis_connection.execute_command(
+            "GET", key, NEVER_DECODE=True
+        )
+        if families is None:
+            raise QueryNotFoundError(f'Chromosome "{reference.name}" not found')
+        start = reference.start or 0
+        stop = None if reference.stop is None else reference.stop + 1
+        return unpackArray("i", families)[start:stop]
+
+    # given a query chromosome as an ordered list of functional annotation IDs, the
+    # function computes a map from each annotation to its indexes in the chromosome
+    # and the set of annotations that were masked because they have too many members
+    def _queryFamilyIndexMap(self, query_chromosome, mask):
         # make a dictionary that maps query chromosome families to gene indices
         query_family_index_map = defaultdict(list)
-        orphan = ""
-        masked_families = set(orphan)
+        orphan = ORPHAN_FAMILY_ID
+        masked_families = set()
         for i, f in enumerate(query_chromosome):
             if f != orphan:
                 query_family_index_map[f].append(i)
@@ -93,7 +361,163 @@ class RequestHandler:
         # remove families that have too many members
         for f in masked_families:
             del query_family_index_map[f]
+        return query_family_index_map, masked_families
+
+    # computes the query chromosome's functional annotation IDs, family index map,
+    # and masked families
+    async def _computeQuery(self, query_chromosome, mask):
+        if isinstance(query_chromosome, ChromosomeReference):
+            query_family_ids = await self._referenceToFamilyIds(query_chromosome)
+        else:
+            query_family_ids = await self._queryToFamilyIds(query_chromosome)
+        query_family_index_map, masked_families = self._queryFamilyIndexMap(
+            query_family_ids, mask
+        )
+        return query_family_ids, query_family_index_map, masked_families
+
+    # gets the query chromosome's functional annotation IDs, family index map, and
+    # masked families from the cache, computing and caching them if necessary; the
+    # computation itself is cached so concurrent requests with the same query share
+    # a single computation
+    async def _getQuery(self, query_chromosome, mask):
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(str(mask).encode())
+        # references can't collide with annotation lists since they're tuples
+        if isinstance(query_chromosome, ChromosomeReference):
+            digest.update(repr(tuple(query_chromosome)).encode())
+        else:
+            for f in query_chromosome:
+                digest.update(b"\n")
+                digest.update(f.encode())
+        key = digest.digest()
+        future = self.query_cache.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._computeQuery(query_chromosome, mask))
+            self.query_cache.put(key, future)
+        try:
+            return await asyncio.shield(future)
+        except Exception:
+            self.query_cache.pop(key)
+            raise
+
+    # approximates how many bytes a target cache entry uses
+    def _targetCacheEntrySize(self, entry):
+        size = sys.getsizeof(entry)
+        for k, v in entry["doc"].items():
+            size += sys.getsizeof(k) + sys.getsizeof(v)
+        if entry["families"] is not None:
+            size += sys.getsizeof(entry["families"])
+        return size
+
+    # gets the document and number of genes of each target chromosome from the
+    # cache or the database; the cache is cleared whenever the database's load
+    # epoch changes, i.e. whenever the Redis loader has been run
+    async def _getTargetEntries(self, targets):
+        while True:
+            entries = list(map(self.target_cache.get, targets))
+            pipeline = self.redis_connection.pipeline()
+            pipeline.get(LOAD_EPOCH_KEY)
+            for target, entry in zip(targets, entries):
+                if entry is None:
+                    pipeline.hgetall(f"chromosome:{target}")
+                    pipeline.llen(f"chromosome:{target}:genes")
+            epoch, *results = await pipeline.execute()
+            if epoch == self.load_epoch:
+                break
+            self.load_epoch = epoch
+            self.target_cache.clear()
+            # family IDs may have changed too
+            self.query_cache.clear()
+            # refetch the entries that came from the cache since they may be stale
+            if all(entry is None for entry in entries):
+                break
+        results = iter(results)
+        for i, (target, entry) in enumerate(zip(targets, entries)):
+            if entry is None:
+                target_doc, num_genes = next(results), next(results)
+                # the target chromosome wasn't found
+                if "name" not in target_doc:
+                    continue
+                entry = {"doc": target_doc, "genes": num_genes, "families": None}
+                self.target_cache.put(target, entry)
+                entries[i] = entry
+        return entries
+
+    # adds the functional annotation IDs of the genes on each target chromosome to
+    # the target's entry, fetching them from the database if necessary
+    async def _getTargetFamilies(self, targets, entries):
+        uncached = [
+            (target, entry)
+            for target, entry in zip(targets, entries)
+            if entry["families"] is None
+        ]
+        if not uncached:
+            return
+        # NOTE: binary replies can only be left undecoded outside of transactions
+        pipeline = self.redis_connection.pipeline(transaction=False)
+        for target, _ in uncached:
+            key = f"chromosome:{target}:familyids"
+            pipeline.execute_command("GET", key, NEVER_DECODE=True)
+        results = await pipeline.execute()
+        for (target, entry), families in zip(uncached, results):
+            entry["families"] = unpackArray("i", families or b"")
+            # update the entry's size in the cache
+            self.target_cache.put(target, entry)
+
+    # given a query family index map and a target chromosome as an ordered list of
+    # functional annotation IDs, the function counts how many gene index pairs each
+    # annotation will contribute
+    def _familyPairCounts(self, query_family_index_map, target_chromosome, mask):
+        target_family_counts = defaultdict(int)
+        for f in target_chromosome:
+            if f in query_family_index_map:
+                target_family_counts[f] += 1
+        return {
+            f: len(query_family_index_map[f]) * count
+            for f, count in target_family_counts.items()
+            if count <= mask
+        }
+
+    # raises a PairBudgetError if any of the target chromosomes would have more gene
+    # index pairs than the pair budget allows
+    def _checkPairBudget(self, query_family_index_map, target_chromosomes, mask):
+        for target_chromosome in target_chromosomes:
+            family_pair_counts = self._familyPairCounts(
+                query_family_index_map, target_chromosome, mask
+            )
+            num_pairs = sum(family_pair_counts.values())
+            if num_pairs > self.pair_budget:
+                self.pair_budget_stats["exceeded"] += 1
+                raise PairBudgetError(
+                    f"A target has {num_pairs} matching gene pairs, which exceeds the "
+                    f"pair budget of {self.pair_budget}; try using a smaller mask"
+                )
+
+    # given a query family index map and a target chromosome, the function
+    # determines which annotations to mask so the target's gene index pairs fit in
+    # the pair budget, masking the annotations with the most pairs first
+    def _budgetMaskedFamilies(self, query_family_index_map, target_chromosome, mask):
+        family_pair_counts = self._familyPairCounts(
+            query_family_index_map, target_chromosome, mask
+        )
+        num_pairs = sum(family_pair_counts.values())
+        dropped_families = []
+        if num_pairs <= self.pair_budget:
+            return dropped_families
+        ordered_families = sorted(
+            family_pair_counts.items(), key=lambda item: (-item[1], item[0])
+        )
+        for f, count in ordered_families:
+            if num_pairs <= self.pair_budget:
+                break
+            dropped_families.append(f)
+            num_pairs -= count
+        return dropped_families
 
+    # given a query family index map and a target chromosome as an ordered list of
+    # functional annotation IDs, the function computes a gene index pair for each pair
+    # of query-target indexes that have the same annotation
+    def _targetToIndexPairs(self, query_family_index_map, target_chromosome, mask):
         # count each family's number of occurrence on the target chromosome
         target_family_counts = defaultdict(int)
         for f in target_chromosome:
@@ -106,6 +530,18 @@ class RequestHandler:
             if target_family_counts[f] <= mask and f in query_family_index_map:
                 pairs.extend(map(lambda n: (i, n), query_family_index_map[f]))
 
+        return pairs
+
+    # given a query chromosome and a target chromosome as ordered lists of
+    # functional annotation IDs, the function computes a gene index pair for each
+    # pair of query-target indexes that have the same annotation
+    def _chromosomesToIndexPairs(self, query_chromosome, target_chromosome, mask):
+        query_family_index_map, masked_families = self._queryFamilyIndexMap(
+            query_chromosome, mask
+        )
+        pairs = self._targetToIndexPairs(
+            query_family_index_map, target_chromosome, mask
+        )
         return pairs, masked_families
 
     # given a set of index pair DAG path endpoints, the graph edges (pointers),
@@ -125,6 +561,25 @@ class RequestHandler:
                 if length >= matched:
                     yield (begin, end)
 
+    # given index pairs in DAG order, the function splits them into clusters where
+    # consecutive pairs are within the intermediate distance of each other on the
+    # target axis and returns the pairs in clusters that could contain a block;
+    # every edge in the DAG is within a cluster and every node in a path has a
+    # different query index, so a cluster with fewer than matched distinct query
+    # indexes can't contain a block and removing it doesn't affect other clusters
+    def _windowFilter(self, pairs, intermediate, matched):
+        filtered = []
+        begin = 0
+        num_pairs = len(pairs)
+        for end in range(1, num_pairs + 1):
+            if end == num_pairs or pairs[end][0] - pairs[end - 1][0] > intermediate:
+                if end - begin >= matched:
+                    query_indexes = set(n2 for _, n2 in pairs[begin:end])
+                    if len(query_indexes) >= matched:
+                        filtered.extend(pairs[begin:end])
+                begin = end
+        return filtered
+
     # "constructs" a DAG using the index pairs as nodes and computes longest
     # forward (f_) and reverse (r_) oriented paths (blocks) using a recurrence
     # relation similar to that of DAGchainer
@@ -180,65 +635,65 @@ class RequestHandler:
         )
         return chain(f, r)
 
-    async def process(
+    # given a target chromosome and the query family index map, the function
+    # computes the target's blocks, sans physical locations, the target gene
+    # indexes whose locations are needed to compute their physical locations, the
+    # stage at which the target was rejected, if it has no blocks, and the
+    # annotations that were masked to meet the pair budget; the deadline is checked
+    # between the phases of the computation so abandoned requests stop early
+    def _targetToBlocks(
         self,
         query_chromosome,
-        target,
+        query_family_index_map,
+        masked_families,
+        target_chromosome,
         matched,
         intermediate,
         mask,
         metrics,
-        chromosome_genes,
-        chromosome_length,
+        deadline=None,
     ):
-        # connect to the indexes
-        chromosome_index = AsyncSearch(
-            self.redis_connection, index_name="chromosomeIdx"
-        )
-
-        # check if the target chromosome exists
-        target_doc_id = f"chromosome:{target}"
-        target_doc = await chromosome_index.load_document(target_doc_id)
-        # exit if the target chromosome wasn't found
-        if not hasattr(target_doc, "name"):
-            return None
-
-        # exit if the chromosome is too short
-        if int(target_doc.length) < chromosome_length:
-            return []
+        self._checkDeadline(deadline)
 
-        # count how many genes are on the target chromosome
-        num_genes = await self.redis_connection.llen(f"{target_doc_id}:genes")
-
-        # exit if there aren't enough genes on the chromosome or for a single block
-        if num_genes < matched or num_genes < chromosome_genes:
-            return []
-
-        # get the functional annotations of the genes on the target chromosome
-        target_chromosome = await self.redis_connection.lrange(
-            f"{target_doc_id}:families", 0, -1
-        )
+        # mask the annotations with the most pairs if there are too many pairs
+        dropped_families = []
+        if self.pair_budget:
+            dropped_families = self._budgetMaskedFamilies(
+                query_family_index_map, target_chromosome, mask
+            )
+        if dropped_families:
+            query_family_index_map = {
+                f: indexes
+                for f, indexes in query_family_index_map.items()
+                if f not in dropped_families
+            }
+            masked_families = masked_families.union(dropped_families)
 
         # compute gene index pairs based on matching annotations
-        index_pairs, masked_families = self._chromosomesToIndexPairs(
-            query_chromosome, target_chromosome, mask
+        index_pairs = self._targetToIndexPairs(
+            query_family_index_map, target_chromosome, mask
         )
 
         # exit if there aren't enough pairs to construct even a single block that
         # satisfies the matched requirement
         if len(index_pairs) < matched:
-            return []
+            return [], [], "pairs", dropped_families
+        self._checkDeadline(deadline)
 
-        # create a filter for removing masked families
-        def maskFilter(f):
-            return f not in masked_families
+        # exit if no cluster of pairs is big enough to contain such a block, and
+        # only chain the pairs in clusters that are
+        index_pairs = self._windowFilter(index_pairs, intermediate, matched)
+        if not index_pairs:
+            return [], [], "window", dropped_families
+        self._checkDeadline(deadline)
 
         # index blocks from the index pairs
-        index_blocks = self._indexPairsToIndexBlocks(index_pairs, intermediate, matched)
+        index_blocks = self.indexPairsToIndexBlocks(index_pairs, intermediate, matched)
+        self._checkDeadline(deadline)
 
         # convert the index blocks into output blocks
         blocks = []
-        pipeline = self.redis_connection.pipeline()
+        target_indexes = []
         for begin_pair, end_pair in index_blocks:
             # determine the query start/stop indexes and block orientation based on
             # the query index values
@@ -247,47 +702,508 @@ class RequestHandler:
                 if begin_pair[1] < end_pair[1]
                 else (end_pair[1], begin_pair[1], "-")
             )
-            # get the physical locations of the target start gene
+            # save the target start and end genes so their physical locations can be
+            # looked up
             target_start_index = begin_pair[0]
-            pipeline.lindex(f"{target_doc_id}:fmins", target_start_index)
-            pipeline.lindex(f"{target_doc_id}:fmaxs", target_start_index)
-            # get the physical locations of the target end gene
             target_stop_index = end_pair[0]
-            pipeline.lindex(f"{target_doc_id}:fmins", target_stop_index)
-            pipeline.lindex(f"{target_doc_id}:fmaxs", target_stop_index)
+            target_indexes.append((target_start_index, target_stop_index))
             # make and save the block
             block = {
                 "i": query_start_index,
                 "j": query_stop_index,
                 "orientation": orientation,
             }
-            # compute optional metrics on the block
-            if metrics:
-                block["optionalMetrics"] = []
-                query_families = list(
-                    filter(
-                        maskFilter,
-                        query_chromosome[query_start_index : query_stop_index + 1],
-                    )
+            blocks.append(block)
+
+        # compute optional metrics on the blocks
+        if metrics:
+            blocks_metrics = self._blocksMetrics(
+                query_chromosome,
+                target_chromosome,
+                masked_families,
+                blocks,
+                target_indexes,
+                metrics,
+                deadline,
+            )
+            for block, block_metrics in zip(blocks, blocks_metrics):
+                block["optionalMetrics"] = block_metrics
+
+        stage = "blocks" if blocks else "chaining"
+        return blocks, target_indexes, stage, dropped_families
+
+    # computes the optional metrics of each of the given blocks of a target from the
+    # annotations in the blocks that aren't masked; this is CPU-bound, so it's run in
+    # the process pool when blocks are streamed
+    def _blocksMetrics(
+        self,
+        query_chromosome,
+        target_chromosome,
+        masked_families,
+        blocks,
+        target_indexes,
+        metrics,
+        deadline=None,
+    ):
+        # create a filter for removing masked families
+        def maskFilter(f):
+            return f not in masked_families
+
+        blocks_metrics = []
+        for block, (target_start_index, target_stop_index) in zip(
+            blocks, target_indexes
+        ):
+            self._checkDeadline(deadline)
+            query_families = list(
+                filter(maskFilter, query_chromosome[block["i"] : block["j"] + 1])
+            )
+            target_families = list(
+                filter(
+                    maskFilter,
+                    target_chromosome[target_start_index : target_stop_index + 1],
                 )
-                target_families = list(
-                    filter(
-                        maskFilter,
-                        target_chromosome[target_start_index : target_stop_index + 1],
+            )
+            if block["orientation"] == "-":
+                target_families = target_families[::-1]
+            block_metrics = []
+            for metric in metrics:
+                name, args = self._parseMetric(metric)
+                value = METRICS[name](query_families, target_families, *args)
+                block_metrics.append(value)
+            blocks_metrics.append(block_metrics)
+        return blocks_metrics
+
+    # computes the optional metrics of the blocks in the process pool, if there is
+    # one; otherwise the event loop is yielded to first so the request can be
+    # cancelled
+    async def _computeBlocksMetrics(self, *args):
+        if self.process_pool is None:
+            await asyncio.sleep(0)
+            return self._blocksMetrics(*args)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.process_pool, _blocksMetrics, *args)
+        self._taskSubmitted(future)
+        return await future
+
+    # raises an error if the given deadline, in seconds since the epoch so it's
+    # meaningful in worker processes too, has passed; None means there's no deadline
+    def _checkDeadline(self, deadline):
+        if deadline is not None and time.time() >= deadline:
+            raise DeadlineExceededError("Deadline exceeded")
+
+    # computes the blocks of each of the given target chromosomes; this is the
+    # CPU-bound part of a request, so it's what's run in the process pool
+    def _targetsToBlocks(
+        self,
+        query_chromosome,
+        query_family_index_map,
+        masked_families,
+        target_chromosomes,
+        matched,
+        intermediate,
+        mask,
+        metrics,
+        deadline=None,
+    ):
+        return [
+            self._targetToBlocks(
+                query_chromosome,
+                query_family_index_map,
+                masked_families,
+                target_chromosome,
+                matched,
+                intermediate,
+                mask,
+                metrics,
+                deadline,
+            )
+            for target_chromosome in target_chromosomes
+        ]
+
+    # computes the blocks of the target chromosomes in the process pool, if there is
+    # one, so the event loop is free to handle other requests in the meantime; the
+    # targets are split into a chunk per worker. Without a pool, the event loop is
+    # yielded to between targets so a request can be cancelled when its caller goes
+    # away; chunks that a worker has already started can't be cancelled, so they
+    # stop at the deadline instead
+    async def _computeTargetsBlocks(
+        self,
+        query_chromosome,
+        query_family_index_map,
+        masked_families,
+        target_chromosomes,
+        matched,
+        intermediate,
+        mask,
+        metrics,
+        deadline=None,
+    ):
+        if self.process_pool is None:
+            results = []
+            for target_chromosome in target_chromosomes:
+                await asyncio.sleep(0)
+                results.append(
+                    self._targetToBlocks(
+                        query_chromosome,
+                        query_family_index_map,
+                        masked_families,
+                        target_chromosome,
+                        matched,
+                        intermediate,
+                        mask,
+                        metrics,
+                        deadline,
                     )
                 )
-                if orientation == "-":
-                    target_families = target_families[::-1]
-                for metric in metrics:
-                    name, args = self._parseMetric(metric)
-                    value = METRICS[name](query_families, target_families, *args)
-                    block["optionalMetrics"].append(value)
-            blocks.append(block)
-        locations = await pipeline.execute()
-        for i, block in enumerate(blocks):
-            n = i * 4
+            return results
+        loop = asyncio.get_running_loop()
+        chunk_size = -(-len(target_chromosomes) // self.workers)
+        futures = []
+        for i in range(0, len(target_chromosomes), chunk_size):
+            future = loop.run_in_executor(
+                self.process_pool,
+                _targetsToBlocks,
+                query_chromosome,
+                query_family_index_map,
+                masked_families,
+                target_chromosomes[i : i + chunk_size],
+                matched,
+                intermediate,
+                mask,
+                metrics,
+                deadline,
+            )
+            self._taskSubmitted(future)
+            futures.append(future)
+        results = await asyncio.gather(*futures)
+        return list(chain.from_iterable(results))
+
+    # updates the process pool queue statistics when a task is submitted and when
+    # it's done
+    def _taskSubmitted(self, future):
+        self.pool_stats["submitted"] += 1
+        self.pool_stats["pending"] += 1
+        queued = max(0, self.pool_stats["pending"] - self.workers)
+        self.pool_stats["maxQueued"] = max(self.pool_stats["maxQueued"], queued)
+        future.add_done_callback(self._taskDone)
+
+    def _taskDone(self, future):
+        self.pool_stats["pending"] -= 1
+        self.pool_stats["completed"] += 1
+
+    # gets the entries of the target chromosomes and determines which targets could
+    # have blocks; the blocks of each target are initialized to None if the target
+    # wasn't found and to an empty list otherwise
+    async def _getCandidates(
+        self, targets, matched, chromosome_genes, chromosome_length
+    ):
+        # get each target chromosome and how many genes it has
+        entries = await self._getTargetEntries(targets)
+
+        # determine which targets could have blocks
+        target_blocks = []
+        candidates = []
+        for entry in entries:
+            # the target chromosome wasn't found
+            if entry is None:
+                target_blocks.append(None)
+                self.target_stats["notFound"] += 1
+            # the chromosome is too short or there aren't enough genes on the
+            # chromosome or for a single block
+            elif (
+                int(entry["doc"]["length"]) < chromosome_length
+                or entry["genes"] < matched
+                or entry["genes"] < chromosome_genes
+            ):
+                target_blocks.append([])
+                self.target_stats["size"] += 1
+            else:
+                candidates.append(len(target_blocks))
+                target_blocks.append([])
+
+        # get the functional annotations of the genes on the candidate chromosomes
+        if candidates:
+            await self._getTargetFamilies(
+                [targets[i] for i in candidates], [entries[i] for i in candidates]
+            )
+
+        return entries, target_blocks, candidates
+
+    # queues the lookups of the physical locations of the target genes at the ends
+    # of a target's blocks in the pipeline; the pipeline must not be a transaction
+    # since the locations are read from packed binary strings
+    def _queueBlockLocations(self, pipeline, target, target_indexes):
+        fmins_key = f"chromosome:{target}:packedfmins"
+        fmaxs_key = f"chromosome:{target}:packedfmaxs"
+        size = PACKED_LOCATION_SIZE
+        for target_start_index, target_stop_index in target_indexes:
+            for key, index in (
+                (fmins_key, target_start_index),
+                (fmaxs_key, target_start_index),
+                (fmins_key, target_stop_index),
+                (fmaxs_key, target_stop_index),
+            ):
+                offset = index * size
+                pipeline.execute_command(
+                    "GETRANGE", key, offset, offset + size - 1, NEVER_DECODE=True
+                )
+
+    # adds the physical locations looked up by _queueBlockLocations to the blocks
+    def _addBlockLocations(self, blocks, locations):
+        locations = list(map(unpackInt, locations))
+        for n, block in zip(range(0, len(locations), 4), blocks):
             start_fmin, start_fmax, end_fmin, end_fmax = locations[n : n + 4]
-            block["fmin"] = min(int(start_fmin), int(start_fmax))
-            block["fmax"] = max(int(end_fmin), int(end_fmax))
+            block["fmin"] = min(start_fmin, start_fmax)
+            block["fmax"] = max(end_fmin, end_fmax)
+
+    # maps the annotation IDs that were masked to meet the pair budget back to the
+    # query chromosome's annotations and updates the pair budget statistics
+    async def _droppedFamilyNames(
+        self, query_chromosome, query_family_index_map, dropped_families
+    ):
+        if not dropped_families:
+            return []
+        self.pair_budget_stats["exceeded"] += 1
+        self.pair_budget_stats["droppedFamilies"] += len(dropped_families)
+        # the annotations of a referenced chromosome are looked up by ID
+        if isinstance(query_chromosome, ChromosomeReference):
+            pipeline = self.redis_connection.pipeline(transaction=False)
+            for f in dropped_families:
+                pipeline.lindex(FAMILY_NAMES_KEY, f)
+            return await pipeline.execute()
+        return [
+            query_chromosome[query_family_index_map[f][0]] for f in dropped_families
+        ]
+
+    # gets the query chromosome's annotation IDs, family index map, and masked
+    # families and enforces the pair budget if the strategy is to fail
+    async def _prepareQuery(self, query_chromosome, mask, target_chromosomes):
+        query = await self._getQuery(query_chromosome, mask)
+        if self.pair_budget and self.pair_budget_strategy == "fail":
+            _, query_family_index_map, _ = query
+            self._checkPairBudget(query_family_index_map, target_chromosomes, mask)
+        return query
+
+    # computes the blocks of each target; returns a list of blocks aligned with the
+    # targets, where None means the target wasn't found, and the query annotations
+    # that were masked to meet the pair budget. The optional deadline is in seconds
+    # since the epoch and a DeadlineExceededError is raised if it passes before the
+    # blocks have been computed
+    async def processMany(
+        self,
+        query_chromosome,
+        targets,
+        matched,
+        intermediate,
+        mask,
+        metrics,
+        chromosome_genes,
+        chromosome_length,
+        deadline=None,
+    ):
+        entries, target_blocks, candidates = await self._getCandidates(
+            targets, matched, chromosome_genes, chromosome_length
+        )
+        target_chromosomes = [entries[i]["families"] for i in candidates]
+
+        # get the query even if there are no candidates so an invalid query is
+        # reported the same whether or not any targets are eligible
+        query_family_ids, query_family_index_map, masked_families = (
+            await self._prepareQuery(query_chromosome, mask, target_chromosomes)
+        )
+        if not candidates:
+            return target_blocks, []
+        self._checkDeadline(deadline)
 
-        return blocks
+        # compute the blocks for each target using a single query family index map
+        candidate_blocks = await self._computeTargetsBlocks(
+            query_family_ids,
+            query_family_index_map,
+            masked_families,
+            target_chromosomes,
+            matched,
+            intermediate,
+            mask,
+            metrics,
+            deadline,
+        )
+
+        # get the physical locations of the target genes at the ends of the blocks
+        pipeline = self.redis_connection.pipeline(transaction=False)
+        dropped_families = set()
+        for i, result in zip(candidates, candidate_blocks):
+            blocks, target_indexes, stage, target_dropped_families = result
+            self.target_stats[stage] += 1
+            target_blocks[i] = blocks
+            self._queueBlockLocations(pipeline, targets[i], target_indexes)
+            dropped_families.update(
+                await self._droppedFamilyNames(
+                    query_chromosome, query_family_index_map, target_dropped_families
+                )
+            )
+
+        # add the physical locations to the blocks
+        locations = await pipeline.execute()
+        blocks = chain.from_iterable(target_blocks[i] for i in candidates)
+        self._addBlockLocations(blocks, locations)
+
+        return target_blocks, sorted(dropped_families)
+
+    # computes the blocks of each target chromosome and generates them as soon as
+    # they're computed, in the order the targets finish rather than the order they
+    # were given when there's a process pool
+    async def _computeTargetsBlocksAsCompleted(
+        self,
+        query_chromosome,
+        query_family_index_map,
+        masked_families,
+        target_chromosomes,
+        matched,
+        intermediate,
+        mask,
+        metrics,
+        deadline=None,
+    ):
+        args = (
+            query_chromosome,
+            query_family_index_map,
+            masked_families,
+            matched,
+            intermediate,
+            mask,
+            metrics,
+            deadline,
+        )
+        if self.process_pool is None:
+            for i, target_chromosome in enumerate(target_chromosomes):
+                (result,) = await self._computeTargetsBlocks(
+                    *args[:3], [target_chromosome], *args[3:]
+                )
+                yield i, result
+            return
+
+        async def computeTargetBlocks(i, target_chromosome):
+            (result,) = await self._computeTargetsBlocks(
+                *args[:3], [target_chromosome], *args[3:]
+            )
+            return i, result
+
+        tasks = [
+            asyncio.ensure_future(computeTargetBlocks(i, target_chromosome))
+            for i, target_chromosome in enumerate(target_chromosomes)
+        ]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            # the client may stop consuming the stream early
+            for task in tasks:
+                task.cancel()
+
+    # computes the same blocks as processMany but returns an asynchronous generator
+    # that generates them as (target, blocks, dropped families) tuples as soon as
+    # their physical locations have been looked up, with at most chunk_size blocks
+    # per tuple; targets that weren't found or that have no blocks aren't generated
+    # and the query annotations masked to meet a target's pair budget are only
+    # given with its first chunk. A target's optional metrics are computed a chunk
+    # at a time after its blocks have been chained, so its first chunk doesn't wait
+    # for the metrics of all its blocks; the deadline is the same as processMany's
+    async def processStream(
+        self,
+        query_chromosome,
+        targets,
+        matched,
+        intermediate,
+        mask,
+        metrics,
+        chromosome_genes,
+        chromosome_length,
+        chunk_size=STREAM_CHUNK_SIZE,
+        deadline=None,
+    ):
+        entries, _, candidates = await self._getCandidates(
+            targets, matched, chromosome_genes, chromosome_length
+        )
+        target_chromosomes = [entries[i]["families"] for i in candidates]
+
+        # get the query before streaming so errors are raised before any output
+        query_family_ids, query_family_index_map, masked_families = (
+            await self._prepareQuery(query_chromosome, mask, target_chromosomes)
+        )
+        self._checkDeadline(deadline)
+
+        async def streamBlocks():
+            # compute the blocks for each target using a single query family index
+            # map, without their optional metrics
+            candidate_blocks = self._computeTargetsBlocksAsCompleted(
+                query_family_ids,
+                query_family_index_map,
+                masked_families,
+                target_chromosomes,
+                matched,
+                intermediate,
+                mask,
+                [],
+                deadline,
+            )
+            # look up the physical locations and compute the optional metrics of
+            # each target's blocks a chunk at a time
+            async for n, result in candidate_blocks:
+                blocks, target_indexes, stage, dropped_family_ids = result
+                self.target_stats[stage] += 1
+                dropped_families = await self._droppedFamilyNames(
+                    query_chromosome, query_family_index_map, dropped_family_ids
+                )
+                target = targets[candidates[n]]
+                target_masked_families = masked_families.union(dropped_family_ids)
+                for c in range(0, len(blocks), chunk_size):
+                    chunk = blocks[c : c + chunk_size]
+                    chunk_indexes = target_indexes[c : c + chunk_size]
+                    pipeline = self.redis_connection.pipeline(transaction=False)
+                    self._queueBlockLocations(pipeline, target, chunk_indexes)
+                    if metrics:
+                        locations, chunk_metrics = await asyncio.gather(
+                            pipeline.execute(),
+                            self._computeBlocksMetrics(
+                                query_family_ids,
+                                target_chromosomes[n],
+                                target_masked_families,
+                                chunk,
+                                chunk_indexes,
+                                metrics,
+                                deadline,
+                            ),
+                        )
+                        for block, block_metrics in zip(chunk, chunk_metrics):
+                            block["optionalMetrics"] = block_metrics
+                    else:
+                        locations = await pipeline.execute()
+                    self._addBlockLocations(chunk, locations)
+                    yield target, chunk, dropped_families if c == 0 else []
+
+        return streamBlocks()
+
+    async def process(
+        self,
+        query_chromosome,
+        target,
+        matched,
+        intermediate,
+        mask,
+        metrics,
+        chromosome_genes,
+        chromosome_length,
+        deadline=None,
+    ):
+        (blocks,), dropped_families = await self.processMany(
+            query_chromosome,
+            [target],
+            matched,
+            intermediate,
+            mask,
+            metrics,
+            chromosome_genes,
+            chromosome_length,
+            deadline,
+        )
+        return blocks, dropped_families
@@ -8,7 +8,14 @@ def int_or_str(value):
 __version__ = "1.4.0"
 VERSION = tuple(map(int_or_str, __version__.split(".")))
 
-__schema_version__ = "1.1.0"
+__schema_version__ = "1.5.0"
 SCHEMA_VERSION = tuple(map(int_or_str, __schema_version__.split(".")))
 
-__compatible_schema_versions__ = [__schema_version__]
+# versions 1.2.0 through 1.5.0 only add keys to version 1.1.0
+__compatible_schema_versions__ = [
+    "1.1.0",
+    "1.2.0",
+    "1.3.0",
+    "1.4.0",
+    __schema_version__,
+]
@@ -1,3 +1,7 @@
+# Python
+import sys
+from array import array
+
 # dependencies
 import redis
 from redis.commands.search import Search
@@ -9,10 +13,27 @@ import redis_loader
 
 VERSION_KEY = "GCV_SCHEMA_VERSION"
 COMPATIBLE_KEY = "GCV_COMPATIBLE_SCHEMA_VERSIONS"
+# incremented whenever data is loaded so services can invalidate their caches
+LOAD_EPOCH_KEY = "GCV_LOAD_EPOCH"
 
 GENE_INDEX_NAME = "geneIdx"
 CHROMOSOME_INDEX_NAME = "chromosomeIdx"
 
+# a hash that maps gene family names to dense integer IDs and a list that maps the
+# IDs back to the names
+FAMILY_IDS_KEY = "family:ids"
+FAMILY_NAMES_KEY = "family:names"
+# the ID of genes that don't belong to a family
+ORPHAN_FAMILY_ID = -1
+# a hash that maps chromosome names to dense integer IDs and a list that maps the
+# IDs back to the names; the keys don't use the "chromosome:" prefix so they aren't
+# confused with chromosome keys
+CHROMOSOME_IDS_KEY = "chromosomes:ids"
+CHROMOSOME_NAMES_KEY = "chromosomes:names"
+# packed arrays of every chromosome's length and number of genes, indexed by ID
+CHROMOSOME_LENGTHS_KEY = "chromosomes:lengths"
+CHROMOSOME_GENE_COUNTS_KEY = "chromosomes:genecounts"
+
 
 class SchemaVersionError(Exception):
     """
@@ -67,6 +88,12 @@ class RediSearchLoader(object):
         self.chromosome_indexer, self.gene_indexer = self.__setupIndexes(
             kwargs.get("chunk_size")
         )
+        # setup the gene family dictionary
+        self.__checkKeys("family")
+        self.family_ids = self.__loadFamilyIds()
+        # setup the chromosome dictionary
+        self.__checkKeys("chromosomes")
+        self.chromosome_ids = self.__loadChromosomeIds()
 
     def __enter__(self):
         """
@@ -169,18 +196,26 @@ class RediSearchLoader(object):
 
         return indexer
 
-    def __checkChromosomeKeys(self):
-        keys = self.redis_connection.keys("chromosome:*")
+    def __checkKeys(self, prefix):
+        """
+        Checks if any non-RediSearch keys with the given prefix exist and drops
+        them, if necessary.
+
+        Parameters:
+          prefix (str): The prefix of the keys to check, e.g. "chromosome".
+        """
+
+        keys = self.redis_connection.keys(f"{prefix}:*")
         if keys:
-            print('\tKeys that match "chromosome:*" already exists')
+            print(f'\tKeys that match "{prefix}:*" already exists')
             if self.load_type == "new":
                 message = f"""
-                    Chromosome keys already exists but load type {self.load_type}" does
-                    not support preexisting keys.
+                    {prefix.capitalize()} keys already exists but load type
+                    "{self.load_type}" does not support preexisting keys.
                  """
                 raise RediSearchExistsError(message)
             if self.load_type == "reload":
-                print('\tDropping keys that match "chromosome:*"')
+                print(f'\tDropping keys that match "{prefix}:*"')
                 # NOTE: we create a pipeline and iterate instead of expanding keys into
                 # a single delete call in case there's A LOT of keys to avoid overflow
                 pipeline = self.redis_connection.pipeline()
@@ -188,7 +223,71 @@ class RediSearchLoader(object):
                     pipeline.delete(key)
                 pipeline.execute()
             elif self.load_type == "append":
-                print('\tNew "chromosome:*" keys will be appended')
+                print(f'\tNew "{prefix}:*" keys will be appended')
+
+    def __loadFamilyIds(self):
+        """
+        Loads the existing gene family IDs so new families can be assigned IDs that
+        don't collide with them.
+
+        Returns:
+          dict[str, int]: A dictionary mapping gene family names to their IDs.
+        """
+
+        family_ids = self.redis_connection.hgetall(FAMILY_IDS_KEY)
+        return {family: int(family_id) for family, family_id in family_ids.items()}
+
+    def __loadChromosomeIds(self):
+        """
+        Loads the existing chromosome IDs so new chromosomes can be assigned IDs that
+        don't collide with them.
+
+        Returns:
+          dict[str, int]: A dictionary mapping chromosome names to their IDs.
+        """
+
+        chromosome_ids = self.redis_connection.hgetall(CHROMOSOME_IDS_KEY)
+        return {
+            chromosome: int(chromosome_id)
+            for chromosome, chromosome_id in chromosome_ids.items()
+        }
+
+    def __getChromosomeId(self, chromosome, pipeline):
+        """
+        Gets the ID of a chromosome, assigning it an ID if it hasn't been seen before.
+
+        Parameters:
+          chromosome (str): The name of the chromosome.
+          pipeline (redis.client.Pipeline): The pipeline to queue the new ID's keys
+            in.
+
+        Returns:
+          int: The ID of the chromosome.
+        """
+
+        if chromosome not in self.chromosome_ids:
+            chromosome_id = len(self.chromosome_ids)
+            self.chromosome_ids[chromosome] = chromosome_id
+            pipeline.hset(CHROMOSOME_IDS_KEY, chromosome, chromosome_id)
+            pipeline.rpush(CHROMOSOME_NAMES_KEY, chromosome)
+        return self.chromosome_ids[chromosome]
+
+    def __setPackedInt(self, key, index, typecode, value, pipeline):
+        """
+        Sets an entry of a packed array of little-endian integers.
+
+        Parameters:
+          key (str): The key of the packed array.
+          index (int): The index of the entry.
+          typecode (str): The array typecode of the integers.
+          value (int): The value of the entry.
+          pipeline (redis.client.Pipeline): The pipeline to queue the command in.
+        """
+
+        packed = array(typecode, [value])
+        if sys.byteorder == "big":
+            packed.byteswap()
+        pipeline.setrange(key, index * packed.itemsize, packed.tobytes())
 
     def __setupIndexes(self, chunk_size):
         """
@@ -223,7 +322,7 @@ class RediSearchLoader(object):
             chunk_size,
         )
         # check if any non-RediSearch chromosome keys exist, and drop if necessary
-        self.__checkChromosomeKeys()
+        self.__checkKeys("chromosome")
 
         # create the gene index
         gene_fields = [
@@ -254,6 +353,9 @@ class RediSearchLoader(object):
             COMPATIBLE_KEY, *redis_loader.__compatible_schema_versions__
         )
 
+        # signal that the data is changing
+        self.bumpLoadEpoch()
+
         return chromosome_indexer, gene_indexer
 
     def save(self):
@@ -261,10 +363,18 @@ class RediSearchLoader(object):
         if not self.no_save:
             self.redis_connection.save()
 
+    def bumpLoadEpoch(self):
+        """
+        Increments the load epoch, which signals to services that the data has
+        changed and that any data they've cached should be invalidated.
+        """
+        self.redis_connection.incr(LOAD_EPOCH_KEY)
+
     def close(self):
         """Closes the Redis connection."""
         self.chromosome_indexer.commit()
         self.gene_indexer.commit()
+        self.bumpLoadEpoch()
         self.save()
         self.redis_connection.close()
 
@@ -287,6 +397,15 @@ class RediSearchLoader(object):
             species=species,
         )
 
+        # save the chromosome's length by ID so services can filter chromosomes
+        # without loading their documents
+        pipeline = self.redis_connection.pipeline()
+        chromosome_id = self.__getChromosomeId(name, pipeline)
+        self.__setPackedInt(
+            CHROMOSOME_LENGTHS_KEY, chromosome_id, "q", length, pipeline
+        )
+        pipeline.execute()
+
     def indexChromosomeGenes(self, chromosome, genes):
         """
         Index the genes for a given chromosome.
@@ -323,9 +442,48 @@ class RediSearchLoader(object):
             )
         self.gene_indexer.commit()
 
+        # assign IDs to families that haven't been seen before
+        pipeline = self.redis_connection.pipeline()
+        family_ids = array("i")
+        for gene in genes:
+            family = gene["family"]
+            if family == "":
+                family_ids.append(ORPHAN_FAMILY_ID)
+                continue
+            if family not in self.family_ids:
+                family_id = len(self.family_ids)
+                self.family_ids[family] = family_id
+                pipeline.hset(FAMILY_IDS_KEY, family, family_id)
+                pipeline.rpush(FAMILY_NAMES_KEY, family)
+            family_ids.append(self.family_ids[family])
+        # get the chromosome's ID and save its number of genes
+        chromosome_id = self.__getChromosomeId(chromosome, pipeline)
+        self.__setPackedInt(
+            CHROMOSOME_GENE_COUNTS_KEY, chromosome_id, "i", len(genes), pipeline
+        )
+        # collect the (chromosome ID, gene index) pair of each gene by family
+        family_occurrences = {}
+        for i, gene in enumerate(genes):
+            family = gene["family"]
+            if family == "":
+                continue
+            if family not in family_occurrences:
+                family_occurrences[family] = array("i")
+            family_occurrences[family].extend((chromosome_id, i))
+        # pack the gene locations and strands as 64-bit and 8-bit integers,
+        # respectively
+        fmins = array("q", map(lambda g: g["fmin"], genes))
+        fmaxs = array("q", map(lambda g: g["fmax"], genes))
+        strands = array("b", map(lambda g: g["strand"] or 0, genes))
+        # store the packed integers as little-endian
+        if sys.byteorder == "big":
+            for packed in (family_ids, fmins, fmaxs, strands):
+                packed.byteswap()
+            for occurrences in family_occurrences.values():
+                occurrences.byteswap()
+
         # save the gene attributes as ordered lists in Redis for indexed retrieval
         # and slicing
-        pipeline = self.redis_connection.pipeline()
         pipeline.rpush(
             f"chromosome:{chromosome}:genes", *map(lambda g: g["name"], genes)
         )
@@ -338,6 +496,17 @@ class RediSearchLoader(object):
         pipeline.rpush(
             f"chromosome:{chromosome}:fmaxs", *map(lambda g: g["fmax"], genes)
         )
+        # save the family IDs as a packed binary string for compact retrieval
+        pipeline.set(f"chromosome:{chromosome}:familyids", family_ids.tobytes())
+        # save the gene locations and strands as packed binary strings so single
+        # entries and slices can be retrieved with GETRANGE
+        pipeline.set(f"chromosome:{chromosome}:packedfmins", fmins.tobytes())
+        pipeline.set(f"chromosome:{chromosome}:packedfmaxs", fmaxs.tobytes())
+        pipeline.set(f"chromosome:{chromosome}:packedstrands", strands.tobytes())
+        # append the chromosome's genes to each family's inverted index of packed
+        # (chromosome ID, gene index) pairs
+        for family, occurrences in family_occurrences.items():
+            pipeline.append(f"family:{family}:occurrences", occurrences.tobytes())
         pipeline.execute()
 
     def getExistingSchemaVersion(self):
@@ -0,0 +1,55 @@
+# Loads test data into Redis with the keys the Redis loader creates, for the tests of
+# the microservices that read them.
+
+# Python
+from array import array
+
+
+# loads chromosomes, given as a dictionary mapping names to their genes' families,
+# into the database with the keys the Redis loader creates that the microservices
+# read; every gene is 100 bases long and starts 1000 bases after the previous one
+async def loadChromosomes(connection, chromosomes):
+    family_ids = {}
+    family_occurrences = {}
+    lengths = array("q")
+    gene_counts = array("i")
+    for chromosome_id, (name, families) in enumerate(chromosomes.items()):
+        ids = array("i")
+        for i, family in enumerate(families):
+            if family == "":
+                ids.append(-1)
+                continue
+            if family not in family_ids:
+                family_ids[family] = len(family_ids)
+                await connection.hset("family:ids", family, family_ids[family])
+                await connection.rpush("family:names", family)
+            ids.append(family_ids[family])
+            family_occurrences.setdefault(family, array("i"))
+            family_occurrences[family].extend((chromosome_id, i))
+        length = len(families) * 1000
+        lengths.append(length)
+        gene_counts.append(len(families))
+        await connection.hset("chromosomes:ids", name, chromosome_id)
+        await connection.rpush("chromosomes:names", name)
+        await connection.hset(
+            f"chromosome:{name}",
+            mapping={
+                "name": name,
+                "length": length,
+                "genus": "Genus",
+                "species": name.lower(),
+            },
+        )
+        await connection.rpush(
+            f"chromosome:{name}:genes", *[f"{name}.{i}" for i in range(len(families))]
+        )
+        await connection.set(f"chromosome:{name}:familyids", ids.tobytes())
+        fmins = array("q", range(0, length, 1000))
+        fmaxs = array("q", range(100, length, 1000))
+        await connection.set(f"chromosome:{name}:packedfmins", fmins.tobytes())
+        await connection.set(f"chromosome:{name}:packedfmaxs", fmaxs.tobytes())
+    for family, occurrences in family_occurrences.items():
+        await connection.set(f"family:{family}:occurrences", occurrences.tobytes())
+    await connection.set("chromosomes:lengths", lengths.tobytes())
+    await connection.set("chromosomes:genecounts", gene_counts.tobytes())
+    await connection.set("GCV_LOAD_EPOCH", "1")
@@ -0,0 +1,57 @@
+# Checks the pairwise macro-synteny blocks microservice's request handler, e.g.
+#
+#     $ python -m pytest tests/test_pairwise.py
+#
+# The microservice (with its protos built) and fakeredis must be installed.
+
+# Python
+import asyncio
+
+# dependencies
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("pairwise_macro_synteny_blocks.request_handler")
+
+# module
+# isort: off
+from gcv_database import loadChromosomes  # noqa: E402
+from pairwise_macro_synteny_blocks.request_handler import (  # noqa: E402
+    QueryNotFoundError,
+    RequestHandler,
+)
+
+# isort: on
+
+
+# computes the blocks of a query chromosome in the database with processMany, given
+# the chromosomes to load as a dictionary mapping names to their genes' families
+async def processMany(chromosomes, name, targets, matched, intermediate):
+    connection = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    await loadChromosomes(connection, chromosomes)
+    handler = RequestHandler(connection)
+    try:
+        arguments = handler.parseManyArguments(
+            None, targets, matched, intermediate, None, [], None, 1, name
+        )
+        return await handler.processMany(*arguments)
+    finally:
+        await connection.aclose()
+
+
+# a query that isn't in the database isn't found even when none of the targets are
+# eligible to have blocks, like when some are
+@pytest.mark.parametrize("targets", [["T"], ["missing"], []])
+def test_process_many_query_not_found(targets):
+    chromosomes = {"Q": ["a", "b", "c"], "T": ["a", "b"]}
+    with pytest.raises(QueryNotFoundError):
+        asyncio.run(processMany(chromosomes, "missing", targets, 3, 5))
+
+
+def test_process_many_no_eligible_targets():
+    chromosomes = {"Q": ["a", "b", "c"], "T": ["a", "b"]}
+    target_blocks, dropped_families = asyncio.run(
+        processMany(chromosomes, "Q", ["T", "missing"], 3, 5)
+    )
+    assert target_blocks == [[], None]
+    assert dropped_families == []
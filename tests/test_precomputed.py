@@ -0,0 +1,113 @@
+# Checks that the macro-synteny blocks microservice answers queries with the blocks
+# precomputed by the pairwise macro-synteny blocks microservice's precompute command
+# exactly as it would answer them by computing the blocks, e.g.
+#
+#     $ python -m pytest tests/test_precomputed.py
+#
+# Both microservices (with their protos built) and fakeredis must be installed.
+
+# Python
+import argparse
+import asyncio
+import random
+
+# dependencies
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("pairwise_macro_synteny_blocks.precompute")
+pytest.importorskip("macro_synteny_blocks.request_handler")
+
+# module
+# isort: off
+from gcv_database import loadChromosomes  # noqa: E402
+from macro_synteny_blocks.database import ChromosomeReference  # noqa: E402
+from macro_synteny_blocks.request_handler import (  # noqa: E402
+    RequestHandler as MacroRequestHandler,
+)
+from pairwise_macro_synteny_blocks.precompute import precompute  # noqa: E402
+from pairwise_macro_synteny_blocks.request_handler import (  # noqa: E402
+    RequestHandler as PairwiseRequestHandler,
+)
+
+# isort: on
+
+
+# gets the blocks objects of every target a query has blocks with, computed by the
+# macro-synteny blocks microservice and from the precomputed blocks, in a comparable
+# order
+async def computeBlocks(chromosomes, queries, matched, intermediate, targets):
+    connection = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    await loadChromosomes(connection, chromosomes)
+    pairwise_handler = PairwiseRequestHandler(connection)
+    args = argparse.Namespace(
+        matched=matched,
+        intermediate=intermediate,
+        mask=None,
+        optional_metrics=[],
+        chromosome_genes=None,
+        chromosome_length=1,
+        genome_pairs=None,
+        pair_budget=0,
+        pair_budget_strategy="mask",
+    )
+    await precompute(connection, pairwise_handler, args)
+
+    results = []
+    for use_precomputed in (False, True):
+        handler = MacroRequestHandler(
+            connection,
+            None,
+            pairwise_handler=pairwise_handler,
+            use_precomputed=use_precomputed,
+        )
+        result = {}
+        for query in queries:
+            blocks_objects = await handler.process(
+                ChromosomeReference(query, None, None),
+                matched,
+                intermediate,
+                None,
+                targets,
+                [],
+                matched,
+                1,
+                grpc_decode=True,
+            )
+            result[query] = sorted(
+                blocks_objects, key=lambda blocks_object: blocks_object["chromosome"]
+            )
+        results.append(result)
+        if use_precomputed:
+            assert handler.stats()["precomputed"]["misses"] == 0
+    await connection.aclose()
+    return results
+
+
+def test_target_filter():
+    # the target's matches are too far apart for the macro-synteny blocks
+    # microservice's target filter, though the pairwise chaining would join them
+    target = [""] * 11
+    target[0], target[5], target[10] = "a", "b", "c"
+    chromosomes = {"Q": ["a", "b", "c"] + [""] * 8, "T": target}
+    live, precomputed = asyncio.run(computeBlocks(chromosomes, ["Q"], 3, 5, []))
+    assert [b["chromosome"] for b in live["Q"]] == ["Q"]
+    assert precomputed == live
+
+
+@pytest.mark.parametrize("targets", [[], ["C1", "C3", "missing"]])
+def test_precomputed_blocks(targets):
+    rng = random.Random(0)
+    families = [f"family{i}" for i in range(40)] + [""]
+    ancestor = [rng.choice(families) for _ in range(300)]
+    chromosomes = {}
+    for i in range(6):
+        genes = list(ancestor)
+        start, stop = sorted(rng.sample(range(len(genes)), 2))
+        genes[start:stop] = reversed(genes[start:stop])
+        for _ in range(60 * i):
+            genes[rng.randrange(len(genes))] = rng.choice(families)
+        chromosomes[f"C{i}"] = genes[: len(genes) - rng.randrange(100)]
+    queries = list(chromosomes)
+    live, precomputed = asyncio.run(computeBlocks(chromosomes, queries, 4, 3, targets))
+    assert precomputed == live